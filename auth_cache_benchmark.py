@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк кэша аутентификации Smart Call Center
+
+Поднимает backend (server:app) в текущем процессе и измеряет пропускную
+способность авторизованных запросов с кэшем пользователей (principal cache)
+и без него:
+- GET /api/auth/me  - get_current_active_user
+- GET /ws/stats     - RBAC проверка require_admin, ответ из памяти
+
+Считается также количество запросов get_user_by_username в MongoDB.
+Требуется доступный MongoDB (MONGO_URL) и зависимости backend/requirements.txt.
+
+Пример:
+    python auth_cache_benchmark.py --requests 20000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+ENDPOINTS = ["/api/auth/me", "/ws/stats"]
+BENCH_USERNAME = "bench_auth_admin"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Principal cache throughput benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--requests", type=int, default=10000, help="Запросов на каждый прогон")
+    parser.add_argument("--concurrency", type=int, default=50, help="Параллельных клиентов")
+    return parser.parse_args()
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+async def prepare_token() -> str:
+    """Создание бенчмарк-администратора и выпуск JWT"""
+    from auth import create_access_token, get_password_hash
+    from db import get_db
+    from models import User
+
+    db = get_db()
+    if not await db.get_user_by_username(BENCH_USERNAME):
+        user = User(
+            username=BENCH_USERNAME,
+            email=f"{BENCH_USERNAME}@bench.example.com",
+            name="Benchmark admin",
+            password_hash=get_password_hash("bench-password"),
+            role="admin"
+        )
+        await db.users.insert_one(user.dict())
+    return create_access_token(data={"sub": BENCH_USERNAME})
+
+async def run_case(args, session, url: str, token: str) -> dict:
+    """Прогон запросов к одному endpoint'у"""
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    errors = 0
+    remaining = args.requests
+
+    async def client():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            async with session.get(url, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed if elapsed else 0,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "errors": errors
+    }
+
+async def run_benchmark(args):
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+
+    import aiohttp
+    import uvicorn
+    from db import get_db
+    from principal_cache import get_principal_cache
+    from server import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host=args.host, port=args.port, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.1)
+
+    token = await prepare_token()
+
+    # Подсчет обращений к MongoDB за пользователем
+    db = get_db()
+    original_lookup = db.get_user_by_username
+    lookups = 0
+
+    async def counting_lookup(username):
+        nonlocal lookups
+        lookups += 1
+        return await original_lookup(username)
+
+    db.get_user_by_username = counting_lookup
+
+    cache = get_principal_cache()
+    configured_size = cache.max_size
+
+    print(f"🔐 Principal cache benchmark: {args.requests} запросов, concurrency={args.concurrency}")
+    print(f"{'Endpoint':<16}{'Кэш':<8}{'RPS':>10}{'p50 мс':>10}{'p99 мс':>10}{'Mongo':>9}{'Ошибки':>8}")
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for endpoint in ENDPOINTS:
+            url = f"http://{args.host}:{args.port}{endpoint}"
+            baseline_rps = None
+            for label, max_size in (("off", 0), ("on", configured_size or 10000)):
+                cache.clear()
+                cache.max_size = max_size
+                lookups = 0
+
+                result = await run_case(args, session, url, token)
+                baseline_rps = baseline_rps or result["rps"]
+                print(f"{endpoint:<16}{label:<8}{result['rps']:>10.0f}"
+                      f"{result['p50'] * 1000:>10.2f}{result['p99'] * 1000:>10.2f}"
+                      f"{lookups:>9}{result['errors']:>8}")
+
+            print(f"{'':<16}ускорение x{result['rps'] / baseline_rps:.2f}" if baseline_rps else "")
+
+    cache.max_size = configured_size
+    db.get_user_by_username = original_lookup
+    print(f"\n📊 {cache.get_stats()}")
+
+    server.should_exit = True
+    await serve_task
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark(parse_args()))
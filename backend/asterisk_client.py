@@ -348,6 +348,49 @@ class AsteriskARIClient:
             logger.error(f"Error answering channel: {e}")
             return False
     
+    async def continue_in_dialplan(self, channel_id: str, context: str, extension: str = "s",
+                                   priority: int = 1) -> bool:
+        """Выход канала из Stasis в указанное место dialplan (только для каналов в Stasis)"""
+        if not self.session:
+            return False
+        
+        try:
+            params = {"context": context, "extension": extension, "priority": priority}
+            async with self.session.post(f"{self.base_url}/channels/{channel_id}/continue", params=params) as resp:
+                return resp.status == 204
+                
+        except Exception as e:
+            logger.error(f"Error continuing channel in dialplan: {e}")
+            return False
+    
+    async def set_channel_variable(self, channel_id: str, variable: str, value: Any) -> bool:
+        """Установка переменной канала (читается dialplan после выхода из Stasis)"""
+        if not self.session:
+            return False
+        
+        try:
+            params = {"variable": variable, "value": str(value)}
+            async with self.session.post(f"{self.base_url}/channels/{channel_id}/variable", params=params) as resp:
+                return resp.status == 204
+                
+        except Exception as e:
+            logger.error(f"Error setting channel variable {variable}: {e}")
+            return False
+    
+    async def send_channel_to_queue(self, channel_id: str, queue_name: str, context: str,
+                                    timeout: Optional[int] = None) -> bool:
+        """Выход канала из Stasis в Queue() указанного контекста с лимитом ожидания.
+        
+        Пока канал в Stasis, ему передаются QUEUE_NAME и QUEUE_TIMEOUT: после
+        continue звонком управляет dialplan, и таймаут ожидания соблюдает
+        сам Queue().
+        """
+        if not await self.set_channel_variable(channel_id, "QUEUE_NAME", queue_name):
+            return False
+        if timeout and not await self.set_channel_variable(channel_id, "QUEUE_TIMEOUT", int(timeout)):
+            return False
+        return await self.continue_in_dialplan(channel_id, context)
+    
     async def get_channel_info(self, channel_id: str) -> Optional[Dict[str, Any]]:
         """Получение информации о канале"""
         if not self.session:
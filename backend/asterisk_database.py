@@ -4,26 +4,23 @@ Smart Call Center - Asterisk Database Integration
 
 Модуль для работы с базой данных Asterisk (asteriskcdrdb)
 Поддерживает MySQL и PostgreSQL
+
+Тексты запросов и различия СУБД - в asterisk_sql: менеджер вызывает
+именованные запросы через SqlExecutor и не ветвится по db_type.
 """
 
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
 from datetime import datetime, timedelta
-import asyncio
 from dataclasses import dataclass
 
-# Поддержка различных СУБД
-try:
-    import aiomysql
-    MYSQL_AVAILABLE = True
-except ImportError:
-    MYSQL_AVAILABLE = False
-
-try:
-    import asyncpg
-    POSTGRES_AVAILABLE = True
-except ImportError:
-    POSTGRES_AVAILABLE = False
+from asterisk_sql import (
+    CDR_COLUMNS, QUEUE_LOG_COLUMNS, CEL_COLUMNS,
+    CDR_ANALYTICS_SERIES, CDR_ANALYTICS_TOP_SERIES, CDR_ANALYTICS_METRICS,
+    MYSQL_AVAILABLE, POSTGRES_AVAILABLE,
+    SqlExecutor, get_dialect
+)
+from report_cache import get_report_cache
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +36,12 @@ class AsteriskDatabaseConfig:
     enabled: bool = False
     ssl_mode: str = "disabled"
     charset: str = "utf8mb4"
+    # Пул соединений
+    connection_timeout: int = 30
+    pool_min_size: int = 1
+    pool_size: int = 10
+    # Кэш подготовленных выражений на соединение (asyncpg)
+    statement_cache_size: int = 100
 
 class AsteriskDatabaseManager:
     """Менеджер для работы с БД Asterisk"""
@@ -46,6 +49,7 @@ class AsteriskDatabaseManager:
     def __init__(self, config: AsteriskDatabaseConfig):
         self.config = config
         self.connection_pool = None
+        self.sql: Optional[SqlExecutor] = None
         self.connected = False
         
     async def connect(self) -> bool:
@@ -53,79 +57,29 @@ class AsteriskDatabaseManager:
         if not self.config.enabled:
             logger.warning("Asterisk database is disabled in config")
             return False
-            
-        try:
-            if self.config.db_type.lower() == "mysql":
-                return await self._connect_mysql()
-            elif self.config.db_type.lower() == "postgresql":
-                return await self._connect_postgresql()
-            else:
-                logger.error(f"Unsupported database type: {self.config.db_type}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Failed to connect to Asterisk database: {e}")
-            return False
-    
-    async def _connect_mysql(self) -> bool:
-        """Подключение к MySQL"""
-        if not MYSQL_AVAILABLE:
-            logger.error("aiomysql not installed. Install with: pip install aiomysql")
+
+        dialect = get_dialect(self.config.db_type)
+        if dialect is None:
+            logger.error(f"Unsupported database type: {self.config.db_type}")
             return False
             
         try:
-            self.connection_pool = await aiomysql.create_pool(
-                host=self.config.host,
-                port=self.config.port,
-                user=self.config.username,
-                password=self.config.password,
-                db=self.config.database,
-                charset=self.config.charset,
-                autocommit=True,
-                maxsize=10,
-                minsize=1
-            )
-            
+            # Повторное подключение (тест из настроек) не должно оставлять старый пул
+            await self.close()
+
+            self.connection_pool = await dialect.create_pool(self.config)
+            self.sql = SqlExecutor(dialect, self.connection_pool, self.config.pool_min_size, self.config.pool_size)
+
             # Тестовый запрос
-            async with self.connection_pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    await cursor.execute("SELECT 1")
-                    result = await cursor.fetchone()
-                    
+            await self.sql.fetchval("ping")
+
             self.connected = True
-            logger.info("✅ Connected to Asterisk MySQL database")
+            logger.info(f"✅ Connected to Asterisk {dialect.name} database "
+                        f"(pool {self.config.pool_min_size}-{self.config.pool_size})")
             return True
-            
-        except Exception as e:
-            logger.error(f"MySQL connection failed: {e}")
-            return False
-    
-    async def _connect_postgresql(self) -> bool:
-        """Подключение к PostgreSQL"""
-        if not POSTGRES_AVAILABLE:
-            logger.error("asyncpg not installed. Install with: pip install asyncpg")
-            return False
-            
-        try:
-            # Создаем DSN для PostgreSQL
-            dsn = f"postgresql://{self.config.username}:{self.config.password}@{self.config.host}:{self.config.port}/{self.config.database}"
-            
-            self.connection_pool = await asyncpg.create_pool(
-                dsn=dsn,
-                min_size=1,
-                max_size=10
-            )
-            
-            # Тестовый запрос
-            async with self.connection_pool.acquire() as conn:
-                result = await conn.fetchval("SELECT 1")
                 
-            self.connected = True
-            logger.info("✅ Connected to Asterisk PostgreSQL database")
-            return True
-            
         except Exception as e:
-            logger.error(f"PostgreSQL connection failed: {e}")
+            logger.error(f"Failed to connect to Asterisk database: {e}")
             return False
     
     async def test_connection(self) -> Dict[str, Any]:
@@ -150,7 +104,7 @@ class AsteriskDatabaseManager:
                     "port": self.config.port,
                     "database": self.config.database,
                     "tables": tables_info,
-                    "connection_pool_size": getattr(self.connection_pool, 'size', 'N/A')
+                    "pool": self.sql.get_stats()["pool"]
                 }
             else:
                 return {
@@ -167,66 +121,23 @@ class AsteriskDatabaseManager:
     async def _get_database_info(self) -> Dict[str, Any]:
         """Получение информации о таблицах БД"""
         try:
-            if self.config.db_type.lower() == "mysql":
-                return await self._get_mysql_tables_info()
-            else:
-                return await self._get_postgresql_tables_info()
-                
-        except Exception as e:
-            logger.error(f"Error getting database info: {e}")
-            return {}
-    
-    async def _get_mysql_tables_info(self) -> Dict[str, Any]:
-        """Информация о таблицах MySQL"""
-        async with self.connection_pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                # Проверяем основные таблицы Asterisk
-                await cursor.execute("""
-                    SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH 
-                    FROM information_schema.TABLES 
-                    WHERE TABLE_SCHEMA = %s 
-                    AND TABLE_NAME IN ('cdr', 'cel', 'queue_log', 'extensions')
-                """, (self.config.database,))
-                
-                tables = await cursor.fetchall()
-                
-                return {
-                    "total_tables": len(tables),
-                    "tables": [
-                        {
-                            "name": table[0],
-                            "rows": table[1] or 0,
-                            "size_bytes": table[2] or 0
-                        }
-                        for table in tables
-                    ]
-                }
-    
-    async def _get_postgresql_tables_info(self) -> Dict[str, Any]:
-        """Информация о таблицах PostgreSQL"""
-        async with self.connection_pool.acquire() as conn:
-            # Запрос для PostgreSQL
-            query = """
-                SELECT tablename, 
-                       pg_total_relation_size(schemaname||'.'||tablename) as size_bytes
-                FROM pg_tables 
-                WHERE schemaname = 'public' 
-                AND tablename IN ('cdr', 'cel', 'queue_log', 'extensions')
-            """
-            
-            tables = await conn.fetch(query)
-            
+            tables = await self.sql.fetch_dicts("tables_info", database=self.config.database)
+
             return {
                 "total_tables": len(tables),
                 "tables": [
                     {
-                        "name": table["tablename"],
-                        "rows": 0,  # Для PostgreSQL подсчет строк более сложный
+                        "name": table["name"],
+                        "rows": table["row_count"] or 0,
                         "size_bytes": table["size_bytes"] or 0
                     }
                     for table in tables
                 ]
             }
+                
+        except Exception as e:
+            logger.error(f"Error getting database info: {e}")
+            return {}
     
     async def get_cdr_data(self, 
                           start_date: datetime = None, 
@@ -244,54 +155,109 @@ class AsteriskDatabaseManager:
             if not end_date:
                 end_date = datetime.utcnow()
             
-            if self.config.db_type.lower() == "mysql":
-                return await self._get_mysql_cdr_data(start_date, end_date, limit)
-            else:
-                return await self._get_postgresql_cdr_data(start_date, end_date, limit)
+            return await self.sql.fetch_dicts("cdr_range", start=start_date, end=end_date, limit=limit)
                 
         except Exception as e:
             logger.error(f"Error getting CDR data: {e}")
             return []
     
-    async def _get_mysql_cdr_data(self, start_date: datetime, end_date: datetime, limit: int) -> List[Dict[str, Any]]:
-        """Получение CDR данных из MySQL"""
-        async with self.connection_pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                query = """
-                    SELECT calldate, src, dst, dcontext, channel, dstchannel,
-                           lastapp, lastdata, duration, billsec, disposition,
-                           amaflags, accountcode, uniqueid, userfield
-                    FROM cdr 
-                    WHERE calldate BETWEEN %s AND %s 
-                    ORDER BY calldate DESC 
-                    LIMIT %s
-                """
-                
-                await cursor.execute(query, (start_date, end_date, limit))
-                rows = await cursor.fetchall()
-                
-                # Получаем названия колонок
-                columns = [desc[0] for desc in cursor.description]
-                
-                return [dict(zip(columns, row)) for row in rows]
-    
-    async def _get_postgresql_cdr_data(self, start_date: datetime, end_date: datetime, limit: int) -> List[Dict[str, Any]]:
-        """Получение CDR данных из PostgreSQL"""
-        async with self.connection_pool.acquire() as conn:
-            query = """
-                SELECT calldate, src, dst, dcontext, channel, dstchannel,
-                       lastapp, lastdata, duration, billsec, disposition,
-                       amaflags, accountcode, uniqueid, userfield
-                FROM cdr 
-                WHERE calldate BETWEEN $1 AND $2 
-                ORDER BY calldate DESC 
-                LIMIT $3
-            """
-            
-            rows = await conn.fetch(query, start_date, end_date, limit)
-            
-            return [dict(row) for row in rows]
-    
+    async def stream_cdr_data(self,
+                              start_date: datetime,
+                              end_date: datetime,
+                              after: Optional[Tuple[datetime, str]] = None,
+                              fetch_size: int = 1000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Потоковое чтение CDR за период порциями fetch_size (по возрастанию calldate, uniqueid)
+
+        Строки читаются серверным курсором, поэтому в памяти держится только
+        одна порция. after - отметка (calldate, uniqueid) последней полученной
+        строки для продолжения прерванной выгрузки.
+        """
+        if not self.connected:
+            logger.warning("Not connected to Asterisk database")
+            return
+
+        after_calldate, after_uniqueid = after or (start_date, "")
+        async for columns, rows in self.sql.stream("cdr_stream", fetch_size,
+                                                   start=start_date, end=end_date,
+                                                   after_calldate=after_calldate, after_uniqueid=after_uniqueid):
+            yield [dict(zip(columns, row)) for row in rows]
+
+    async def stream_queue_log(self,
+                               start_date: datetime,
+                               end_date: datetime,
+                               events: Tuple[str, ...],
+                               fetch_size: int = 50000) -> AsyncIterator[List[tuple]]:
+        """Потоковое чтение queue_log за период [start_date, end_date) порциями
+
+        Строки возвращаются кортежами в порядке QUEUE_LOG_COLUMNS - без
+        словарей, для векторной обработки больших порций.
+        """
+        if not self.connected:
+            logger.warning("Not connected to Asterisk database")
+            return
+
+        async for _, rows in self.sql.stream("queue_log_stream", fetch_size,
+                                             start=start_date, end=end_date, events=",".join(events)):
+            yield rows
+
+    async def stream_cel(self,
+                         start_date: datetime,
+                         end_date: datetime,
+                         fetch_size: int = 5000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Потоковое чтение CEL звонков периода порциями, упорядоченно по (linkedid, eventtime, id)
+
+        Звонок с любым событием в периоде читается со всеми событиями, в том
+        числе вне периода. События одного звонка (linkedid) идут подряд,
+        поэтому дерево звонка собирается за один проход без повторных запросов.
+        """
+        if not self.connected:
+            logger.warning("Not connected to Asterisk database")
+            return
+
+        async for columns, rows in self.sql.stream("cel_stream", fetch_size, start=start_date, end=end_date):
+            yield [dict(zip(columns, row)) for row in rows]
+
+    async def get_cdr_batch_after(self,
+                                  after_calldate: Optional[datetime],
+                                  after_uniqueid: str = "",
+                                  limit: int = 1000) -> List[Dict[str, Any]]:
+        """Следующая порция CDR после отметки (calldate, uniqueid) - keyset-пагинация"""
+        if not self.connected:
+            return []
+
+        if after_calldate is None:
+            after_calldate = datetime(1970, 1, 1)
+
+        return await self.sql.fetch_dicts("cdr_batch_after", after_calldate=after_calldate,
+                                          after_uniqueid=after_uniqueid, limit=limit)
+
+    async def get_cdr_chunk_digests(self, start_date: datetime, end_date: datetime,
+                                    chunk_seconds: int) -> Dict[int, Tuple[int, int]]:
+        """Хэши CDR по интервалам: номер интервала -> (строк, XOR хэшей uniqueid|disposition|billsec)
+
+        Хэш строки - CRC32 в MySQL и первые 32 бита MD5 в PostgreSQL
+        (см. reconciliation.record_digest). XOR не зависит от порядка строк.
+        """
+        if not self.connected:
+            return {}
+
+        _, rows = await self.sql.fetch("cdr_chunk_digests", start=start_date, end=end_date, chunk_seconds=chunk_seconds)
+        return {int(chunk): (int(count), int(digest or 0)) for chunk, count, digest in rows}
+
+    async def get_cdr_reconcile_rows(self, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
+        """Строки CDR интервала для сверки (uniqueid, disposition, billsec, calldate)"""
+        if not self.connected:
+            return []
+
+        return await self.sql.fetch_dicts("cdr_reconcile_rows", start=start_date, end=end_date)
+
+    async def get_cdr_max_calldate(self) -> Optional[datetime]:
+        """Время последней записи CDR (для оценки отставания синхронизации)"""
+        if not self.connected:
+            return None
+
+        return await self.sql.fetchval("cdr_max_calldate")
+
     async def get_call_statistics(self, period_days: int = 7) -> Dict[str, Any]:
         """Получение статистики звонков из CDR"""
         if not self.connected:
@@ -299,92 +265,133 @@ class AsteriskDatabaseManager:
             
         try:
             start_date = datetime.utcnow() - timedelta(days=period_days)
-            
-            if self.config.db_type.lower() == "mysql":
-                return await self._get_mysql_call_statistics(start_date)
-            else:
-                return await self._get_postgresql_call_statistics(start_date)
-                
-        except Exception as e:
-            logger.error(f"Error getting call statistics: {e}")
-            return {}
-    
-    async def _get_mysql_call_statistics(self, start_date: datetime) -> Dict[str, Any]:
-        """Статистика звонков из MySQL CDR"""
-        async with self.connection_pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                # Общая статистика
-                await cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total_calls,
-                        SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered_calls,
-                        SUM(CASE WHEN disposition = 'NO ANSWER' THEN 1 ELSE 0 END) as missed_calls,
-                        SUM(CASE WHEN disposition = 'BUSY' THEN 1 ELSE 0 END) as busy_calls,
-                        AVG(CASE WHEN disposition = 'ANSWERED' THEN billsec ELSE NULL END) as avg_talk_time,
-                        AVG(CASE WHEN disposition = 'ANSWERED' THEN duration - billsec ELSE NULL END) as avg_wait_time
-                    FROM cdr 
-                    WHERE calldate >= %s
-                """, (start_date,))
-                
-                stats = await cursor.fetchone()
-                
-                if stats:
-                    return {
-                        "total_calls": stats[0] or 0,
-                        "answered_calls": stats[1] or 0,
-                        "missed_calls": stats[2] or 0,
-                        "busy_calls": stats[3] or 0,
-                        "avg_talk_time": float(stats[4]) if stats[4] else 0,
-                        "avg_wait_time": float(stats[5]) if stats[5] else 0,
-                        "answer_rate": round((stats[1] / stats[0] * 100) if stats[0] > 0 else 0, 2),
-                        "period_days": (datetime.utcnow() - start_date).days
-                    }
-                
-                return {}
-    
-    async def _get_postgresql_call_statistics(self, start_date: datetime) -> Dict[str, Any]:
-        """Статистика звонков из PostgreSQL CDR"""
-        async with self.connection_pool.acquire() as conn:
-            query = """
-                SELECT 
-                    COUNT(*) as total_calls,
-                    SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered_calls,
-                    SUM(CASE WHEN disposition = 'NO ANSWER' THEN 1 ELSE 0 END) as missed_calls,
-                    SUM(CASE WHEN disposition = 'BUSY' THEN 1 ELSE 0 END) as busy_calls,
-                    AVG(CASE WHEN disposition = 'ANSWERED' THEN billsec ELSE NULL END) as avg_talk_time,
-                    AVG(CASE WHEN disposition = 'ANSWERED' THEN duration - billsec ELSE NULL END) as avg_wait_time
-                FROM cdr 
-                WHERE calldate >= $1
-            """
-            
-            stats = await conn.fetchrow(query, start_date)
-            
-            if stats:
+            rows = await self.sql.fetch_dicts("call_statistics", start=start_date)
+
+            if rows:
+                stats = rows[0]
+                total_calls = stats["total_calls"] or 0
+                answered_calls = stats["answered_calls"] or 0
                 return {
-                    "total_calls": stats["total_calls"] or 0,
-                    "answered_calls": stats["answered_calls"] or 0,
+                    "total_calls": total_calls,
+                    "answered_calls": answered_calls,
                     "missed_calls": stats["missed_calls"] or 0,
                     "busy_calls": stats["busy_calls"] or 0,
                     "avg_talk_time": float(stats["avg_talk_time"]) if stats["avg_talk_time"] else 0,
                     "avg_wait_time": float(stats["avg_wait_time"]) if stats["avg_wait_time"] else 0,
-                    "answer_rate": round((stats["answered_calls"] / stats["total_calls"] * 100) if stats["total_calls"] > 0 else 0, 2),
+                    "answer_rate": round((answered_calls / total_calls * 100) if total_calls > 0 else 0, 2),
                     "period_days": (datetime.utcnow() - start_date).days
                 }
-            
+
+            return {}
+                
+        except Exception as e:
+            logger.error(f"Error getting call statistics: {e}")
             return {}
     
+    async def get_cdr_analytics(self, start_date: datetime, end_date: datetime,
+                                top: int = 20) -> Dict[str, Any]:
+        """Аналитика CDR за период [start_date, end_date) одним запросом
+
+        Группировки выполняет СУБД: по дням, часам, disposition, dcontext,
+        src/dst (top самых частых) и accountcode.
+        """
+        if not self.connected:
+            return {}
+
+        try:
+            rows = await self.sql.fetch_dicts("cdr_analytics", start=start_date, end=end_date, top=top)
+
+            return self._assemble_cdr_analytics(rows, start_date, end_date)
+
+        except Exception as e:
+            logger.error(f"Error getting CDR analytics: {e}")
+            return {}
+
+    @staticmethod
+    def _assemble_cdr_analytics(rows: List[Dict[str, Any]], start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        """Строки (series, bucket, метрики) -> ряды и итоги"""
+        series = {name: [] for name in CDR_ANALYTICS_SERIES}
+
+        for row in rows:
+            point = {"bucket": row["bucket"]}
+            for metric in ("calls", "answered", "no_answer", "busy", "failed", "billsec", "duration"):
+                point[metric] = int(row[metric] or 0)
+            point["avg_talk_time"] = round(point["billsec"] / point["answered"], 1) if point["answered"] else 0
+            series[row["series"]].append(point)
+
+        series["day"].sort(key=lambda point: point["bucket"])
+        series["hour"] = sorted(({**point, "bucket": int(point["bucket"])} for point in series["hour"]),
+                                key=lambda point: point["bucket"])
+        for name in ("disposition", "dcontext", "src", "dst", "accountcode"):
+            series[name].sort(key=lambda point: point["calls"], reverse=True)
+
+        totals = {
+            metric: sum(point[metric] for point in series["day"])
+            for metric in ("calls", "answered", "no_answer", "busy", "failed", "billsec", "duration")
+        }
+        totals["answer_rate"] = round(totals["answered"] / totals["calls"] * 100, 2) if totals["calls"] else 0
+        totals["avg_talk_time"] = round(totals["billsec"] / totals["answered"], 1) if totals["answered"] else 0
+
+        return {
+            "period": {"start_date": start_date.isoformat(), "end_date": end_date.isoformat()},
+            "totals": totals,
+            "series": series
+        }
+
+    async def get_cdr_index_advice(self) -> Dict[str, Any]:
+        """Проверка индексов cdr: запросы по периоду и keyset-проходы опираются на calldate"""
+        if not self.connected:
+            return {}
+
+        try:
+            # database используется только запросом MySQL
+            _, rows = await self.sql.fetch("cdr_indexes", database=self.config.database)
+
+            indexes: Dict[str, List[str]] = {}
+            for index_name, column_name in rows:
+                indexes.setdefault(index_name, []).append(column_name)
+
+            calldate_indexed = any(columns[0] == "calldate" for columns in indexes.values())
+            keyset_indexed = any(columns[:2] == ["calldate", "uniqueid"] for columns in indexes.values())
+
+            recommendations = []
+            if not calldate_indexed:
+                recommendations.append("CREATE INDEX cdr_calldate_uniqueid ON cdr (calldate, uniqueid)")
+            elif not keyset_indexed:
+                recommendations.append(
+                    "CREATE INDEX cdr_calldate_uniqueid ON cdr (calldate, uniqueid) "
+                    "-- для синхронизации и выгрузки по отметке (calldate, uniqueid)"
+                )
+
+            return {
+                "indexes": indexes,
+                "calldate_indexed": calldate_indexed,
+                "keyset_indexed": keyset_indexed,
+                "recommendations": recommendations
+            }
+
+        except Exception as e:
+            logger.error(f"Error checking CDR indexes: {e}")
+            return {"error": str(e)}
+
     async def close(self):
         """Закрытие подключений"""
         if self.connection_pool:
-            if self.config.db_type.lower() == "mysql":
-                self.connection_pool.close()
-                await self.connection_pool.wait_closed()
-            else:
-                await self.connection_pool.close()
-            
+            await self.sql.dialect.close_pool(self.connection_pool)
+            self.connection_pool = None
             self.connected = False
             logger.info("Asterisk database connection closed")
 
+    def get_stats(self) -> Dict[str, Any]:
+        """Пул и задержки запросов: ожидание соединения против медленных запросов"""
+        stats = {
+            "connected": self.connected,
+            "database_type": self.config.db_type
+        }
+        if self.sql:
+            stats.update(self.sql.get_stats())
+        return stats
+
 # Глобальный экземпляр
 _asterisk_db_manager: Optional[AsteriskDatabaseManager] = None
 
@@ -393,6 +400,8 @@ async def initialize_asterisk_db(config: AsteriskDatabaseConfig) -> bool:
     global _asterisk_db_manager
     
     _asterisk_db_manager = AsteriskDatabaseManager(config)
+    # Результаты отчетов по прежней БД больше не актуальны
+    get_report_cache().clear()
     connected = await _asterisk_db_manager.connect()
     
     if connected:
@@ -3,21 +3,27 @@ import json
 import logging
 import aiohttp
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Set
 from websockets import connect, ConnectionClosed
 import websockets
 
-from models import Call, CallCreate, CallUpdate, CallStatus, OperatorStatus
+from models import Call, CallCreate, CallUpdate, CallStatus, CallType as CallRecordType, OperatorStatus
 from database import DatabaseManager
 from db import get_db
 from websocket_manager import get_websocket_manager
+from queue_estimator import get_queue_estimator, AGENT_AVAILABLE, AGENT_BUSY, AGENT_PAUSED
+from skill_router import get_skill_router
+from caller_affinity import get_caller_affinity
+from config import config
+from timing_wheel import TimingWheel
 
 # Импортируем нашу логику обработки звонков
 from call_flow_logic import (
     call_flow_logic, 
     call_stats_processor, 
     CallType, 
-    CallProcessingStrategy
+    CallProcessingStrategy,
+    CallFlowConfig
 )
 
 logger = logging.getLogger(__name__)
@@ -31,7 +37,24 @@ class AsteriskEventHandler:
         self.running = False
         self.active_calls: Dict[str, Dict[str, Any]] = {}  # channel_id -> call_data
         self.active_queue_entries: Dict[str, Dict[str, Any]] = {}  # uniqueid -> queue_entry
+        self.agent_bridge_channels: Dict[str, str] = {}  # channel_id оператора в bridge -> extension
+        self.affinity_waits: Dict[str, asyncio.Task] = {}  # channel_id -> ожидание последнего оператора
+        self.background_tasks: Set[asyncio.Task] = set()  # ссылки на фоновые задачи до их завершения
         self.websocket_manager = get_websocket_manager()
+        self.queue_estimator = get_queue_estimator()
+        self.skill_router = get_skill_router()
+        self.caller_affinity = get_caller_affinity()
+        
+        # Дедлайны звонков: одно колесо таймеров вместо задачи на каждый звонок
+        self.call_timers = TimingWheel(tick_seconds=config.CALL_TIMER_TICK_SECONDS, name="call_deadlines")
+        self.call_deadlines: Dict[str, Dict[str, Any]] = {}  # channel_id/uniqueid -> {тип: Timer}
+        self.deadline_stats: Dict[str, Dict[str, int]] = {}
+        self.timeout_settings = {
+            "queue_timeout": CallFlowConfig.QUEUE_MAX_WAIT_TIME,
+            "max_call_duration": 3600,
+            "auto_answer_delay": 0,
+            "ring_timeout": CallFlowConfig.OPERATOR_RING_TIMEOUT
+        }
         
     async def start_listening(self):
         """Запуск прослушивания событий Asterisk ARI"""
@@ -39,6 +62,9 @@ class AsteriskEventHandler:
             logger.error("ARI client not connected, cannot start event listening")
             return False
             
+        await self.load_timeout_settings()
+        self.call_timers.start()
+        
         try:
             # Формируем WebSocket URL для Asterisk ARI
             ws_url = f"ws://{self.ari_client.host}:{self.ari_client.port}/ari/events"
@@ -116,6 +142,8 @@ class AsteriskEventHandler:
             await self._handle_queue_member_pause(event_data)
         elif event_type == "QueueMemberUnpause":
             await self._handle_queue_member_unpause(event_data)
+        elif event_type == "AgentRingNoAnswer":
+            await call_stats_processor.process_queue_event("AgentRingNoAnswer", event_data)
         
         # Обработка событий bridge (соединения)
         elif event_type == "BridgeCreated":
@@ -169,7 +197,7 @@ class AsteriskEventHandler:
                 # Прямой звонок оператору
                 await self._execute_direct_dial(decision, channel)
                 
-            elif action == "route_to_queue":
+            elif action in ("route_to_queue", "queue_fallback"):
                 # Маршрутизация в очередь Asterisk
                 await self._execute_queue_routing(decision, channel)
                 
@@ -191,6 +219,12 @@ class AsteriskEventHandler:
                 else:
                     await self._execute_hangup(channel, "Operator unavailable")
             
+            elif action == "affinity_wait":
+                # Ожидание последнего оператора звонящего - в фоне, не блокируя события;
+                # отбой звонящего во время ожидания отменяет задачу
+                task = self._spawn(self._execute_affinity_wait(decision, original_event))
+                self.affinity_waits[channel_id] = task
+            
             else:
                 logger.warning(f"Unknown routing action: {action}")
                 await self._execute_hangup(channel, "Unknown routing")
@@ -212,10 +246,11 @@ class AsteriskEventHandler:
             caller_number=channel.get("caller", {}).get("number", "Unknown"),
             called_number=target_extension,
             operator_id=decision.get("operator_id"),
+            queue_name=decision.get("queue_name"),
             channel_id=channel_id,
             start_time=datetime.utcnow(),
             status=CallStatus.RINGING,
-            call_type="direct"
+            call_type=CallRecordType.INCOMING_DIRECT
         )
         
         call = await db.create_call(call_data)
@@ -224,18 +259,48 @@ class AsteriskEventHandler:
         self.active_calls[channel_id] = {
             "call_id": call.id,
             "operator_id": decision.get("operator_id"),
+            "target_extension": target_extension,
+            "caller_number": call_data.caller_number,
+            "queue_name": decision.get("queue_name"),
             "call_type": "direct",
-            "routing_decision": decision
+            "routing_decision": decision,
+            "start_time": call_data.start_time
         }
         
+        # Оператор должен ответить за время звонка, иначе звонящий уходит в очередь
+        self._schedule_deadline(channel_id, "ring_timeout", self.timeout_settings["ring_timeout"],
+                                self._on_ring_timeout, channel_id)
+        
         # Отправляем команду Asterisk для звонка
         if self.ari_client:
             try:
                 await self.ari_client.originate_call(target_extension)
             except Exception as e:
                 logger.error(f"Failed to originate call to {target_extension}: {e}")
+                self.skill_router.release(target_extension)
+    
+    async def _execute_affinity_wait(self, decision: Dict[str, Any], original_event: Dict[str, Any]):
+        """Звонок ждет освобождения последнего оператора, затем dial или очередь"""
+        channel = original_event.get("channel", {})
+        
+        logger.info(f"⏳ Waiting up to {decision.get('wait_budget')}s for operator {decision.get('target_extension')}")
+        
+        try:
+            final_decision = await call_flow_logic.resolve_affinity_wait({
+                "caller_number": channel.get("caller", {}).get("number"),
+                "channel_id": channel.get("id")
+            }, decision)
+            # Решение принято - дальше звонок завершается обычными событиями канала
+            self.affinity_waits.pop(channel.get("id"), None)
+            await self._execute_routing_decision(final_decision, original_event)
+        except asyncio.CancelledError:
+            logger.info(f"⏳ Caller hung up while waiting for operator {decision.get('target_extension')}")
+            raise
+        except Exception as e:
+            logger.error(f"Error waiting for affinity operator: {e}")
+            await self._execute_hangup(channel, "Routing error")
     
-    async def _execute_queue_routing(self, decision: Dict[str, Any], channel: Dict[str, Any]):
+    async def _execute_queue_routing(self, decision: Dict[str, Any], channel: Dict[str, Any]) -> bool:
         """Выполнение маршрутизации в очередь"""
         queue_name = decision.get("queue_name")
         channel_id = channel.get("id")
@@ -253,12 +318,20 @@ class AsteriskEventHandler:
         }
         
         # Отправляем канал в очередь через ARI
-        if self.ari_client:
-            try:
-                # Выходим из Stasis и направляем в dialplan с очередью
-                await self.ari_client.send_channel_to_queue(channel_id, queue_name)
-            except Exception as e:
-                logger.error(f"Failed to route to queue {queue_name}: {e}")
+        if not self.ari_client:
+            return False
+        try:
+            # Выходим из Stasis в dialplan с очередью; лимит ожидания соблюдает сам Queue()
+            result = await self.ari_client.send_channel_to_queue(
+                channel_id, queue_name, config.QUEUE_CONTEXT, self.timeout_settings["queue_timeout"]
+            )
+        except Exception as e:
+            logger.error(f"Failed to route to queue {queue_name}: {e}")
+            return False
+        if not self._ari_succeeded(result):
+            logger.error(f"Asterisk rejected routing of {channel_id} to queue {queue_name}: {result}")
+            return False
+        return True
     
     async def _execute_ivr(self, decision: Dict[str, Any], channel: Dict[str, Any], ivr_type: str):
         """Выполнение IVR"""
@@ -274,23 +347,40 @@ class AsteriskEventHandler:
         
         sound_file = ivr_files.get(ivr_type, "generic-message")
         
-        if self.ari_client:
-            try:
-                await self.ari_client.play_sound(channel_id, sound_file)
-            except Exception as e:
-                logger.error(f"Failed to play IVR {ivr_type}: {e}")
+        # Ответ и проигрывание после задержки автоответа
+        delay = self.timeout_settings["auto_answer_delay"]
+        if delay > 0:
+            self._schedule_deadline(channel_id, "auto_answer", delay, self._on_auto_answer, channel_id, sound_file)
+        else:
+            await self._on_auto_answer(channel_id, sound_file)
+    
+    async def _on_auto_answer(self, channel_id: str, sound_file: str):
+        """Автоответ: answer и проигрывание сообщения"""
+        if not self.ari_client:
+            return
+        try:
+            await self.ari_client.answer_channel(channel_id)
+            await self.ari_client.play_sound(channel_id, sound_file)
+        except Exception as e:
+            logger.error(f"Failed to play IVR {sound_file}: {e}")
     
-    async def _execute_hangup(self, channel: Dict[str, Any], reason: str):
+    async def _execute_hangup(self, channel: Dict[str, Any], reason: str) -> bool:
         """Завершение звонка"""
         channel_id = channel.get("id")
         
         logger.info(f"📴 Hanging up call: {reason}")
         
-        if self.ari_client:
-            try:
-                await self.ari_client.hangup_channel(channel_id)
-            except Exception as e:
-                logger.error(f"Failed to hangup channel {channel_id}: {e}")
+        if not self.ari_client:
+            return False
+        try:
+            result = await self.ari_client.hangup_channel(channel_id)
+        except Exception as e:
+            logger.error(f"Failed to hangup channel {channel_id}: {e}")
+            return False
+        if not self._ari_succeeded(result):
+            logger.error(f"Asterisk rejected hangup of {channel_id}: {result}")
+            return False
+        return True
     
     # === ОБРАБОТКА ОЧЕРЕДЕЙ (для статистики) ===
     
@@ -327,6 +417,15 @@ class AsteriskEventHandler:
                 "position": position
             }
             
+            # Живые метрики очереди для оценки ожидания
+            self.queue_estimator.record_arrival(queue_name)
+            
+            # Страховка лимита ожидания: Queue() отпускает звонящего сам, а если
+            # этого не произошло (dialplan без таймаута), канал снимается через ARI
+            self._schedule_deadline(uniqueid, "queue_timeout",
+                                    self.timeout_settings["queue_timeout"] + config.QUEUE_TIMEOUT_GRACE_SECONDS,
+                                    self._on_queue_timeout, uniqueid)
+            
             # Обрабатываем событие в статистическом процессоре
             await call_stats_processor.process_queue_event("QueueCallerJoin", event_data)
             
@@ -360,13 +459,16 @@ class AsteriskEventHandler:
             
             logger.info(f"📤 Caller left queue {entry['queue_name']}, reason: {reason}, wait: {wait_time}s")
             
+            self.queue_estimator.record_queue_leave(entry["queue_name"])
+            self._cancel_deadline(uniqueid, "queue_timeout")
+            
             # Обновляем запись звонка
             db = get_db()
             
             # Определяем статус по причине выхода
             if reason == "transfer":
                 status = CallStatus.ANSWERED
-            elif reason == "timeout":
+            elif reason == "timeout" or entry.get("timed_out"):
                 status = CallStatus.MISSED
             else:
                 status = CallStatus.ABANDONED
@@ -401,6 +503,9 @@ class AsteriskEventHandler:
             
             logger.info(f"📞 Member {extension} ringging for caller {caller_number} in queue {queue_name}")
             
+            # Оператор обслуживает очередь
+            self.queue_estimator.add_queue_member(queue_name, extension)
+            
             # Находим оператора
             operator = await self._find_operator_by_extension(extension)
             if operator:
@@ -428,6 +533,9 @@ class AsteriskEventHandler:
             
             logger.info(f"⏸️ Member {extension} paused, reason: {reason}")
             
+            self.queue_estimator.set_agent_state(extension, AGENT_PAUSED)
+            self.skill_router.set_agent_state(extension, AGENT_PAUSED)
+            
             # Обновляем статус оператора в БД
             operator = await self._find_operator_by_extension(extension)
             if operator:
@@ -448,6 +556,9 @@ class AsteriskEventHandler:
             
             logger.info(f"▶️ Member {extension} unpaused")
             
+            self.queue_estimator.set_agent_state(extension, AGENT_AVAILABLE)
+            self.skill_router.set_agent_state(extension, AGENT_AVAILABLE)
+            
             # Обновляем статус оператора в БД
             operator = await self._find_operator_by_extension(extension)
             if operator:
@@ -476,6 +587,17 @@ class AsteriskEventHandler:
             
             logger.info(f"🔗 Channel {channel_id} entered bridge {bridge.get('id')}")
             
+            # Канал оператора в bridge - оператор занят
+            extension = self._extract_extension_from_interface(channel.get("name"))
+            if self.queue_estimator.is_agent_known(extension):
+                self.queue_estimator.set_agent_state(extension, AGENT_BUSY)
+            if self.skill_router.get_agent(extension):
+                self.skill_router.set_agent_state(extension, AGENT_BUSY)
+                self.agent_bridge_channels[channel_id] = extension
+            
+            # Звонящий и оператор в одном bridge - запоминаем оператора звонящего
+            self._record_bridge_affinity(bridge)
+            
             # Это означает что звонок был отвечен и соединен
             await self._record_call_answered(channel_id)
             
@@ -495,6 +617,16 @@ class AsteriskEventHandler:
             
             logger.info(f"🔓 Channel {channel_id} left bridge {bridge.get('id')}")
             
+            # Оператор освободился (если не ушел на паузу)
+            extension = self._extract_extension_from_interface(channel.get("name"))
+            if self.queue_estimator.agent_states.get(extension) == AGENT_BUSY:
+                self.queue_estimator.set_agent_state(extension, AGENT_AVAILABLE)
+            self.agent_bridge_channels.pop(channel_id, None)
+            agent = self.skill_router.get_agent(extension)
+            if agent and agent.state == AGENT_BUSY:
+                self.skill_router.record_call_handled(extension)
+                self.skill_router.set_agent_state(extension, AGENT_AVAILABLE)
+            
             # Завершаем звонок
             await self._record_call_ended(channel_id)
             
@@ -531,6 +663,8 @@ class AsteriskEventHandler:
             
             logger.info(f"📞 Stasis ended for channel: {channel_id}")
             
+            self._cancel_affinity_wait(channel_id)
+            
             # Завершаем звонок если он еще активен
             if channel_id in self.active_calls:
                 await self._record_call_ended(channel_id)
@@ -548,9 +682,32 @@ class AsteriskEventHandler:
         # Очищаем активные звонки
         if channel_id in self.active_calls:
             del self.active_calls[channel_id]
+        self._cancel_affinity_wait(channel_id)
+        self.agent_bridge_channels.pop(channel_id, None)
+        self._cancel_deadline(channel_id)
     
     # === ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ ===
     
+    @staticmethod
+    def _ari_succeeded(result: Any) -> bool:
+        """Результат команды ARI: bool реального клиента или {"success": ...} виртуального"""
+        if isinstance(result, dict):
+            return bool(result.get("success"))
+        return bool(result)
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        """Фоновая задача со ссылкой до завершения (иначе ее может собрать GC)"""
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+    
+    def _cancel_affinity_wait(self, channel_id: Optional[str]):
+        """Отмена ожидания оператора при отбое звонящего (без dial в пустоту)"""
+        task = self.affinity_waits.pop(channel_id, None)
+        if task and not task.done():
+            task.cancel()
+    
     def _extract_extension_from_interface(self, interface: str) -> str:
         """Извлечение extension из interface (например PJSIP/0001 -> 0001)"""
         if not interface:
@@ -562,6 +719,18 @@ class AsteriskEventHandler:
         
         return interface
     
+    def _record_bridge_affinity(self, bridge: Dict[str, Any]):
+        """Привязка звонящего к оператору, соединенному с ним в bridge"""
+        channel_ids = bridge.get("channels", [])
+        caller_number = next((self.active_calls[channel_id].get("caller_number")
+                              for channel_id in channel_ids if channel_id in self.active_calls), None)
+        extension = next((self.agent_bridge_channels[channel_id]
+                          for channel_id in channel_ids if channel_id in self.agent_bridge_channels), None)
+        
+        agent = self.skill_router.get_agent(extension) if extension else None
+        if caller_number and agent:
+            self.caller_affinity.record(caller_number, agent.operator_id)
+    
     async def _find_operator_by_extension(self, extension: str):
         """Поиск оператора по extension"""
         try:
@@ -585,6 +754,17 @@ class AsteriskEventHandler:
                 call_info = self.active_calls[channel_id]
                 call_id = call_info.get("call_id")
                 
+                # Время ответа нужно и звонкам очереди без call_id (AHT в оценщике)
+                if "answer_time" not in call_info:
+                    call_info["answer_time"] = datetime.utcnow()
+                    self._cancel_deadline(channel_id, "ring_timeout")
+                    self._schedule_deadline(channel_id, "max_duration", self.timeout_settings["max_call_duration"],
+                                            self._on_max_duration, channel_id)
+                
+                # Прямой звонок отвечен - звонящий привязан к оператору
+                if call_info.get("operator_id"):
+                    self.caller_affinity.record(call_info.get("caller_number"), call_info["operator_id"])
+                
                 if call_id:
                     db = get_db()
                     call_update = CallUpdate(
@@ -634,12 +814,129 @@ class AsteriskEventHandler:
                             "talk_time": talk_time
                         })
                 
+                # Оператор зарезервирован, но звонок так и не соединился
+                if call_info.get("target_extension") and "answer_time" not in call_info:
+                    self.skill_router.release(call_info["target_extension"])
+                
+                # Время обслуживания звонка очереди для оценки ожидания
+                queue_name = call_info.get("queue_name")
+                if queue_name and "answer_time" in call_info:
+                    handle_time = (datetime.utcnow() - call_info["answer_time"]).total_seconds()
+                    self.queue_estimator.record_handle_time(queue_name, handle_time)
+                
                 # Удаляем из активных
                 del self.active_calls[channel_id]
+                self._cancel_deadline(channel_id)
                 
         except Exception as e:
             logger.error(f"Error recording call ended: {e}")
     
+    # === ДЕДЛАЙНЫ ЗВОНКОВ ===
+    
+    async def load_timeout_settings(self, db=None):
+        """Таймауты из SystemSettings (queue_timeout, max_call_duration, auto_answer_delay)"""
+        try:
+            settings = await (db or get_db()).get_system_settings()
+            if settings:
+                self.timeout_settings.update({
+                    "queue_timeout": settings.queue_timeout,
+                    "max_call_duration": settings.max_call_duration,
+                    "auto_answer_delay": settings.auto_answer_delay
+                })
+        except Exception as e:
+            logger.error(f"Error loading timeout settings: {e}")
+    
+    def _schedule_deadline(self, key: Optional[str], kind: str, delay: float, callback, *args):
+        """Дедлайн звонка в колесе таймеров (O(1)); повторное планирование заменяет прежний"""
+        if not key or not delay or delay <= 0:
+            return
+        self._cancel_deadline(key, kind)
+        timer = self.call_timers.schedule(delay, self._fire_deadline, key, kind, callback, args)
+        self.call_deadlines.setdefault(key, {})[kind] = timer
+        self.deadline_stats.setdefault(kind, {"scheduled": 0, "fired": 0, "cancelled": 0, "failed": 0})["scheduled"] += 1
+    
+    def _cancel_deadline(self, key: Optional[str], kind: Optional[str] = None):
+        """Отмена одного дедлайна звонка или всех (kind=None)"""
+        timers = self.call_deadlines.get(key) if key else None
+        if not timers:
+            return
+        for timer_kind in ([kind] if kind else list(timers)):
+            timer = timers.pop(timer_kind, None)
+            if timer and self.call_timers.cancel(timer):
+                self.deadline_stats[timer_kind]["cancelled"] += 1
+        if not timers:
+            del self.call_deadlines[key]
+    
+    async def _fire_deadline(self, key: str, kind: str, callback, args: tuple):
+        timers = self.call_deadlines.get(key)
+        if timers is not None:
+            timers.pop(kind, None)
+            if not timers:
+                del self.call_deadlines[key]
+        self.deadline_stats[kind]["fired"] += 1
+        logger.info(f"⏰ Call deadline {kind} expired for {key}")
+        # Обработчик возвращает False, если Asterisk не выполнил действие
+        if await callback(*args) is False:
+            self.deadline_stats[kind]["failed"] += 1
+            logger.warning(f"Call deadline {kind} for {key} was not enforced")
+    
+    async def _on_queue_timeout(self, uniqueid: str) -> Optional[bool]:
+        """Звонящий остался в очереди после лимита ожидания - снимаем канал.
+        
+        Канал уже выполняет Queue() вне Stasis, поэтому continue недоступен;
+        DELETE /channels/{id} работает для любого канала.
+        """
+        entry = self.active_queue_entries.get(uniqueid)
+        if not entry:
+            return None
+        entry["timed_out"] = True
+        return await self._execute_hangup({"id": uniqueid}, "Queue wait limit exceeded")
+    
+    async def _on_ring_timeout(self, channel_id: str) -> Optional[bool]:
+        """Оператор не ответил - снимаем резерв и отправляем звонящего в очередь"""
+        call_info = self.active_calls.get(channel_id)
+        if not call_info or "answer_time" in call_info:
+            return None
+        
+        target_extension = call_info.get("target_extension")
+        if target_extension:
+            self.skill_router.release(target_extension)
+        
+        # Прямой звонок завершается пропущенным; в очереди звонящий получит
+        # новую запись на QueueCallerJoin
+        call_id = call_info.get("call_id")
+        if call_id:
+            try:
+                start_time = call_info.get("start_time")
+                await get_db().update_call(call_id, CallUpdate(
+                    status=CallStatus.MISSED,
+                    end_time=datetime.utcnow(),
+                    ring_time=int((datetime.utcnow() - start_time).total_seconds()) if start_time else None,
+                    abandon_reason="ring_timeout"
+                ))
+            except Exception as e:
+                logger.error(f"Error closing unanswered direct call {call_id}: {e}")
+        
+        decision = {**call_info.get("routing_decision", {}), "action": "route_to_queue",
+                    "queue_name": call_info.get("queue_name") or CallFlowConfig.DEFAULT_QUEUE,
+                    "reason": "ring_timeout"}
+        return await self._execute_queue_routing(decision, {"id": channel_id, "caller": {"number": call_info.get("caller_number")}})
+    
+    async def _on_max_duration(self, channel_id: str) -> Optional[bool]:
+        """Превышена максимальная длительность звонка"""
+        if channel_id not in self.active_calls:
+            return None
+        return await self._execute_hangup({"id": channel_id}, "Max call duration exceeded")
+    
+    def get_timer_stats(self) -> Dict[str, Any]:
+        """Метрики дедлайнов звонков"""
+        return {
+            **self.call_timers.get_stats(),
+            "calls_with_deadlines": len(self.call_deadlines),
+            "by_type": self.deadline_stats,
+            "settings": self.timeout_settings
+        }
+    
     async def _notify_operator_incoming_call(self, user_id: str, call_data: Dict[str, Any]):
         """Уведомление оператора о входящем звонке"""
         await self.websocket_manager.send_to_user(user_id, {
@@ -673,6 +970,10 @@ class AsteriskEventHandler:
     async def stop_listening(self):
         """Остановка прослушивания событий"""
         self.running = False
+        await self.call_timers.stop()
+        for task in list(self.background_tasks):
+            task.cancel()
+        self.affinity_waits.clear()
         if self.websocket:
             await self.websocket.close()
         logger.info("Stopped listening to Asterisk events")
@@ -0,0 +1,564 @@
+"""
+Smart Call Center - Asterisk SQL Dialects
+=========================================
+
+Слой диалектов для БД Asterisk (MySQL / PostgreSQL).
+
+Запросы описываются один раз в реестре STATEMENTS с именованными
+параметрами (:start, :limit ...): общий текст для обеих СУБД или
+отдельные варианты там, где синтаксис различается. Диалект при
+подключении компилирует реестр в свои плейсхолдеры (%s для aiomysql,
+$1..$n для asyncpg) - тексты запросов неизменны, поэтому asyncpg
+переиспользует подготовленные выражения из кэша соединения, а
+менеджер не ветвится по типу СУБД на каждом вызове.
+
+SqlTelemetry считает ожидание соединения из пула, занятые соединения
+и задержку каждого запроса по имени - медленный отчет отличается от
+нехватки соединений.
+"""
+
+import re
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import aiomysql
+    MYSQL_AVAILABLE = True
+except ImportError:
+    MYSQL_AVAILABLE = False
+
+try:
+    import asyncpg
+    POSTGRES_AVAILABLE = True
+except ImportError:
+    POSTGRES_AVAILABLE = False
+
+# Колонки CDR, которые читает Smart Call Center
+CDR_COLUMNS = """calldate, src, dst, dcontext, channel, dstchannel,
+                       lastapp, lastdata, duration, billsec, disposition,
+                       amaflags, accountcode, uniqueid, userfield"""
+
+# Колонки queue_log (realtime-схема Asterisk)
+QUEUE_LOG_COLUMNS = ("time", "callid", "queuename", "agent", "event", "data1", "data2", "data3", "data4")
+
+# Колонки CEL для сборки плеч звонка
+CEL_COLUMNS = "id, eventtype, eventtime, uniqueid, linkedid, channame, cid_num, exten, context, peer, extra"
+
+# Группировки аналитики CDR; для src/dst возвращаются только самые частые значения
+CDR_ANALYTICS_SERIES = ("day", "hour", "disposition", "dcontext", "src", "dst", "accountcode")
+CDR_ANALYTICS_TOP_SERIES = ("src", "dst")
+
+CDR_ANALYTICS_METRICS = """COUNT(*) AS calls,
+                       SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) AS answered,
+                       SUM(CASE WHEN disposition = 'NO ANSWER' THEN 1 ELSE 0 END) AS no_answer,
+                       SUM(CASE WHEN disposition = 'BUSY' THEN 1 ELSE 0 END) AS busy,
+                       SUM(CASE WHEN disposition = 'FAILED' THEN 1 ELSE 0 END) AS failed,
+                       SUM(billsec) AS billsec,
+                       SUM(duration) AS duration"""
+
+ASTERISK_TABLES = "('cdr', 'cel', 'queue_log', 'extensions')"
+
+# ===== РЕЕСТР ЗАПРОСОВ =====
+
+# Имя -> {"mysql": текст, "postgresql": текст}; параметры - :имя
+STATEMENTS: Dict[str, Dict[str, str]] = {}
+
+def statement(name: str, sql: str = None, *, mysql: str = None, postgresql: str = None):
+    """Регистрация запроса: общий текст или варианты по диалектам"""
+    STATEMENTS[name] = {"mysql": mysql or sql, "postgresql": postgresql or sql}
+
+def _mysql_cdr_analytics() -> str:
+    buckets = {
+        "day": "DATE_FORMAT(calldate, '%Y-%m-%d')",
+        "hour": "HOUR(calldate)",
+        "disposition": "disposition",
+        "dcontext": "dcontext",
+        "src": "src",
+        "dst": "dst",
+        "accountcode": "accountcode"
+    }
+    members = []
+    for series in CDR_ANALYTICS_SERIES:
+        member = f"""
+            SELECT '{series}' AS series, CAST({buckets[series]} AS CHAR) AS bucket, {CDR_ANALYTICS_METRICS}
+            FROM cdr
+            WHERE calldate >= :start AND calldate < :end
+            GROUP BY bucket
+        """
+        if series in CDR_ANALYTICS_TOP_SERIES:
+            member += " ORDER BY calls DESC LIMIT :top"
+        members.append(f"({member})")
+    return " UNION ALL ".join(members)
+
+def _postgresql_cdr_analytics() -> str:
+    series_case = " ".join(f"WHEN GROUPING({series}) = 0 THEN '{series}'" for series in CDR_ANALYTICS_SERIES)
+    bucket_case = " ".join(f"WHEN GROUPING({series}) = 0 THEN {series}" for series in CDR_ANALYTICS_SERIES)
+    grouping_sets = ", ".join(f"({series})" for series in CDR_ANALYTICS_SERIES)
+    top_series = ", ".join(f"'{series}'" for series in CDR_ANALYTICS_TOP_SERIES)
+    return f"""
+        WITH base AS (
+            SELECT to_char(calldate, 'YYYY-MM-DD') AS day,
+                   EXTRACT(HOUR FROM calldate)::int::text AS hour,
+                   disposition, dcontext, src, dst, accountcode, billsec, duration
+            FROM cdr
+            WHERE calldate >= :start AND calldate < :end
+        ),
+        grouped AS (
+            SELECT CASE {series_case} END AS series,
+                   CASE {bucket_case} END AS bucket,
+                   {CDR_ANALYTICS_METRICS}
+            FROM base
+            GROUP BY GROUPING SETS ({grouping_sets})
+        )
+        SELECT series, bucket, calls, answered, no_answer, busy, failed, billsec, duration
+        FROM (
+            SELECT grouped.*, row_number() OVER (PARTITION BY series ORDER BY calls DESC) AS series_rank
+            FROM grouped
+        ) ranked
+        WHERE series NOT IN ({top_series}) OR series_rank <= :top
+    """
+
+statement("ping", "SELECT 1")
+
+statement(
+    "tables_info",
+    mysql=f"""
+        SELECT TABLE_NAME AS name, TABLE_ROWS AS row_count, DATA_LENGTH AS size_bytes
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = :database
+        AND TABLE_NAME IN {ASTERISK_TABLES}
+    """,
+    # Для PostgreSQL подсчет строк более сложный
+    postgresql=f"""
+        SELECT tablename AS name, 0 AS row_count,
+               pg_total_relation_size(schemaname||'.'||tablename) AS size_bytes
+        FROM pg_tables
+        WHERE schemaname = 'public'
+        AND tablename IN {ASTERISK_TABLES}
+    """
+)
+
+statement("cdr_range", f"""
+    SELECT {CDR_COLUMNS}
+    FROM cdr
+    WHERE calldate BETWEEN :start AND :end
+    ORDER BY calldate DESC
+    LIMIT :limit
+""")
+
+# Keyset по (calldate, uniqueid): в MySQL сравнение кортежей раскрыто, чтобы работал индекс по calldate
+statement(
+    "cdr_stream",
+    mysql=f"""
+        SELECT {CDR_COLUMNS}
+        FROM cdr
+        WHERE calldate BETWEEN :start AND :end
+          AND (calldate > :after_calldate OR (calldate = :after_calldate AND uniqueid > :after_uniqueid))
+        ORDER BY calldate, uniqueid
+    """,
+    postgresql=f"""
+        SELECT {CDR_COLUMNS}
+        FROM cdr
+        WHERE calldate BETWEEN :start AND :end
+          AND (calldate, uniqueid) > (:after_calldate, :after_uniqueid)
+        ORDER BY calldate, uniqueid
+    """
+)
+
+statement(
+    "cdr_batch_after",
+    mysql=f"""
+        SELECT {CDR_COLUMNS}
+        FROM cdr
+        WHERE calldate > :after_calldate OR (calldate = :after_calldate AND uniqueid > :after_uniqueid)
+        ORDER BY calldate, uniqueid
+        LIMIT :limit
+    """,
+    postgresql=f"""
+        SELECT {CDR_COLUMNS}
+        FROM cdr
+        WHERE (calldate, uniqueid) > (:after_calldate, :after_uniqueid)
+        ORDER BY calldate, uniqueid
+        LIMIT :limit
+    """
+)
+
+statement("cdr_max_calldate", "SELECT MAX(calldate) FROM cdr")
+
+statement("call_statistics", """
+    SELECT
+        COUNT(*) as total_calls,
+        SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered_calls,
+        SUM(CASE WHEN disposition = 'NO ANSWER' THEN 1 ELSE 0 END) as missed_calls,
+        SUM(CASE WHEN disposition = 'BUSY' THEN 1 ELSE 0 END) as busy_calls,
+        AVG(CASE WHEN disposition = 'ANSWERED' THEN billsec ELSE NULL END) as avg_talk_time,
+        AVG(CASE WHEN disposition = 'ANSWERED' THEN duration - billsec ELSE NULL END) as avg_wait_time
+    FROM cdr
+    WHERE calldate >= :start
+""")
+
+statement("cdr_analytics", mysql=_mysql_cdr_analytics(), postgresql=_postgresql_cdr_analytics())
+
+statement(
+    "cdr_indexes",
+    mysql="""
+        SELECT INDEX_NAME, COLUMN_NAME
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = :database AND TABLE_NAME = 'cdr'
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """,
+    postgresql="""
+        SELECT i.relname, a.attname
+        FROM pg_index x
+        JOIN pg_class t ON t.oid = x.indrelid
+        JOIN pg_class i ON i.oid = x.indexrelid
+        CROSS JOIN LATERAL unnest(x.indkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+        WHERE t.relname = 'cdr'
+        ORDER BY i.relname, k.ord
+    """
+)
+
+# Хэш строки: CRC32 в MySQL, первые 32 бита MD5 в PostgreSQL (см. reconciliation.record_digest)
+statement(
+    "cdr_chunk_digests",
+    mysql="""
+        SELECT TIMESTAMPDIFF(SECOND, :start, calldate) DIV :chunk_seconds AS chunk,
+               COUNT(*) AS row_count,
+               BIT_XOR(CRC32(CONCAT_WS('|', uniqueid, disposition, billsec))) AS digest
+        FROM cdr
+        WHERE calldate >= :start AND calldate < :end
+        GROUP BY chunk
+    """,
+    postgresql="""
+        SELECT FLOOR(EXTRACT(EPOCH FROM (calldate - :start)) / :chunk_seconds)::bigint AS chunk,
+               COUNT(*) AS row_count,
+               BIT_XOR(('x' || lpad(substr(md5(concat_ws('|', uniqueid, disposition, billsec)), 1, 8), 16, '0'))::bit(64)::bigint) AS digest
+        FROM cdr
+        WHERE calldate >= :start AND calldate < :end
+        GROUP BY chunk
+    """
+)
+
+statement("cdr_reconcile_rows", """
+    SELECT uniqueid, disposition, billsec, calldate
+    FROM cdr
+    WHERE calldate >= :start AND calldate < :end
+""")
+
+# События передаются строкой через запятую - текст запроса не зависит от их числа
+statement(
+    "queue_log_stream",
+    mysql=f"""
+        SELECT {", ".join(QUEUE_LOG_COLUMNS)}
+        FROM queue_log
+        WHERE time >= :start AND time < :end AND FIND_IN_SET(event, :events)
+    """,
+    postgresql=f"""
+        SELECT {", ".join(QUEUE_LOG_COLUMNS)}
+        FROM queue_log
+        WHERE time >= :start AND time < :end AND event = ANY(string_to_array(:events, ','))
+    """
+)
+
+# Звонки (linkedid) с событиями в периоде выбираются целиком: иначе звонок на
+# границе периода собирается из части событий и затирает полное плечо
+statement("cel_stream", f"""
+    SELECT {CEL_COLUMNS}
+    FROM cel
+    WHERE linkedid IN (
+        SELECT DISTINCT linkedid FROM cel
+        WHERE eventtime >= :start AND eventtime < :end
+    )
+    ORDER BY linkedid, eventtime, id
+""")
+
+# ===== ТЕЛЕМЕТРИЯ =====
+
+class SqlTelemetry:
+    """Ожидание пула, занятые соединения и задержки запросов"""
+
+    def __init__(self):
+        self.acquire_count = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+        self.waiting = 0
+        self.in_use = 0
+        self.in_use_max = 0
+        self.queries: Dict[str, Dict[str, float]] = {}
+
+    def record_acquire(self, wait: float):
+        self.acquire_count += 1
+        self.acquire_wait_total += wait
+        self.acquire_wait_max = max(self.acquire_wait_max, wait)
+
+    def record_query(self, name: str, duration: float, rows: int = 0, error: bool = False):
+        stats = self.queries.get(name)
+        if stats is None:
+            stats = self.queries[name] = {"count": 0, "errors": 0, "rows": 0, "total": 0.0, "max": 0.0}
+        stats["count"] += 1
+        stats["rows"] += rows
+        stats["total"] += duration
+        stats["max"] = max(stats["max"], duration)
+        if error:
+            stats["errors"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "acquire": {
+                "count": self.acquire_count,
+                "waiting": self.waiting,
+                "avg_wait_ms": round(self.acquire_wait_total / self.acquire_count * 1000, 2) if self.acquire_count else 0.0,
+                "max_wait_ms": round(self.acquire_wait_max * 1000, 2)
+            },
+            "in_use": self.in_use,
+            "in_use_max": self.in_use_max,
+            "queries": {
+                name: {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "rows": stats["rows"],
+                    "avg_ms": round(stats["total"] / stats["count"] * 1000, 2),
+                    "max_ms": round(stats["max"] * 1000, 2)
+                }
+                for name, stats in sorted(self.queries.items())
+            }
+        }
+
+# ===== ДИАЛЕКТЫ =====
+
+_PARAMETER = re.compile(r"(?<!:):([a-z_][a-z0-9_]*)")
+
+class SqlDialect(ABC):
+    """Общая часть диалекта: компиляция реестра и выполнение через пул
+
+    Неполный диалект (без одного из абстрактных методов) не создается.
+    """
+
+    name = ""
+
+    def __init__(self):
+        # Имя запроса -> (текст с плейсхолдерами диалекта, порядок параметров)
+        self.statements: Dict[str, Tuple[str, List[str]]] = {
+            statement_name: self.compile(variants[self.name])
+            for statement_name, variants in STATEMENTS.items()
+        }
+
+    @abstractmethod
+    def compile(self, sql: str) -> Tuple[str, List[str]]:
+        """Именованные параметры :name -> плейсхолдеры драйвера и их порядок"""
+
+    def bind(self, statement_name: str, params: Dict[str, Any]) -> Tuple[str, Sequence[Any]]:
+        text, names = self.statements[statement_name]
+        return text, [params[name] for name in names]
+
+    @abstractmethod
+    async def create_pool(self, config):
+        """Пул подключений драйвера"""
+
+    @abstractmethod
+    def pool_size(self, pool) -> int:
+        """Текущее число подключений пула"""
+
+    @abstractmethod
+    async def fetch(self, conn, text: str, args: Sequence[Any]) -> Tuple[List[str], List[tuple]]:
+        """Все строки запроса: (колонки, строки)"""
+
+    @abstractmethod
+    def stream(self, conn, text: str, args: Sequence[Any], fetch_size: int) -> AsyncIterator[Tuple[List[str], List[tuple]]]:
+        """Порции строк серверного курсора по fetch_size"""
+
+    @abstractmethod
+    async def close_pool(self, pool):
+        """Закрытие пула"""
+
+class MySQLDialect(SqlDialect):
+    """aiomysql: параметры %s, экранирование на стороне клиента, SSCursor для потоков"""
+
+    name = "mysql"
+
+    def compile(self, sql: str) -> Tuple[str, List[str]]:
+        names: List[str] = []
+
+        def placeholder(match) -> str:
+            names.append(match.group(1))
+            return "%s"
+
+        # Литеральные % (DATE_FORMAT) экранируются: запрос всегда выполняется с параметрами
+        return _PARAMETER.sub(placeholder, sql.replace("%", "%%")), names
+
+    async def create_pool(self, config):
+        if not MYSQL_AVAILABLE:
+            raise RuntimeError("aiomysql not installed. Install with: pip install aiomysql")
+        return await aiomysql.create_pool(
+            host=config.host,
+            port=config.port,
+            user=config.username,
+            password=config.password,
+            db=config.database,
+            charset=config.charset,
+            autocommit=True,
+            minsize=config.pool_min_size,
+            maxsize=config.pool_size,
+            connect_timeout=config.connection_timeout
+        )
+
+    def pool_size(self, pool) -> int:
+        return pool.size
+
+    async def fetch(self, conn, text: str, args: Sequence[Any]) -> Tuple[List[str], List[tuple]]:
+        async with conn.cursor() as cursor:
+            await cursor.execute(text, tuple(args))
+            rows = await cursor.fetchall()
+            return [desc[0] for desc in cursor.description or ()], list(rows)
+
+    async def stream(self, conn, text: str, args: Sequence[Any], fetch_size: int):
+        async with conn.cursor(aiomysql.SSCursor) as cursor:
+            await cursor.execute(text, tuple(args))
+            columns = [desc[0] for desc in cursor.description]
+            while True:
+                rows = await cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield columns, list(rows)
+
+    async def close_pool(self, pool):
+        pool.close()
+        await pool.wait_closed()
+
+class PostgreSQLDialect(SqlDialect):
+    """asyncpg: параметры $n, кэш подготовленных выражений соединения, курсоры в транзакции"""
+
+    name = "postgresql"
+
+    def compile(self, sql: str) -> Tuple[str, List[str]]:
+        names: List[str] = []
+
+        def placeholder(match) -> str:
+            # Повторный параметр ссылается на тот же $n
+            if match.group(1) not in names:
+                names.append(match.group(1))
+            return f"${names.index(match.group(1)) + 1}"
+
+        return _PARAMETER.sub(placeholder, sql), names
+
+    async def create_pool(self, config):
+        if not POSTGRES_AVAILABLE:
+            raise RuntimeError("asyncpg not installed. Install with: pip install asyncpg")
+        dsn = f"postgresql://{config.username}:{config.password}@{config.host}:{config.port}/{config.database}"
+        return await asyncpg.create_pool(
+            dsn=dsn,
+            min_size=config.pool_min_size,
+            max_size=config.pool_size,
+            timeout=config.connection_timeout,
+            statement_cache_size=config.statement_cache_size
+        )
+
+    def pool_size(self, pool) -> int:
+        return pool.get_size()
+
+    async def fetch(self, conn, text: str, args: Sequence[Any]) -> Tuple[List[str], List[tuple]]:
+        records = await conn.fetch(text, *args)
+        columns = list(records[0].keys()) if records else []
+        return columns, [tuple(record) for record in records]
+
+    async def stream(self, conn, text: str, args: Sequence[Any], fetch_size: int):
+        async with conn.transaction():
+            cursor = await conn.cursor(text, *args)
+            columns = None
+            while True:
+                records = await cursor.fetch(fetch_size)
+                if not records:
+                    break
+                if columns is None:
+                    columns = list(records[0].keys())
+                yield columns, [tuple(record) for record in records]
+
+    async def close_pool(self, pool):
+        await pool.close()
+
+DIALECTS = {"mysql": MySQLDialect, "postgresql": PostgreSQLDialect}
+
+def get_dialect(db_type: str) -> Optional[SqlDialect]:
+    dialect_class = DIALECTS.get((db_type or "").lower())
+    return dialect_class() if dialect_class else None
+
+class SqlExecutor:
+    """Выполнение именованных запросов через пул с телеметрией"""
+
+    def __init__(self, dialect: SqlDialect, pool, pool_min_size: int, pool_max_size: int):
+        self.dialect = dialect
+        self.pool = pool
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        self.telemetry = SqlTelemetry()
+
+    @asynccontextmanager
+    async def acquire(self):
+        telemetry = self.telemetry
+        telemetry.waiting += 1
+        started = time.perf_counter()
+        acquired = False
+        try:
+            async with self.pool.acquire() as conn:
+                acquired = True
+                telemetry.waiting -= 1
+                telemetry.record_acquire(time.perf_counter() - started)
+                telemetry.in_use += 1
+                telemetry.in_use_max = max(telemetry.in_use_max, telemetry.in_use)
+                try:
+                    yield conn
+                finally:
+                    telemetry.in_use -= 1
+        finally:
+            # Ошибка или отмена до выдачи соединения - снимаем ожидание
+            if not acquired:
+                telemetry.waiting -= 1
+
+    async def fetch(self, statement_name: str, **params) -> Tuple[List[str], List[tuple]]:
+        """Колонки и строки (кортежи) именованного запроса"""
+        text, args = self.dialect.bind(statement_name, params)
+        async with self.acquire() as conn:
+            started = time.perf_counter()
+            try:
+                columns, rows = await self.dialect.fetch(conn, text, args)
+            except Exception:
+                self.telemetry.record_query(statement_name, time.perf_counter() - started, error=True)
+                raise
+            self.telemetry.record_query(statement_name, time.perf_counter() - started, len(rows))
+            return columns, rows
+
+    async def fetch_dicts(self, statement_name: str, **params) -> List[Dict[str, Any]]:
+        columns, rows = await self.fetch(statement_name, **params)
+        return [dict(zip(columns, row)) for row in rows]
+
+    async def fetchval(self, statement_name: str, **params) -> Any:
+        _, rows = await self.fetch(statement_name, **params)
+        return rows[0][0] if rows else None
+
+    async def stream(self, statement_name: str, fetch_size: int, **params) -> AsyncIterator[Tuple[List[str], List[tuple]]]:
+        """Порции (колонки, строки) серверного курсора; время учитывается за весь поток"""
+        text, args = self.dialect.bind(statement_name, params)
+        async with self.acquire() as conn:
+            started = time.perf_counter()
+            total = 0
+            try:
+                async for columns, rows in self.dialect.stream(conn, text, args, fetch_size):
+                    total += len(rows)
+                    yield columns, rows
+            except Exception:
+                self.telemetry.record_query(statement_name, time.perf_counter() - started, total, error=True)
+                raise
+            self.telemetry.record_query(statement_name, time.perf_counter() - started, total)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.telemetry.get_stats()
+        stats["dialect"] = self.dialect.name
+        stats["pool"] = {
+            "min_size": self.pool_min_size,
+            "max_size": self.pool_max_size,
+            "size": self.dialect.pool_size(self.pool)
+        }
+        return stats
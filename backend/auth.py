@@ -1,7 +1,11 @@
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import logging
+import multiprocessing
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
@@ -9,6 +13,7 @@ import os
 from models import User, UserLogin
 from database import DatabaseManager
 from config import config
+from principal_cache import get_principal_cache
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -21,6 +26,16 @@ ACCESS_TOKEN_EXPIRE_MINUTES = config.ACCESS_TOKEN_EXPIRE_MINUTES
 # Security scheme
 security = HTTPBearer()
 
+logger = logging.getLogger(__name__)
+
+# bcrypt releases the GIL, so a thread pool gives real parallelism
+# without blocking the event loop (ARI events, WebSocket fan-out)
+_password_executor = ThreadPoolExecutor(
+    max_workers=config.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="bcrypt"
+)
+_login_semaphore: Optional[asyncio.Semaphore] = None
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -29,6 +44,60 @@ def get_password_hash(password: str) -> str:
     """Hash password"""
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify password in the bcrypt thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash password in the bcrypt thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, get_password_hash, password)
+
+def _get_login_semaphore() -> asyncio.Semaphore:
+    global _login_semaphore
+    if _login_semaphore is None:
+        _login_semaphore = asyncio.Semaphore(config.LOGIN_CONCURRENCY_LIMIT)
+    return _login_semaphore
+
+async def verify_login_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify password for login with a concurrency limit (login storm protection)"""
+    semaphore = _get_login_semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=config.LOGIN_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, try again later",
+            headers={"Retry-After": "1"},
+        )
+    
+    try:
+        return await verify_password_async(plain_password, hashed_password)
+    finally:
+        semaphore.release()
+
+async def hash_passwords_bulk(passwords: List[str]) -> List[str]:
+    """Hash many passwords in a process pool (bulk imports and migrations)"""
+    if len(passwords) < 2:
+        return [await get_password_hash_async(password) for password in passwords]
+    
+    loop = asyncio.get_running_loop()
+    executor = ProcessPoolExecutor(
+        max_workers=min(len(passwords), config.PASSWORD_HASH_WORKERS),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        return list(await asyncio.gather(*(
+            loop.run_in_executor(executor, get_password_hash, password)
+            for password in passwords
+        )))
+    except Exception as e:
+        logger.warning(f"Process pool hashing failed, using thread pool: {e}")
+        return list(await asyncio.gather(*(get_password_hash_async(password) for password in passwords)))
+    finally:
+        executor.shutdown(wait=False)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -52,6 +121,29 @@ async def verify_token(token: str) -> Optional[dict]:
     except JWTError:
         return None
 
+async def resolve_token_user(token: str) -> Optional[User]:
+    """Resolve JWT token to user (principal cache first, then MongoDB)"""
+    cache = get_principal_cache()
+    user = cache.get(token)
+    if user is not None:
+        return user
+    
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    
+    username: str = payload.get("sub")
+    if username is None:
+        return None
+    
+    from db import get_db
+    db = get_db()
+    user = await db.get_user_by_username(username)
+    if user is not None:
+        cache.put(token, user, payload.get("exp"))
+    return user
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     """Get current user from JWT token"""
     credentials_exception = HTTPException(
@@ -60,17 +152,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    from db import get_db
-    db = get_db()
-    user = await db.get_user_by_username(username)
+    user = await resolve_token_user(credentials.credentials)
     if user is None:
         raise credentials_exception
     
@@ -79,15 +161,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 async def get_current_user_websocket(token: str) -> Optional[User]:
     """Get current user from JWT token for WebSocket"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        
-        from db import get_db
-        db = get_db()
-        user = await db.get_user_by_username(username)
-        return user
+        return await resolve_token_user(token)
     except:
         return None
 
@@ -0,0 +1,137 @@
+"""
+Smart Call Center - Call Distributions
+======================================
+
+Распределения длительностей звонков (ожидание, вызов оператора,
+разговор): гистограммы с накопленной долей (CDF), перцентили,
+среднее и стандартное отклонение, разброс по операторам.
+
+Поля звонков читаются DatabaseManager.get_call_arrays сразу в массивы
+NumPy, без моделей Call; все показатели считаются векторно, по
+операторам - через bincount сумм и сумм квадратов.
+"""
+
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DISTRIBUTION_FIELDS = ("wait_time", "ring_time", "talk_time")
+DEFAULT_PERCENTILES = (50, 75, 90, 95, 99)
+
+def parse_percentiles(value: str) -> List[float]:
+    """Разбор перцентилей вида "50,90,99" (0..100)"""
+    percentiles = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        percentile = float(item)
+        if not 0 <= percentile <= 100:
+            raise ValueError(f"Percentile out of range: {item}")
+        percentiles.append(percentile)
+    return sorted(set(percentiles))
+
+def _percentile_key(percentile: float) -> str:
+    return f"p{percentile:g}"
+
+def summarize(values: "np.ndarray", bins: int, percentiles: List[float],
+              max_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """Сводка распределения: count/mean/std/min/max, перцентили и гистограмма с CDF
+
+    Гистограмма строится на [0, max_seconds] (по умолчанию - до 99-го
+    перцентиля), значения выше попадают в overflow, чтобы единичные
+    выбросы не сжимали все интервалы в первый.
+    """
+    values = values[~np.isnan(values)]
+    count = int(values.size)
+    if count == 0:
+        return {"count": 0}
+
+    # Все перцентили (и граница гистограммы) - одним проходом
+    quantiles = np.percentile(values, list(percentiles) + [99])
+    upper = max(float(max_seconds) if max_seconds else float(np.ceil(quantiles[-1])), 1.0)
+    counts, edges = np.histogram(values, bins=bins, range=(0.0, upper))
+    underflow = int(np.count_nonzero(values < 0))
+    overflow = int(np.count_nonzero(values > upper))
+
+    return {
+        "count": count,
+        "mean": round(float(values.mean()), 2),
+        "std": round(float(values.std()), 2),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "percentiles": {
+            _percentile_key(percentile): round(float(value), 2)
+            for percentile, value in zip(percentiles, quantiles)
+        },
+        "histogram": {
+            "edges": [round(float(edge), 2) for edge in edges],
+            "counts": counts.tolist(),
+            # Доля звонков со значением не выше правой границы интервала
+            "cdf": np.round((np.cumsum(counts) + underflow) / count, 4).tolist(),
+            "overflow": overflow
+        }
+    }
+
+def factorize(labels: "np.ndarray") -> Tuple[List[Any], "np.ndarray"]:
+    """Метки -> (уникальные значения, коды строк; -1 - нет метки)"""
+    codes: Dict[Any, int] = {}
+    index = np.fromiter(
+        (-1 if label is None else codes.setdefault(label, len(codes)) for label in labels),
+        dtype=np.int64, count=len(labels)
+    )
+    return list(codes), index
+
+def per_group(values: "np.ndarray", groups: List[Any], index: "np.ndarray") -> List[Dict[str, Any]]:
+    """Count/mean/std/variance по группам (операторам) за один проход bincount"""
+    mask = (index >= 0) & ~np.isnan(values)
+    values, index = values[mask], index[mask]
+    if values.size == 0:
+        return []
+
+    counts = np.bincount(index, minlength=len(groups))
+    sums = np.bincount(index, weights=values, minlength=len(groups))
+    squares = np.bincount(index, weights=values * values, minlength=len(groups))
+    present = counts > 0
+    means = np.divide(sums, counts, out=np.zeros(len(groups)), where=present)
+    variances = np.maximum(np.divide(squares, counts, out=np.zeros(len(groups)), where=present) - means * means, 0.0)
+
+    order = [i for i in np.argsort(-counts, kind="stable") if present[i]]
+    return [
+        {
+            "group": str(groups[i]),
+            "count": int(counts[i]),
+            "mean": round(float(means[i]), 2),
+            "std": round(float(np.sqrt(variances[i])), 2),
+            "variance": round(float(variances[i]), 2)
+        }
+        for i in order
+    ]
+
+def compute_distributions(arrays: Dict[str, "np.ndarray"], fields: List[str], bins: int,
+                          percentiles: List[float], max_seconds: Optional[float] = None,
+                          group_field: Optional[str] = None) -> Dict[str, Any]:
+    """Распределения по каждому полю и (при group_field) разброс по группам"""
+    started = time.perf_counter()
+    result = {
+        "fields": {
+            field: summarize(arrays[field], bins, percentiles, max_seconds)
+            for field in fields
+        }
+    }
+    if group_field:
+        groups, index = factorize(arrays[group_field])
+        result["groups"] = {
+            field: per_group(arrays[field], groups, index)
+            for field in fields
+        }
+    result["compute_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
@@ -12,9 +12,27 @@ from enum import Enum
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 import logging
+import time
+
+from caller_affinity import get_caller_affinity
+from config import config
+from operator_counters import get_operator_counters
+from number_plan import LatencyTracker, RouteMatch, get_number_plan
+from queue_estimator import AGENT_AVAILABLE, AGENT_BUSY, get_queue_estimator
+from queue_window_stats import WINDOWS_MINUTES, QueueWindowStats
+from skill_router import get_skill_router
 
 logger = logging.getLogger(__name__)
 
+def interface_extension(interface: Optional[str]) -> str:
+    """Extension из interface/имени канала (PJSIP/0001-00000001 -> 0001)"""
+    if not interface:
+        return "unknown"
+    parts = interface.split("/")
+    if len(parts) > 1:
+        return parts[1].split("-")[0]
+    return interface
+
 class CallType(Enum):
     """Типы звонков в системе"""
     INCOMING_QUEUE = "incoming_queue"      # Входящий в очередь
@@ -33,6 +51,11 @@ class CallFlowLogic:
     
     def __init__(self):
         self.config = CallFlowConfig()
+        self.number_plan = get_number_plan()
+        self.queue_estimator = get_queue_estimator()
+        self.skill_router = get_skill_router()
+        self.caller_affinity = get_caller_affinity()
+        self.routing_latency = LatencyTracker()
     
     async def determine_call_routing(self, call_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -42,10 +65,18 @@ class CallFlowLogic:
         1. Анализ входящего номера (DID)
         2. Определение времени работы
         3. Проверка доступности операторов
-        4. Выбор стратегии обработки
-        5. Маршрутизация звонка
+        4. Повторный звонок - к последнему оператору звонящего
+        5. Выбор стратегии обработки
+        6. Маршрутизация звонка
         """
         
+        started = time.perf_counter()
+        try:
+            return await self._determine_call_routing(call_data)
+        finally:
+            self.routing_latency.record(time.perf_counter() - started)
+    
+    async def _determine_call_routing(self, call_data: Dict[str, Any]) -> Dict[str, Any]:
         caller_number = call_data.get("caller_number")
         called_number = call_data.get("called_number") 
         call_time = datetime.utcnow()
@@ -60,20 +91,27 @@ class CallFlowLogic:
                 strategy=CallProcessingStrategy.STASIS_CUSTOM
             )
         
-        # 2. Анализ номера назначения
-        target_type = self._analyze_target_number(called_number)
+        # 2. Анализ номера назначения (один поиск в номерном плане)
+        route = self.number_plan.lookup(called_number)
+        target_type = route.target_type if route else "unknown"
         
         if target_type == "direct_extension":
             # Прямой звонок на extension оператора
             return await self._route_direct_call(call_data)
         
-        elif target_type == "queue_number":
-            # Звонок в очередь
-            return await self._route_queue_call(call_data)
-        
         elif target_type == "service_number":
             # Сервисный номер (IVR, автоответчик и т.д.)
-            return await self._route_service_call(call_data)
+            return await self._route_service_call(call_data, route)
+        
+        # 3. Звонок в очередь: повторный звонящий - к своему последнему оператору
+        queue_name = (route.target if target_type == "queue_number" else None) or self.config.DEFAULT_QUEUE
+        affinity_decision = await self._route_by_affinity(call_data, queue_name)
+        if affinity_decision:
+            return affinity_decision
+        
+        if target_type == "queue_number":
+            # Звонок в очередь
+            return await self._route_queue_call(call_data, queue_name)
         
         else:
             # Неизвестный номер - в общую очередь
@@ -84,10 +122,10 @@ class CallFlowLogic:
         
         called_number = call_data.get("called_number")
         
-        # Проверяем доступность оператора
-        operator = await self._find_operator_by_extension(called_number)
+        # Оператор и его состояние - из индекса маршрутизации в памяти
+        agent = await self._find_operator_by_extension(called_number)
         
-        if not operator:
+        if not agent:
             logger.warning(f"❌ Operator not found for extension {called_number}")
             return self._create_routing_decision(
                 action="dial_unavailable",
@@ -95,7 +133,22 @@ class CallFlowLogic:
                 fallback_queue="support"
             )
         
-        if not await self._is_operator_available(operator):
+        if not await self._is_operator_available(agent):
+            # Замена свободным оператором с теми же навыками
+            if config.SKILL_ROUTING_ENABLED:
+                substitute = self.skill_router.select_operator(agent.skills_mask, exclude={called_number})
+                if substitute:
+                    logger.info(f"🎯 Operator {called_number} unavailable, "
+                                f"routing to {substitute.extension} with same skills")
+                    return self._create_routing_decision(
+                        action="dial_direct",
+                        target_extension=substitute.extension,
+                        operator_id=substitute.operator_id,
+                        strategy=CallProcessingStrategy.STASIS_CUSTOM,
+                        reason="operator_unavailable",
+                        original_target=called_number
+                    )
+            
             logger.info(f"📵 Operator {called_number} unavailable, routing to queue")
             return self._create_routing_decision(
                 action="queue_fallback", 
@@ -104,28 +157,34 @@ class CallFlowLogic:
                 original_target=called_number
             )
         
-        # Оператор доступен - звоним напрямую
+        # Оператор доступен - резервируем и звоним напрямую
+        self.skill_router.reserve(agent)
         return self._create_routing_decision(
             action="dial_direct",
             target_extension=called_number,
-            operator_id=operator.id,
+            operator_id=agent.operator_id,
             strategy=CallProcessingStrategy.STASIS_CUSTOM
         )
     
-    async def _route_queue_call(self, call_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _route_queue_call(self, call_data: Dict[str, Any], queue_name: str) -> Dict[str, Any]:
         """Маршрутизация звонка в очередь"""
         
-        called_number = call_data.get("called_number")
-        queue_name = self._map_number_to_queue(called_number)
+        # Свободный оператор с навыками очереди - звоним ему напрямую
+        if config.SKILL_ROUTING_ENABLED:
+            decision = await self._route_by_skills(queue_name)
+            if decision:
+                return decision
         
         # Проверяем доступность операторов в очереди
         available_operators = await self._get_available_queue_operators(queue_name)
         
-        if not available_operators:
+        # Без данных о составе очереди решение оставляем Asterisk
+        if not available_operators and self.queue_estimator.has_staffing_data(queue_name):
             logger.warning(f"⚠️ No operators available in queue {queue_name}")
             return self._create_routing_decision(
                 action="ivr_no_operators",
                 message="Все операторы заняты",
+                queue_name=queue_name,
                 estimated_wait_time=await self._estimate_wait_time(queue_name)
             )
         
@@ -140,11 +199,99 @@ class CallFlowLogic:
             available_operators=len(available_operators)
         )
     
-    async def _route_service_call(self, call_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _route_by_skills(self, queue_name: str) -> Optional[Dict[str, Any]]:
+        """Выбор оператора по навыкам очереди (ACD в памяти)"""
+        
+        required_mask = self.skill_router.queue_skill_mask(queue_name)
+        if required_mask is None:
+            # Навыки очереди неизвестны - распределяет Asterisk
+            return None
+        
+        queue_strategy = await self._get_queue_strategy(queue_name)
+        agent = self.skill_router.select_operator(required_mask, queue_strategy)
+        if not agent:
+            return None
+        
+        return self._create_routing_decision(
+            action="dial_direct",
+            target_extension=agent.extension,
+            operator_id=agent.operator_id,
+            queue_name=queue_name,
+            strategy=CallProcessingStrategy.STASIS_CUSTOM,
+            queue_strategy=queue_strategy,
+            required_skills=self.skill_router.skills.names(required_mask),
+            reason="skill_match"
+        )
+    
+    async def _route_by_affinity(self, call_data: Dict[str, Any], queue_name: str) -> Optional[Dict[str, Any]]:
+        """Маршрутизация к последнему оператору звонящего (LRU в памяти)"""
+        
+        operator_id = self.caller_affinity.get(call_data.get("caller_number"))
+        if not operator_id:
+            return None
+        
+        agent = self.skill_router.get_agent_by_operator_id(operator_id)
+        if not agent:
+            return None
+        
+        # Оператор должен обслуживать навыки очереди
+        required_mask = self.skill_router.queue_skill_mask(queue_name)
+        if required_mask and agent.skills_mask & required_mask != required_mask:
+            return None
+        
+        if agent.state == AGENT_AVAILABLE:
+            self.skill_router.reserve(agent)
+            self.caller_affinity.routed += 1
+            logger.info(f"🤝 Repeat caller {call_data.get('caller_number')} -> last operator {agent.extension}")
+            return self._create_routing_decision(
+                action="dial_direct",
+                target_extension=agent.extension,
+                operator_id=agent.operator_id,
+                queue_name=queue_name,
+                strategy=CallProcessingStrategy.STASIS_CUSTOM,
+                reason="caller_affinity"
+            )
+        
+        # Оператор на звонке - звонящий может подождать его в пределах бюджета
+        wait_budget = config.CALLER_AFFINITY_WAIT_SECONDS
+        if agent.state == AGENT_BUSY and wait_budget > 0:
+            return self._create_routing_decision(
+                action="affinity_wait",
+                target_extension=agent.extension,
+                operator_id=agent.operator_id,
+                queue_name=queue_name,
+                wait_budget=wait_budget,
+                strategy=CallProcessingStrategy.STASIS_CUSTOM,
+                reason="caller_affinity"
+            )
+        
+        return None
+    
+    async def resolve_affinity_wait(self, call_data: Dict[str, Any], decision: Dict[str, Any]) -> Dict[str, Any]:
+        """Ожидание последнего оператора; по истечении бюджета - обычная маршрутизация в очередь"""
+        
+        self.caller_affinity.waits_started += 1
+        extension = decision["target_extension"]
+        
+        if await self.skill_router.wait_for_agent(extension, decision["wait_budget"]):
+            self.caller_affinity.waits_succeeded += 1
+            self.caller_affinity.routed += 1
+            return self._create_routing_decision(
+                action="dial_direct",
+                target_extension=extension,
+                operator_id=decision.get("operator_id"),
+                queue_name=decision.get("queue_name"),
+                strategy=CallProcessingStrategy.STASIS_CUSTOM,
+                reason="caller_affinity"
+            )
+        
+        logger.info(f"⌛ Operator {extension} not free within {decision['wait_budget']}s, routing to queue")
+        return await self._route_queue_call(call_data, decision.get("queue_name") or self.config.DEFAULT_QUEUE)
+    
+    async def _route_service_call(self, call_data: Dict[str, Any], route: RouteMatch) -> Dict[str, Any]:
         """Маршрутизация сервисного звонка"""
         
-        called_number = call_data.get("called_number")
-        service_type = self._determine_service_type(called_number)
+        service_type = route.target or "ivr_main"
         
         return self._create_routing_decision(
             action=f"service_{service_type}",
@@ -178,46 +325,6 @@ class CallFlowLogic:
         
         return True
     
-    def _analyze_target_number(self, called_number: str) -> str:
-        """Анализ типа номера назначения"""
-        
-        if not called_number:
-            return "unknown"
-        
-        # Прямые extensions операторов (обычно 4-значные)
-        if called_number.isdigit() and len(called_number) == 4:
-            if called_number.startswith(('0', '1', '2')):
-                return "direct_extension"
-        
-        # Номера очередей (обычно с префиксом)
-        if called_number in self.config.QUEUE_NUMBERS:
-            return "queue_number"
-        
-        # Сервисные номера
-        if called_number in self.config.SERVICE_NUMBERS:
-            return "service_number"
-        
-        return "unknown"
-    
-    def _map_number_to_queue(self, called_number: str) -> str:
-        """Маппинг номера на название очереди"""
-        mapping = {
-            "100": "support",
-            "101": "sales", 
-            "102": "technical",
-            "200": "vip"
-        }
-        return mapping.get(called_number, self.config.DEFAULT_QUEUE)
-    
-    def _determine_service_type(self, called_number: str) -> str:
-        """Определение типа сервиса"""
-        services = {
-            "500": "ivr_main",
-            "501": "voicemail",
-            "502": "callback_request"
-        }
-        return services.get(called_number, "ivr_main")
-    
     def _create_routing_decision(self, **kwargs) -> Dict[str, Any]:
         """Создание решения по маршрутизации"""
         decision = {
@@ -230,24 +337,31 @@ class CallFlowLogic:
         return decision
     
     async def _find_operator_by_extension(self, extension: str):
-        """Поиск оператора по extension"""
-        # Заглушка - будет реализована с подключением к БД
-        pass
+        """Поиск оператора по extension (индекс в памяти, при промахе - БД)"""
+        agent = self.skill_router.get_agent(extension)
+        if agent:
+            return agent
+        
+        try:
+            from db import get_db
+            operator = await get_db().get_operator_by_extension(extension)
+        except Exception as e:
+            logger.error(f"Error finding operator by extension {extension}: {e}")
+            return None
+        
+        return self.skill_router.upsert_operator(operator) if operator else None
     
-    async def _is_operator_available(self, operator) -> bool:
-        """Проверка доступности оператора"""
-        # Заглушка - проверка статуса, текущих звонков и т.д.
-        pass
+    async def _is_operator_available(self, agent) -> bool:
+        """Проверка доступности оператора (живое состояние из событий и статусов)"""
+        return agent.state == AGENT_AVAILABLE
     
     async def _get_available_queue_operators(self, queue_name: str) -> List:
-        """Получение доступных операторов в очереди"""
-        # Заглушка - запрос к Asterisk Queue
-        pass
+        """Получение доступных операторов (extensions) в очереди"""
+        return self.queue_estimator.get_available_agents(queue_name)
     
     async def _estimate_wait_time(self, queue_name: str) -> int:
-        """Оценка времени ожидания в очереди"""
-        # Заглушка - анализ текущей загрузки
-        return 180  # 3 минуты по умолчанию
+        """Оценка времени ожидания в очереди (Erlang C по живым метрикам)"""
+        return self.queue_estimator.estimate(queue_name)["expected_wait_seconds"]
     
     async def _get_queue_strategy(self, queue_name: str) -> str:
         """Получение стратегии очереди"""
@@ -258,10 +372,32 @@ class CallFlowLogic:
             "vip": "ringall"
         }
         return strategies.get(queue_name, "leastrecent")
+    
+    def get_routing_stats(self) -> Dict[str, Any]:
+        """Метрики маршрутизации"""
+        return {
+            "decision_latency": self.routing_latency.get_stats(),
+            "number_plan": self.number_plan.get_stats(),
+            "skill_routing": self.skill_router.get_stats(),
+            "caller_affinity": self.caller_affinity.get_stats(),
+            "queue_estimates": self.queue_estimator.get_all_estimates()
+        }
 
 class CallStatisticsProcessor:
     """Обработчик статистики звонков"""
     
+    def __init__(self):
+        self.queues: Dict[str, QueueWindowStats] = {}
+        self.waiting_index: Dict[str, str] = {}  # uniqueid -> очередь
+        self.operator_counters = get_operator_counters()
+    
+    def _queue_stats(self, queue_name: str) -> QueueWindowStats:
+        stats = self.queues.get(queue_name)
+        if stats is None:
+            stats = QueueWindowStats(queue_name)
+            self.queues[queue_name] = stats
+        return stats
+    
     async def process_queue_event(self, event_type: str, event_data: Dict[str, Any]):
         """Обработка событий очереди для статистики"""
         
@@ -282,6 +418,9 @@ class CallStatisticsProcessor:
         
         elif event_type == "QueueMemberUnpause":
             await self._handle_member_unpause(event_data)
+        
+        elif event_type == "AgentRingNoAnswer":
+            await self._handle_ring_no_answer(event_data)
     
     async def _handle_caller_join(self, event_data: Dict[str, Any]):
         """Обработка входа звонящего в очередь"""
@@ -289,6 +428,7 @@ class CallStatisticsProcessor:
         
         # Создаем запись о начале ожидания
         queue_entry = {
+            "uniqueid": event_data.get("Uniqueid"),
             "caller_number": event_data.get("CallerIDNum"),
             "queue_name": event_data.get("Queue"),
             "join_time": datetime.utcnow(),
@@ -307,6 +447,7 @@ class CallStatisticsProcessor:
         
         # Обновляем запись с результатом
         await self._update_queue_entry_result(
+            uniqueid=event_data.get("Uniqueid"),
             caller_number=event_data.get("CallerIDNum"),
             queue_name=event_data.get("Queue"),
             leave_time=datetime.utcnow(),
@@ -320,7 +461,7 @@ class CallStatisticsProcessor:
         # Увеличиваем счетчик предложенных звонков оператору
         await self._increment_operator_stat(
             interface=event_data.get("Interface"),
-            stat_type="offered_calls"
+            stat_type="calls_offered"
         )
     
     async def _handle_bridge_enter(self, event_data: Dict[str, Any]):
@@ -330,21 +471,129 @@ class CallStatisticsProcessor:
         # Это означает что звонок отвечен
         await self._record_call_answered(event_data)
     
+    async def _handle_member_pause(self, event_data: Dict[str, Any]):
+        """Оператор на паузе - начало отсчета времени паузы"""
+        await self.operator_counters.start_pause(
+            self.operator_counters.key_for_extension(interface_extension(event_data.get("Interface")))
+        )
+    
+    async def _handle_member_unpause(self, event_data: Dict[str, Any]):
+        """Оператор снят с паузы - время паузы в счетчик"""
+        await self.operator_counters.end_pause(
+            self.operator_counters.key_for_extension(interface_extension(event_data.get("Interface")))
+        )
+    
+    async def _handle_ring_no_answer(self, event_data: Dict[str, Any]):
+        """Оператор не ответил на звонок из очереди"""
+        logger.info(f"📵 Member ring no answer: {event_data}")
+        await self._increment_operator_stat(
+            interface=event_data.get("Interface"),
+            stat_type="calls_missed"
+        )
+    
     async def _save_queue_entry(self, queue_entry: Dict[str, Any]):
-        """Сохранение записи о входе в очередь"""
-        pass  # Реализация с БД
+        """Вход в очередь: предложенный звонок и новый ожидающий"""
+        queue_name = queue_entry.get("queue_name")
+        if not queue_name:
+            return
+        
+        now = time.time()
+        stats = self._queue_stats(queue_name)
+        stats.ring.add("offered", now=now)
+        
+        key = queue_entry.get("uniqueid") or f"{queue_name}:{queue_entry.get('caller_number')}"
+        stats.waiting[key] = now
+        self.waiting_index[key] = queue_name
     
-    async def _update_queue_entry_result(self, **kwargs):
-        """Обновление результата очереди"""
-        pass  # Реализация с БД
+    async def _update_queue_entry_result(self, uniqueid: Optional[str], caller_number: Optional[str],
+                                         queue_name: Optional[str], leave_time: datetime, reason: Optional[str]):
+        """Выход из очереди: результат ожидания в окна очереди"""
+        key = uniqueid or f"{queue_name}:{caller_number}"
+        queue_name = self.waiting_index.pop(key, None) or queue_name
+        if not queue_name:
+            return
+        
+        now = time.time()
+        stats = self._queue_stats(queue_name)
+        joined = stats.waiting.pop(key, None)
+        wait = now - joined if joined is not None else 0
+        
+        # transfer - звонок передан оператору (отвечен), timeout - истек лимит очереди
+        if reason == "transfer":
+            stats.ring.add("answered", now=now)
+            stats.ring.add("answer_wait_sum", wait, now=now)
+            if wait <= config.SERVICE_LEVEL_TARGET_SECONDS:
+                stats.ring.add("answered_in_sla", now=now)
+        elif reason == "timeout":
+            stats.ring.add("timeout", now=now)
+        else:
+            stats.ring.add("abandoned", now=now)
+            stats.ring.add("abandon_wait_sum", wait, now=now)
+    
+    def get_realtime_queue_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Окна 5/15/60 мин и текущее ожидание по всем очередям (из памяти)"""
+        now = time.time()
+        return {
+            queue_name: stats.snapshot(config.SERVICE_LEVEL_TARGET_SECONDS, now)
+            for queue_name, stats in self.queues.items()
+        }
+    
+    def get_waiting_calls(self) -> int:
+        """Всего звонящих в очередях сейчас"""
+        return len(self.waiting_index)
+    
+    async def load_from_db(self, db):
+        """Восстановление окон за последний час по звонкам в БД"""
+        try:
+            since = datetime.utcnow() - timedelta(minutes=max(WINDOWS_MINUTES))
+            cursor = db.calls.find(
+                {"start_time": {"$gte": since}, "queue_name": {"$ne": None}},
+                {"queue_name": 1, "start_time": 1, "answer_time": 1, "end_time": 1,
+                 "status": 1, "wait_time": 1, "_id": 0}
+            )
+            
+            loaded = 0
+            async for call in cursor:
+                stats = self._queue_stats(call["queue_name"])
+                stats.ring.add("offered", now=QueueWindowStats.timestamp(call["start_time"]))
+                
+                # Выход из очереди: ответ оператора или завершение ожидания
+                status = call.get("status")
+                ended = QueueWindowStats.timestamp(
+                    call.get("answer_time") if status in ("answered", "completed") and call.get("answer_time")
+                    else call.get("end_time")
+                )
+                wait = call.get("wait_time") or 0
+                if ended is not None:
+                    if status in ("answered", "completed"):
+                        stats.ring.add("answered", now=ended)
+                        stats.ring.add("answer_wait_sum", wait, now=ended)
+                        if wait <= config.SERVICE_LEVEL_TARGET_SECONDS:
+                            stats.ring.add("answered_in_sla", now=ended)
+                    elif status == "missed":
+                        stats.ring.add("timeout", now=ended)
+                    elif status == "abandoned":
+                        stats.ring.add("abandoned", now=ended)
+                        stats.ring.add("abandon_wait_sum", wait, now=ended)
+                loaded += 1
+            
+            logger.info(f"📊 Queue window stats restored from {loaded} calls")
+        except Exception as e:
+            logger.error(f"Error restoring queue window stats: {e}")
     
     async def _increment_operator_stat(self, interface: str, stat_type: str):
-        """Увеличение счетчика статистики оператора"""
-        pass  # Реализация с БД
+        """Увеличение счетчика статистики оператора (в памяти, сброс в БД через $inc)"""
+        self.operator_counters.increment(
+            self.operator_counters.key_for_extension(interface_extension(interface)),
+            stat_type
+        )
     
     async def _record_call_answered(self, event_data: Dict[str, Any]):
-        """Запись отвеченного звонка"""
-        pass  # Реализация с БД
+        """Запись отвеченного звонка (канал оператора вошел в bridge)"""
+        extension = interface_extension(event_data.get("channel", {}).get("name"))
+        # Каналы звонящих тоже входят в bridge - считаем только операторов
+        if get_skill_router().get_agent(extension):
+            await self._increment_operator_stat(f"PJSIP/{extension}", "calls_answered")
 
 class CallFlowConfig:
     """Конфигурация логики обработки звонков"""
@@ -356,20 +605,7 @@ class CallFlowConfig:
     # Очереди по умолчанию
     DEFAULT_QUEUE = "support"
     
-    # Маппинг номеров на очереди
-    QUEUE_NUMBERS = {
-        "100": "support",
-        "101": "sales",
-        "102": "technical", 
-        "200": "vip"
-    }
-    
-    # Сервисные номера
-    SERVICE_NUMBERS = {
-        "500": "ivr_main",
-        "501": "voicemail", 
-        "502": "callback"
-    }
+    # Номера очередей и сервисные номера - в номерном плане (number_plan.py)
     
     # Таймауты
     OPERATOR_RING_TIMEOUT = 25  # секунд
@@ -0,0 +1,287 @@
+"""
+Smart Call Center - CEL Call Legs
+=================================
+
+Сборка плеч звонков из CEL (Channel Event Logging) Asterisk.
+
+Документ calls описывает звонок целиком, поэтому переводы и
+многоплечевые звонки в нем "схлопываются". CEL читается потоком,
+упорядоченным по linkedid: события одного звонка идут подряд, и дерево
+звонка собирается за один проход. Звонок, пересекающий границу периода,
+читается целиком, поэтому повторная сборка соседнего периода дает то же
+плечо, а не усеченное. Для каждого канала (плеча)
+сохраняются время вызова, разговора и удержания и цель перевода в
+компактную коллекцию call_legs (индексы по linkedid и operator_id),
+откуда время разговора операторов считается одной агрегацией.
+
+Перевод отмечается в документе calls отдельными полями transferred,
+transfer_type и transfer_target: статус звонка (answered и т.д.) не
+меняется, поэтому статистика по отвеченным звонкам не искажается.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateMany, UpdateOne
+
+from config import config
+from call_flow_logic import interface_extension
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_EVENTS = {"BLINDTRANSFER": "blind", "ATTENDEDTRANSFER": "attended"}
+
+def _seconds(start: Optional[datetime], end: Optional[datetime]) -> int:
+    if not start or not end:
+        return 0
+    return max(int(round((end - start).total_seconds())), 0)
+
+def _parse_extra(value) -> Dict[str, Any]:
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return value
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return {}
+
+def build_call_legs(events: List[Dict[str, Any]], operators_by_extension: Dict[str, str]) -> List[Dict[str, Any]]:
+    """События CEL одного linkedid (по времени) -> плечи звонка"""
+    legs: Dict[str, Dict[str, Any]] = {}
+    bridged_at: Dict[str, datetime] = {}
+    held_at: Dict[str, datetime] = {}
+
+    for event in events:
+        uniqueid = event["uniqueid"]
+        channel = event.get("channame") or ""
+        # Local-каналы - служебные половинки dialplan, отдельным плечом не считаются
+        if channel.startswith("Local/"):
+            continue
+
+        moment = event["eventtime"]
+        leg = legs.get(uniqueid)
+        if leg is None:
+            extension = interface_extension(channel)
+            leg = legs[uniqueid] = {
+                "uniqueid": uniqueid,
+                "linkedid": event["linkedid"],
+                "channel": channel,
+                "role": "caller" if uniqueid == event["linkedid"] else "agent",
+                "extension": extension,
+                "operator_id": operators_by_extension.get(extension),
+                "caller_number": event.get("cid_num"),
+                "start_time": moment,
+                "answer_time": None,
+                "end_time": None,
+                "ring_time": 0,
+                "talk_time": 0,
+                "hold_time": 0,
+                "transfer_type": None,
+                "transfer_target": None
+            }
+
+        event_type = event["eventtype"]
+        if event_type == "CHAN_START":
+            leg["start_time"] = moment
+        elif event_type == "ANSWER":
+            leg["answer_time"] = leg["answer_time"] or moment
+        elif event_type == "BRIDGE_ENTER":
+            bridged_at.setdefault(uniqueid, moment)
+        elif event_type == "BRIDGE_EXIT":
+            leg["talk_time"] += _seconds(bridged_at.pop(uniqueid, None), moment)
+        elif event_type == "HOLD":
+            held_at.setdefault(uniqueid, moment)
+        elif event_type == "UNHOLD":
+            leg["hold_time"] += _seconds(held_at.pop(uniqueid, None), moment)
+        elif event_type in TRANSFER_EVENTS:
+            extra = _parse_extra(event.get("extra"))
+            leg["transfer_type"] = TRANSFER_EVENTS[event_type]
+            if event_type == "BLINDTRANSFER":
+                leg["transfer_target"] = extra.get("extension")
+            else:
+                target = extra.get("transfer_target_channel_name") or extra.get("channel2_name")
+                leg["transfer_target"] = interface_extension(target) if target else None
+        elif event_type in ("HANGUP", "CHAN_END"):
+            leg["end_time"] = leg["end_time"] or moment
+
+    for uniqueid, leg in legs.items():
+        end_time = leg["end_time"] or events[-1]["eventtime"]
+        # Незакрытые интервалы (обрыв без BRIDGE_EXIT/UNHOLD) закрываются концом канала
+        leg["talk_time"] += _seconds(bridged_at.get(uniqueid), end_time)
+        leg["hold_time"] += _seconds(held_at.get(uniqueid), end_time)
+        # Время разговора без удержания
+        leg["talk_time"] = max(leg["talk_time"] - leg["hold_time"], 0)
+        leg["ring_time"] = _seconds(leg["start_time"], leg["answer_time"] or end_time)
+        leg["end_time"] = end_time
+
+    return list(legs.values())
+
+class CallLegBuilder:
+    """Пересборка call_legs из CEL за период"""
+
+    def __init__(self, fetch_size: int = None):
+        self.fetch_size = fetch_size or config.CEL_FETCH_SIZE
+        self._task: Optional[asyncio.Task] = None
+
+        # Состояние последней пересборки
+        self.last_range: Optional[Tuple[datetime, datetime]] = None
+        self.last_started_at: Optional[datetime] = None
+        self.last_finished_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.events_processed = 0
+        self.calls_built = 0
+        self.legs_written = 0
+        self.transferred_calls = 0
+        self.last_duration_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _write_trees(self, db, trees: List[List[Dict[str, Any]]], operators_by_extension: Dict[str, str]):
+        """Плечи порции звонков - один bulk_write; переводы отмечаются в calls без смены статуса"""
+        operations = []
+        transfers = []
+        for events in trees:
+            legs = build_call_legs(events, operators_by_extension)
+            operations.extend(UpdateOne({"uniqueid": leg["uniqueid"]}, {"$set": leg}, upsert=True) for leg in legs)
+
+            # При нескольких переводах в дереве - тип и цель последнего плеча с переводом
+            transfer_legs = [leg for leg in legs if leg["transfer_type"]]
+            if transfer_legs:
+                linkedid = events[0]["linkedid"]
+                transfers.append(UpdateMany(
+                    {"$or": [{"uniqueid": linkedid}, {"channel_id": linkedid}]},
+                    {"$set": {
+                        "transferred": True,
+                        "transfer_type": transfer_legs[-1]["transfer_type"],
+                        "transfer_target": transfer_legs[-1]["transfer_target"]
+                    }}
+                ))
+
+        if operations:
+            await db.call_legs.bulk_write(operations, ordered=False)
+        if transfers:
+            await db.calls.bulk_write(transfers, ordered=False)
+
+        self.calls_built += len(trees)
+        self.legs_written += len(operations)
+        self.transferred_calls += len(transfers)
+
+    async def rebuild(self, db, asterisk_db, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        """Один проход по CEL за период: группировка по linkedid и запись плеч"""
+        started = time.perf_counter()
+        self.last_range = (start_date, end_date)
+        self.last_started_at = datetime.utcnow()
+        self.last_error = None
+        self.events_processed = self.calls_built = self.legs_written = self.transferred_calls = 0
+
+        operators_by_extension = {
+            operator["extension"]: operator["id"]
+            async for operator in db.operators.find({"extension": {"$ne": None}}, {"extension": 1, "id": 1, "_id": 0})
+        }
+
+        current: List[Dict[str, Any]] = []
+        async for chunk in asterisk_db.stream_cel(start_date, end_date, self.fetch_size):
+            trees = []
+            for event in chunk:
+                if current and event["linkedid"] != current[0]["linkedid"]:
+                    trees.append(current)
+                    current = []
+                current.append(event)
+            # Последний звонок порции может продолжиться в следующей - переносим
+            await self._write_trees(db, trees, operators_by_extension)
+            self.events_processed += len(chunk)
+            await asyncio.sleep(0)
+
+        if current:
+            await self._write_trees(db, [current], operators_by_extension)
+
+        self.last_finished_at = datetime.utcnow()
+        self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        logger.info(f"🔀 Call legs rebuilt: {self.events_processed} CEL events -> {self.calls_built} calls, "
+                    f"{self.legs_written} legs, {self.transferred_calls} transferred in {self.last_duration_ms} ms")
+        return self.get_stats()
+
+    def start_rebuild(self, db, asterisk_db, start_date: datetime, end_date: datetime) -> bool:
+        """Пересборка в фоне; False - предыдущая еще выполняется"""
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self._run_rebuild(db, asterisk_db, start_date, end_date))
+        return True
+
+    async def _run_rebuild(self, db, asterisk_db, start_date: datetime, end_date: datetime):
+        try:
+            await self.rebuild(db, asterisk_db, start_date, end_date)
+        except Exception as e:
+            self.last_error = str(e)
+            self.last_finished_at = datetime.utcnow()
+            logger.error(f"Error rebuilding call legs: {e}")
+
+    async def get_operator_summary(self, db, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
+        """Время разговора, удержания и переводы операторов по плечам звонков"""
+        pipeline = [
+            {"$match": {
+                "start_time": {"$gte": start_date, "$lt": end_date},
+                "operator_id": {"$ne": None}
+            }},
+            {"$group": {
+                "_id": "$operator_id",
+                "legs": {"$sum": 1},
+                "answered_legs": {"$sum": {"$cond": [{"$ne": ["$answer_time", None]}, 1, 0]}},
+                "talk_time": {"$sum": "$talk_time"},
+                "hold_time": {"$sum": "$hold_time"},
+                "ring_time": {"$sum": "$ring_time"},
+                "transfers": {"$sum": {"$cond": [{"$ne": ["$transfer_type", None]}, 1, 0]}}
+            }},
+            {"$sort": {"talk_time": -1}}
+        ]
+
+        summary = []
+        async for result in db.call_legs.aggregate(pipeline):
+            answered = result["answered_legs"]
+            summary.append({
+                "operator_id": result["_id"],
+                "legs": result["legs"],
+                "answered_legs": answered,
+                "talk_time": result["talk_time"],
+                "hold_time": result["hold_time"],
+                "avg_talk_time": round(result["talk_time"] / answered, 2) if answered else 0.0,
+                "avg_ring_time": round(result["ring_time"] / result["legs"], 2) if result["legs"] else 0.0,
+                "transfers": result["transfers"]
+            })
+        return summary
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "fetch_size": self.fetch_size,
+            "range": {
+                "start_date": self.last_range[0].isoformat(),
+                "end_date": self.last_range[1].isoformat()
+            } if self.last_range else None,
+            "started_at": self.last_started_at.isoformat() if self.last_started_at else None,
+            "finished_at": self.last_finished_at.isoformat() if self.last_finished_at else None,
+            "events_processed": self.events_processed,
+            "calls_built": self.calls_built,
+            "legs_written": self.legs_written,
+            "transferred_calls": self.transferred_calls,
+            "duration_ms": self.last_duration_ms,
+            "error": self.last_error
+        }
+
+# Глобальный экземпляр
+_call_leg_builder: Optional[CallLegBuilder] = None
+
+def get_call_leg_builder() -> CallLegBuilder:
+    """Получение глобального сборщика плеч звонков"""
+    global _call_leg_builder
+    if _call_leg_builder is None:
+        _call_leg_builder = CallLegBuilder()
+    return _call_leg_builder
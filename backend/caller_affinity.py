@@ -0,0 +1,127 @@
+"""
+Smart Call Center - Caller Affinity Index
+=========================================
+
+Индекс "звонящий -> последний оператор" для маршрутизации повторных
+звонков к оператору, который уже помогал клиенту.
+
+Ограниченный LRU в памяти: поиск и обновление за O(1). Прогревается
+из недавних звонков при старте и обновляется на каждом отвеченном
+звонке.
+"""
+
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from config import config
+from number_plan import normalize_number
+
+logger = logging.getLogger(__name__)
+
+class CallerAffinityIndex:
+    """LRU: номер звонящего -> id последнего оператора"""
+
+    def __init__(self, max_size: int = None, history_days: int = None):
+        self.max_size = config.CALLER_AFFINITY_MAX_SIZE if max_size is None else max_size
+        self.history_days = history_days or config.CALLER_AFFINITY_HISTORY_DAYS
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.routed = 0
+        self.waits_started = 0
+        self.waits_succeeded = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, caller_number: Optional[str]) -> Optional[str]:
+        """Последний оператор звонящего (id) или None"""
+        key = normalize_number(caller_number)
+        if not self.enabled or not key:
+            return None
+
+        operator_id = self._entries.get(key)
+        if operator_id is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return operator_id
+
+    def record(self, caller_number: Optional[str], operator_id: Optional[str]):
+        """Отвеченный звонок: запоминаем оператора"""
+        key = normalize_number(caller_number)
+        if not self.enabled or not key or not operator_id:
+            return
+
+        self._entries[key] = operator_id
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def forget_operator(self, operator_id: str):
+        """Удаление привязок оператора (оператор удален)"""
+        for key in [key for key, value in self._entries.items() if value == operator_id]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    async def load_from_db(self, db):
+        """Прогрев по недавним отвеченным звонкам (от старых к новым)"""
+        if not self.enabled:
+            return
+
+        try:
+            since = datetime.utcnow() - timedelta(days=self.history_days)
+            cursor = db.calls.find(
+                {
+                    "start_time": {"$gte": since},
+                    "operator_id": {"$ne": None},
+                    "answer_time": {"$ne": None}
+                },
+                {"caller_number": 1, "operator_id": 1, "_id": 0}
+            ).sort("start_time", -1).limit(self.max_size)
+
+            recent = [call async for call in cursor]
+            for call in reversed(recent):
+                self.record(call.get("caller_number"), call.get("operator_id"))
+
+            logger.info(f"🤝 Caller affinity warmed up: {len(self._entries)} callers "
+                        f"from {len(recent)} calls in {self.history_days} days")
+        except Exception as e:
+            logger.error(f"Error warming up caller affinity: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "routed": self.routed,
+            "waits_started": self.waits_started,
+            "waits_succeeded": self.waits_succeeded,
+            "wait_budget_seconds": config.CALLER_AFFINITY_WAIT_SECONDS
+        }
+
+# Глобальный экземпляр
+_caller_affinity: Optional[CallerAffinityIndex] = None
+
+def get_caller_affinity() -> CallerAffinityIndex:
+    """Получение глобального индекса привязки звонящих"""
+    global _caller_affinity
+    if _caller_affinity is None:
+        _caller_affinity = CallerAffinityIndex()
+    return _caller_affinity
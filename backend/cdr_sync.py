@@ -0,0 +1,263 @@
+"""
+Smart Call Center - CDR Sync Worker
+===================================
+
+Фоновая синхронизация таблицы cdr Asterisk в коллекцию cdr_records.
+
+Таблица читается порциями по отметке (calldate, uniqueid) через
+keyset-пагинацию, поэтому даже большая дозагрузка истории не держит
+таблицу в памяти. Каждая порция записывается одним bulk_write с upsert
+по uniqueid, после чего отметка сохраняется в sync_state - после
+перезапуска синхронизация продолжается с того же места.
+
+CDR пишется по окончании звонка с calldate = время начала, поэтому
+длинные звонки появляются "позади" отметки. Для них окно
+CDR_SYNC_LOOKBACK_SECONDS перед отметкой периодически перечитывается
+(upsert идемпотентен).
+
+Синхронизацию выполняет только один воркер - владелец аренды
+"cdr_sync" (worker_lease); отметка перечитывается из sync_state перед
+каждым проходом, поэтому новый владелец и сброс отметки из любого
+воркера продолжают с актуального места.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from config import config
+from worker_lease import WorkerLease
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_ID = "cdr"
+
+# Отметка синхронизации: (calldate, uniqueid) последней записанной строки
+Checkpoint = Tuple[datetime, str]
+
+class CdrSyncWorker:
+    """Инкрементальная синхронизация CDR -> MongoDB"""
+
+    def __init__(self, interval: float = None, batch_size: int = None,
+                 lookback_seconds: int = None, rescan_interval: float = None):
+        self.interval = interval or config.CDR_SYNC_INTERVAL
+        self.batch_size = batch_size or config.CDR_SYNC_BATCH_SIZE
+        self.lookback_seconds = config.CDR_SYNC_LOOKBACK_SECONDS if lookback_seconds is None else lookback_seconds
+        self.rescan_interval = rescan_interval or config.CDR_SYNC_RESCAN_INTERVAL
+
+        self.checkpoint: Optional[Checkpoint] = None
+        self._sync_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._db = None
+        self.lease = WorkerLease("cdr_sync")
+        self._last_rescan = 0.0
+        self.running = False
+
+        # Метрики
+        self.rows_synced = 0
+        self.rows_rescanned = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_batch_ms = 0.0
+        self.last_sync_at: Optional[datetime] = None
+        self.source_max_calldate: Optional[datetime] = None
+        self.lag_seconds: Optional[float] = None
+
+    # === ОТМЕТКА ===
+
+    async def load_checkpoint(self, db):
+        doc = await db.sync_state.find_one({"_id": CHECKPOINT_ID})
+        if doc and doc.get("calldate"):
+            self.checkpoint = (doc["calldate"], doc.get("uniqueid", ""))
+        else:
+            self.checkpoint = None
+
+    async def save_checkpoint(self, db, rows: int = 0):
+        calldate, uniqueid = self.checkpoint
+        await db.sync_state.update_one(
+            {"_id": CHECKPOINT_ID},
+            {"$set": {
+                "calldate": calldate,
+                "uniqueid": uniqueid,
+                "updated_at": datetime.utcnow()
+            }, "$inc": {"rows_synced": rows}},
+            upsert=True
+        )
+
+    async def reset_checkpoint(self, db, since: Optional[datetime] = None):
+        """Перезапуск синхронизации с даты (None - с начала таблицы)"""
+        async with self._sync_lock:
+            self.checkpoint = (since, "") if since else None
+            if self.checkpoint:
+                await self.save_checkpoint(db)
+            else:
+                await db.sync_state.delete_one({"_id": CHECKPOINT_ID})
+
+    # === СИНХРОНИЗАЦИЯ ===
+
+    @staticmethod
+    def _to_document(row: Dict[str, Any], synced_at: datetime) -> Dict[str, Any]:
+        document = dict(row)
+        document["uniqueid"] = str(document.get("uniqueid") or "")
+        document["synced_at"] = synced_at
+        return document
+
+    async def _sync_range(self, db, asterisk_db, after: Optional[Checkpoint],
+                          until: Optional[datetime] = None,
+                          advance: bool = True) -> int:
+        """Keyset-проход от отметки порциями batch_size; в памяти - только одна порция"""
+        total = 0
+        position = after
+
+        while True:
+            rows = await asterisk_db.get_cdr_batch_after(
+                position[0] if position else None,
+                position[1] if position else "",
+                self.batch_size
+            )
+            if until is not None:
+                rows = [row for row in rows if row["calldate"] <= until]
+            if not rows:
+                break
+
+            started = time.perf_counter()
+            synced_at = datetime.utcnow()
+            operations = [
+                UpdateOne({"uniqueid": document["uniqueid"]}, {"$set": document}, upsert=True)
+                for document in (self._to_document(row, synced_at) for row in rows)
+            ]
+            await db.cdr_records.bulk_write(operations, ordered=False)
+            self.last_batch_ms = round((time.perf_counter() - started) * 1000, 2)
+            self.batches += 1
+            total += len(rows)
+
+            last = rows[-1]
+            position = (last["calldate"], str(last["uniqueid"]))
+            if advance:
+                self.checkpoint = position
+                await self.save_checkpoint(db, len(rows))
+
+            if len(rows) < self.batch_size:
+                break
+            # Отдаем управление циклу событий между порциями дозагрузки
+            await asyncio.sleep(0)
+
+        return total
+
+    async def sync_once(self, db, asterisk_db) -> int:
+        """Догнать таблицу cdr от сохраненной отметки"""
+        async with self._sync_lock:
+            await self.load_checkpoint(db)
+
+            synced = await self._sync_range(db, asterisk_db, self.checkpoint)
+            self.rows_synced += synced
+            self.last_sync_at = datetime.utcnow()
+            await self._update_lag(asterisk_db)
+
+            if synced:
+                logger.info(f"📞 CDR sync: {synced} records, checkpoint {self.checkpoint[0]}")
+            return synced
+
+    async def rescan(self, db, asterisk_db) -> int:
+        """Перечитывание окна перед отметкой: CDR длинных звонков, записанные позже"""
+        async with self._sync_lock:
+            if not self.checkpoint or not self.lookback_seconds:
+                return 0
+
+            calldate, _ = self.checkpoint
+            after = (calldate - timedelta(seconds=self.lookback_seconds), "")
+            rescanned = await self._sync_range(db, asterisk_db, after, until=calldate, advance=False)
+            self.rows_rescanned += rescanned
+            return rescanned
+
+    async def _update_lag(self, asterisk_db):
+        self.source_max_calldate = await asterisk_db.get_cdr_max_calldate()
+        if self.source_max_calldate is None:
+            self.lag_seconds = 0.0
+        elif self.checkpoint is None:
+            self.lag_seconds = None
+        else:
+            self.lag_seconds = max((self.source_max_calldate - self.checkpoint[0]).total_seconds(), 0.0)
+
+    # === ФОНОВАЯ ЗАДАЧА ===
+
+    def start(self, db=None):
+        """Запуск фоновой синхронизации"""
+        if self._task is None or self._task.done():
+            self.running = True
+            self._task = asyncio.create_task(self._run(db))
+            logger.info("🔄 CDR sync worker started")
+
+    async def stop(self):
+        """Остановка фоновой синхронизации"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._db is not None:
+            await self.lease.stop(self._db)
+
+    async def _run(self, db):
+        from asterisk_database import get_asterisk_db_manager
+
+        if db is None:
+            from db import get_db
+            db = get_db()
+        self._db = db
+        self.lease.start(db)
+
+        while self.running:
+            asterisk_db = get_asterisk_db_manager()
+            # БД Asterisk подключается из настроек администратора - до этого просто ждем;
+            # остальные воркеры ждут, пока освободится аренда
+            if asterisk_db and asterisk_db.connected and await self.lease.acquire(db):
+                try:
+                    await self.sync_once(db, asterisk_db)
+                    if time.monotonic() - self._last_rescan >= self.rescan_interval:
+                        self._last_rescan = time.monotonic()
+                        await self.rescan(db, asterisk_db)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Error syncing CDR: {e}")
+
+            await asyncio.sleep(self.interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "lease": self.lease.get_stats(),
+            "interval": self.interval,
+            "batch_size": self.batch_size,
+            "checkpoint": {
+                "calldate": self.checkpoint[0].isoformat(),
+                "uniqueid": self.checkpoint[1]
+            } if self.checkpoint else None,
+            "source_max_calldate": self.source_max_calldate.isoformat() if self.source_max_calldate else None,
+            "lag_seconds": self.lag_seconds,
+            "rows_synced": self.rows_synced,
+            "rows_rescanned": self.rows_rescanned,
+            "batches": self.batches,
+            "errors": self.errors,
+            "last_batch_ms": self.last_batch_ms,
+            "last_sync_at": self.last_sync_at.isoformat() if self.last_sync_at else None
+        }
+
+# Глобальный экземпляр
+_cdr_sync_worker: Optional[CdrSyncWorker] = None
+
+def get_cdr_sync_worker() -> CdrSyncWorker:
+    """Получение глобального воркера синхронизации CDR"""
+    global _cdr_sync_worker
+    if _cdr_sync_worker is None:
+        _cdr_sync_worker = CdrSyncWorker()
+    return _cdr_sync_worker
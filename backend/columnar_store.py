@@ -0,0 +1,662 @@
+"""
+Smart Call Center - Columnar Store
+==================================
+
+Локальное колоночное хранилище для отчетов за длинные периоды.
+
+Фоновый экспортер выгружает закрытые дни calls и cdr_records в Parquet
+с разбиением по дням:
+
+    {COLUMNAR_STORE_PATH}/calls/date=2024-01-31/part-0.parquet
+
+День закрыт, когда с его конца прошло COLUMNAR_EXPORT_SETTLE_SECONDS
+(звонки, начатые в 23:59, уже завершены). Файл пишется во временный с
+уникальным именем и атомарно переименовывается, поэтому читатель не
+видит половину дня, а параллельные записи одного дня не смешиваются.
+
+Выгружает один воркер - владелец аренды "columnar_export"
+(worker_lease); остальные воркеры периодически пересканируют каталог.
+Выгруженные дни, строки которых изменились позже (правки звонков -
+updated_at, поздние CDR - synced_at), выгружаются повторно.
+
+Отчет за период читает выгруженные дни из файлов встроенной DuckDB
+(без нее - memory-mapped Arrow + NumPy), а в MongoDB идет только за
+днями без файла: текущим и еще не выгруженными.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from config import config
+from worker_lease import WorkerLease
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+PARTITION_FILE = "part-0.parquet"
+
+# Запас при проверке измененных строк на записи, выполнявшиеся во время проверки (сек)
+CHANGE_CHECK_MARGIN_SECONDS = 60
+
+ANSWERED_STATUSES = ("answered", "completed", "transferred")
+
+def _sql_list(values: Tuple[str, ...]) -> str:
+    return ", ".join(f"'{value}'" for value in values)
+
+def _answered(columns: Dict[str, "np.ndarray"]) -> "np.ndarray":
+    return np.isin(columns["status"], ANSWERED_STATUSES)
+
+# Метрика дня - сумма значения строки, одно определение для трех движков:
+# имя -> (выражение MongoDB для $sum, выражение SQL для SUM, значения NumPy по колонкам)
+CALL_METRICS: Dict[str, Tuple[Any, str, Callable]] = {
+    "calls": (
+        1,
+        "1",
+        lambda c: np.ones(len(c["status"]))
+    ),
+    "answered": (
+        {"$cond": [{"$in": ["$status", list(ANSWERED_STATUSES)]}, 1, 0]},
+        f"CASE WHEN status IN ({_sql_list(ANSWERED_STATUSES)}) THEN 1 ELSE 0 END",
+        _answered
+    ),
+    "missed": (
+        {"$cond": [{"$eq": ["$status", "missed"]}, 1, 0]},
+        "CASE WHEN status = 'missed' THEN 1 ELSE 0 END",
+        lambda c: c["status"] == "missed"
+    ),
+    "abandoned": (
+        {"$cond": [{"$eq": ["$status", "abandoned"]}, 1, 0]},
+        "CASE WHEN status = 'abandoned' THEN 1 ELSE 0 END",
+        lambda c: c["status"] == "abandoned"
+    ),
+    "wait_time": (
+        {"$ifNull": ["$wait_time", 0]},
+        "COALESCE(wait_time, 0)",
+        lambda c: np.nan_to_num(c["wait_time"])
+    ),
+    "waited": (
+        {"$cond": [{"$gt": ["$wait_time", None]}, 1, 0]},
+        "CASE WHEN wait_time IS NOT NULL THEN 1 ELSE 0 END",
+        lambda c: ~np.isnan(c["wait_time"])
+    ),
+    "talk_time": (
+        {"$cond": [{"$in": ["$status", list(ANSWERED_STATUSES)]}, {"$ifNull": ["$talk_time", 0]}, 0]},
+        f"CASE WHEN status IN ({_sql_list(ANSWERED_STATUSES)}) THEN COALESCE(talk_time, 0) ELSE 0 END",
+        lambda c: np.where(_answered(c), np.nan_to_num(c["talk_time"]), 0)
+    ),
+    "answered_in_sla": (
+        {"$cond": [{"$and": [
+            {"$in": ["$status", list(ANSWERED_STATUSES)]},
+            {"$gt": ["$wait_time", None]},
+            {"$lte": ["$wait_time", config.SERVICE_LEVEL_TARGET_SECONDS]}
+        ]}, 1, 0]},
+        f"CASE WHEN status IN ({_sql_list(ANSWERED_STATUSES)}) "
+        f"AND wait_time <= {int(config.SERVICE_LEVEL_TARGET_SECONDS)} THEN 1 ELSE 0 END",
+        lambda c: _answered(c) & (np.nan_to_num(c["wait_time"], nan=np.inf) <= config.SERVICE_LEVEL_TARGET_SECONDS)
+    )
+}
+
+CDR_METRICS: Dict[str, Tuple[Any, str, Callable]] = {
+    "calls": (
+        1,
+        "1",
+        lambda c: np.ones(len(c["disposition"]))
+    ),
+    **{
+        name: (
+            {"$cond": [{"$eq": ["$disposition", disposition]}, 1, 0]},
+            f"CASE WHEN disposition = '{disposition}' THEN 1 ELSE 0 END",
+            lambda c, disposition=disposition: c["disposition"] == disposition
+        )
+        for name, disposition in (
+            ("answered", "ANSWERED"), ("no_answer", "NO ANSWER"), ("busy", "BUSY"), ("failed", "FAILED")
+        )
+    },
+    "billsec": (
+        {"$ifNull": ["$billsec", 0]},
+        "COALESCE(billsec, 0)",
+        lambda c: np.nan_to_num(c["billsec"])
+    ),
+    "duration": (
+        {"$ifNull": ["$duration", 0]},
+        "COALESCE(duration, 0)",
+        lambda c: np.nan_to_num(c["duration"])
+    )
+}
+
+# Выгружаемые наборы: коллекция, поле времени (день партиции), колонки и их типы
+DATASETS: Dict[str, Dict[str, Any]] = {
+    "calls": {
+        "collection": "calls",
+        "time_field": "start_time",
+        "columns": {
+            "id": "string",
+            "uniqueid": "string",
+            "start_time": "timestamp",
+            "answer_time": "timestamp",
+            "end_time": "timestamp",
+            "status": "string",
+            "call_type": "string",
+            "queue_name": "string",
+            "operator_id": "string",
+            "caller_number": "string",
+            "wait_time": "int",
+            "ring_time": "int",
+            "talk_time": "int"
+        },
+        "metrics": CALL_METRICS,
+        # Время последнего изменения строки (повторная выгрузка дня)
+        "changed_field": "updated_at",
+        "local_time": False
+    },
+    "cdr": {
+        "collection": "cdr_records",
+        "time_field": "calldate",
+        "columns": {
+            "uniqueid": "string",
+            "calldate": "timestamp",
+            "src": "string",
+            "dst": "string",
+            "dcontext": "string",
+            "disposition": "string",
+            "accountcode": "string",
+            "duration": "int",
+            "billsec": "int"
+        },
+        "metrics": CDR_METRICS,
+        "changed_field": "synced_at",
+        # calldate - локальное время АТС
+        "local_time": True
+    }
+}
+
+def _to_string(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value if isinstance(value, str) else str(value)
+
+def _to_int(value) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_timestamp(value) -> Optional[datetime]:
+    return value if isinstance(value, datetime) else None
+
+CONVERTERS = {"string": _to_string, "int": _to_int, "timestamp": _to_timestamp}
+
+def _arrow_schema(columns: Dict[str, str]) -> "pa.Schema":
+    types = {"string": pa.string(), "int": pa.int64(), "timestamp": pa.timestamp("ms")}
+    return pa.schema([(name, types[kind]) for name, kind in columns.items()])
+
+def _day_range(start_day: date, end_day: date) -> List[date]:
+    """Дни [start_day, end_day] включительно"""
+    return [start_day + timedelta(days=offset) for offset in range((end_day - start_day).days + 1)]
+
+def _day_runs(days: List[date]) -> List[Tuple[date, date]]:
+    """Отсортированные дни -> непрерывные интервалы [первый, последний]"""
+    runs: List[Tuple[date, date]] = []
+    for day in days:
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+def _derive(dataset: str, sums: Dict[str, float]) -> Dict[str, Any]:
+    """Суммы дня/периода -> показатели отчета"""
+    point = {name: int(value) for name, value in sums.items()}
+    calls, answered = point["calls"], point["answered"]
+    point["answer_rate"] = round(answered / calls * 100, 2) if calls else 0.0
+
+    if dataset == "calls":
+        point["avg_wait_time"] = round(point["wait_time"] / point["waited"], 2) if point["waited"] else 0.0
+        point["avg_talk_time"] = round(point["talk_time"] / answered, 2) if answered else 0.0
+        point["service_level"] = round(point["answered_in_sla"] / calls * 100, 2) if calls else 0.0
+    else:
+        point["avg_talk_time"] = round(point["billsec"] / answered, 2) if answered else 0.0
+    return point
+
+class ColumnarStore:
+    """Экспорт закрытых дней в Parquet и отчеты по ним с дочитыванием открытых дней из MongoDB"""
+
+    def __init__(self, path: str = None, interval: float = None,
+                 settle_seconds: int = None, max_days_per_run: int = None):
+        self.path = Path(config.COLUMNAR_STORE_PATH if path is None else path)
+        self.interval = interval or config.COLUMNAR_EXPORT_INTERVAL
+        self.settle_seconds = config.COLUMNAR_EXPORT_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+        self.max_days_per_run = max_days_per_run or config.COLUMNAR_EXPORT_MAX_DAYS
+        self.cdr_offset = timedelta(minutes=config.ASTERISK_CDR_UTC_OFFSET_MINUTES)
+
+        # Набор -> выгруженные дни (по файлам партиций)
+        self._exported: Dict[str, Set[date]] = {}
+        self._scanned_at: Dict[str, float] = {}
+        self._export_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._db = None
+        self.lease = WorkerLease("columnar_export")
+        self.running = False
+
+        # Метрики
+        self.days_exported = 0
+        self.days_refreshed = 0
+        self.rows_exported = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_export_at: Optional[datetime] = None
+        self.last_export_ms = 0.0
+        self.queries = 0
+        self.last_query_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return PYARROW_AVAILABLE and bool(str(self.path))
+
+    @property
+    def engine(self) -> str:
+        if not self.enabled:
+            return "mongodb"
+        return "duckdb" if DUCKDB_AVAILABLE else "arrow"
+
+    # === ПАРТИЦИИ ===
+
+    def _partition_path(self, dataset: str, day: date) -> Path:
+        return self.path / dataset / f"date={day.isoformat()}" / PARTITION_FILE
+
+    def _scan_partitions(self, dataset: str) -> Set[date]:
+        days = set()
+        root = self.path / dataset
+        if root.is_dir():
+            for entry in os.scandir(root):
+                if entry.name.startswith("date=") and os.path.exists(os.path.join(entry.path, PARTITION_FILE)):
+                    try:
+                        days.add(date.fromisoformat(entry.name[5:]))
+                    except ValueError:
+                        continue
+        return days
+
+    def exported_days(self, dataset: str) -> Set[date]:
+        """Дни с файлом партиции; каталог пересканируется раз в interval (файлы пишет другой воркер)"""
+        now = time.monotonic()
+        if dataset not in self._exported or now - self._scanned_at.get(dataset, 0) >= self.interval:
+            self._exported[dataset] = self._scan_partitions(dataset) if self.enabled else set()
+            self._scanned_at[dataset] = now
+        return self._exported[dataset]
+
+    def _now(self, dataset: str) -> datetime:
+        """Текущее время в часах поля времени набора"""
+        now = datetime.utcnow()
+        return now + self.cdr_offset if DATASETS[dataset]["local_time"] else now
+
+    def last_closed_day(self, dataset: str) -> date:
+        """Последний день, все звонки которого уже завершены"""
+        return (self._now(dataset) - timedelta(seconds=self.settle_seconds)).date() - timedelta(days=1)
+
+    # === ЭКСПОРТ ===
+
+    async def _first_day(self, db, dataset: str) -> Optional[date]:
+        spec = DATASETS[dataset]
+        first = await db.db[spec["collection"]].find_one(
+            {spec["time_field"]: {"$type": "date"}},
+            {"_id": 0, spec["time_field"]: 1},
+            sort=[(spec["time_field"], 1)]
+        )
+        return first[spec["time_field"]].date() if first else None
+
+    async def export_day(self, db, dataset: str, day: date) -> int:
+        """Выгрузка одного дня набора в файл партиции (пустой день - пустой файл)"""
+        spec = DATASETS[dataset]
+        columns: Dict[str, List[Any]] = {name: [] for name in spec["columns"]}
+        converters = [(name, CONVERTERS[kind]) for name, kind in spec["columns"].items()]
+
+        day_start = datetime.combine(day, datetime.min.time())
+        cursor = db.db[spec["collection"]].find(
+            {spec["time_field"]: {"$gte": day_start, "$lt": day_start + timedelta(days=1)}},
+            {"_id": 0, **{name: 1 for name in spec["columns"]}}
+        ).batch_size(5000)
+
+        async for document in cursor:
+            for name, convert in converters:
+                columns[name].append(convert(document.get(name)))
+
+        rows = len(columns[spec["time_field"]])
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._write_partition, self._partition_path(dataset, day), columns, spec["columns"]
+        )
+        self.exported_days(dataset).add(day)
+        self.days_exported += 1
+        self.rows_exported += rows
+        return rows
+
+    @staticmethod
+    def _write_partition(path: Path, columns: Dict[str, List[Any]], column_types: Dict[str, str]):
+        table = pa.Table.from_pydict(columns, schema=_arrow_schema(column_types))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Уникальное имя: одновременные записи одного дня (ручная выгрузка) не пишут в один файл
+        temporary = path.with_name(f"{path.name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            pq.write_table(table, temporary, compression="zstd")
+            # Читатель видит либо прежний файл, либо новый целиком
+            os.replace(temporary, path)
+        except BaseException:
+            temporary.unlink(missing_ok=True)
+            raise
+
+    async def refresh_changed(self, db, dataset: str) -> int:
+        """Повторная выгрузка дней, строки которых изменились после прошлой проверки"""
+        spec = DATASETS[dataset]
+        time_field = spec["time_field"]
+        state_id = f"columnar:{dataset}"
+        checked_at = datetime.utcnow() - timedelta(seconds=CHANGE_CHECK_MARGIN_SECONDS)
+
+        refreshed = 0
+        state = await db.sync_state.find_one({"_id": state_id})
+        if state and state.get("changes_checked_at"):
+            exported = self.exported_days(dataset)
+            changed = []
+            async for row in db.db[spec["collection"]].aggregate([
+                {"$match": {
+                    spec["changed_field"]: {"$gt": state["changes_checked_at"]},
+                    time_field: {"$type": "date"}
+                }},
+                {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${time_field}"}}}}
+            ]):
+                day = date.fromisoformat(row["_id"])
+                if day in exported:
+                    changed.append(day)
+
+            for day in sorted(changed):
+                rows = await self.export_day(db, dataset, day)
+                refreshed += 1
+                logger.info(f"🗄️ Columnar refresh {dataset} {day}: {rows} rows")
+
+        # Первая проверка только ставит отметку
+        await db.sync_state.update_one(
+            {"_id": state_id}, {"$set": {"changes_checked_at": checked_at}}, upsert=True
+        )
+        self.days_refreshed += refreshed
+        return refreshed
+
+    async def export_pending(self, db) -> int:
+        """Выгрузка закрытых дней без файла (не больше max_days_per_run за вызов)"""
+        if not self.enabled:
+            return 0
+
+        async with self._export_lock:
+            started = time.perf_counter()
+            exported = 0
+            for dataset in DATASETS:
+                exported += await self.refresh_changed(db, dataset)
+
+            for dataset in DATASETS:
+                first_day = await self._first_day(db, dataset)
+                last_day = self.last_closed_day(dataset)
+                if first_day is None or first_day > last_day:
+                    continue
+
+                budget = self.max_days_per_run - exported
+                if budget <= 0:
+                    break
+
+                done = self.exported_days(dataset)
+                pending = [day for day in _day_range(first_day, last_day) if day not in done]
+                # Сначала свежие дни - они нужнее отчетам, история догружается следующими проходами
+                for day in reversed(pending[-budget:]):
+                    rows = await self.export_day(db, dataset, day)
+                    exported += 1
+                    logger.info(f"🗄️ Columnar export {dataset} {day}: {rows} rows")
+
+            if exported:
+                self.last_export_at = datetime.utcnow()
+                self.last_export_ms = round((time.perf_counter() - started) * 1000, 2)
+            return exported
+
+    async def export_range(self, db, start_day: date, end_day: date) -> int:
+        """Повторная выгрузка закрытых дней периода (после правки звонков задним числом)"""
+        if not self.enabled:
+            return 0
+
+        async with self._export_lock:
+            started = time.perf_counter()
+            exported = 0
+            for dataset in DATASETS:
+                last_day = min(end_day, self.last_closed_day(dataset))
+                for day in _day_range(start_day, last_day) if start_day <= last_day else []:
+                    await self.export_day(db, dataset, day)
+                    exported += 1
+                    await asyncio.sleep(0)
+
+            self.last_export_at = datetime.utcnow()
+            self.last_export_ms = round((time.perf_counter() - started) * 1000, 2)
+            logger.info(f"🗄️ Columnar re-export {start_day}..{end_day}: {exported} partitions")
+            return exported
+
+    def start_export_range(self, db, start_day: date, end_day: date) -> bool:
+        """Повторная выгрузка в фоне; False - предыдущая еще выполняется"""
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            return False
+        self._rebuild_task = asyncio.create_task(self._run_export_range(db, start_day, end_day))
+        return True
+
+    async def _run_export_range(self, db, start_day: date, end_day: date):
+        try:
+            await self.export_range(db, start_day, end_day)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            logger.error(f"Error re-exporting columnar partitions: {e}")
+
+    # === ФОНОВАЯ ЗАДАЧА ===
+
+    def start(self, db=None):
+        """Запуск фоновой выгрузки закрытых дней"""
+        if not self.enabled:
+            logger.info("Columnar store disabled (pyarrow not installed or COLUMNAR_STORE_PATH empty)")
+            return
+        if self._task is None or self._task.done():
+            self.running = True
+            self._task = asyncio.create_task(self._run(db))
+            logger.info(f"🗄️ Columnar exporter started ({self.path}, engine {self.engine})")
+
+    async def stop(self):
+        """Остановка фоновой выгрузки"""
+        self.running = False
+        for task in (self._task, self._rebuild_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._rebuild_task = None
+        if self._db is not None:
+            await self.lease.stop(self._db)
+
+    async def _run(self, db):
+        if db is None:
+            from db import get_db
+            db = get_db()
+        self._db = db
+        self.lease.start(db)
+
+        while self.running:
+            try:
+                # Выгружает только владелец аренды
+                if await self.lease.acquire(db):
+                    await self.export_pending(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error(f"Error exporting columnar partitions: {e}")
+
+            await asyncio.sleep(self.interval)
+
+    # === ОТЧЕТЫ ===
+
+    def _query_partitions(self, dataset: str, days: List[date]) -> Dict[str, Dict[str, float]]:
+        """Суммы метрик по дням из файлов партиций (выполняется в пуле потоков)"""
+        spec = DATASETS[dataset]
+        metrics = spec["metrics"]
+        files = [str(self._partition_path(dataset, day)) for day in days]
+        if not files:
+            return {}
+
+        if DUCKDB_AVAILABLE:
+            file_list = ", ".join("'" + name.replace("'", "''") + "'" for name in files)
+            sums = ", ".join(f"SUM({sql}) AS {name}" for name, (_, sql, _) in metrics.items())
+            connection = duckdb.connect()
+            try:
+                result = connection.execute(f"""
+                    SELECT strftime({spec['time_field']}, '%Y-%m-%d') AS day, {sums}
+                    FROM read_parquet([{file_list}])
+                    GROUP BY day
+                """).fetchall()
+            finally:
+                connection.close()
+            return {row[0]: dict(zip(metrics, (value or 0 for value in row[1:]))) for row in result}
+
+        # Без DuckDB: файл партиции - ровно один день, суммы считаются NumPy по нужным колонкам
+        needed = [name for name in spec["columns"] if name != spec["time_field"] and spec["columns"][name] != "timestamp"]
+        result = {}
+        for day, name in zip(days, files):
+            table = pq.read_table(name, columns=needed, memory_map=True)
+            if table.num_rows == 0:
+                continue
+            columns = {
+                column: table.column(column).to_numpy(zero_copy_only=False).astype(
+                    np.float64 if spec["columns"][column] == "int" else object
+                )
+                for column in needed
+            }
+            result[day.isoformat()] = {
+                metric: float(np.sum(values(columns))) for metric, (_, _, values) in metrics.items()
+            }
+        return result
+
+    async def _query_mongo(self, db, dataset: str, days: List[date]) -> Dict[str, Dict[str, float]]:
+        """Суммы метрик по дням без файла одной агрегацией MongoDB"""
+        if not days:
+            return {}
+
+        spec = DATASETS[dataset]
+        time_field = spec["time_field"]
+        ranges = [
+            {time_field: {
+                "$gte": datetime.combine(first, datetime.min.time()),
+                "$lt": datetime.combine(last + timedelta(days=1), datetime.min.time())
+            }}
+            for first, last in _day_runs(days)
+        ]
+        pipeline = [
+            {"$match": ranges[0] if len(ranges) == 1 else {"$or": ranges}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${time_field}"}},
+                **{name: {"$sum": expression} for name, (expression, _, _) in spec["metrics"].items()}
+            }}
+        ]
+
+        result = {}
+        async for row in db.db[spec["collection"]].aggregate(pipeline):
+            day = row.pop("_id")
+            result[day] = row
+        return result
+
+    async def get_daily_report(self, db, dataset: str, start_day: date, end_day: date) -> Dict[str, Any]:
+        """Показатели по дням [start_day, end_day] и итоги: выгруженные дни из файлов, остальные из MongoDB"""
+        started = time.perf_counter()
+        spec = DATASETS[dataset]
+        days = _day_range(start_day, end_day)
+
+        exported = self.exported_days(dataset) if self.enabled else set()
+        columnar_days = [day for day in days if day in exported]
+        mongo_days = [day for day in days if day not in exported]
+
+        sums = await asyncio.get_running_loop().run_in_executor(None, self._query_partitions, dataset, columnar_days)
+        sums.update(await self._query_mongo(db, dataset, mongo_days))
+
+        empty = {name: 0 for name in spec["metrics"]}
+        points = []
+        totals = dict(empty)
+        for day in days:
+            day_sums = sums.get(day.isoformat(), empty)
+            points.append({"date": day.isoformat(), **_derive(dataset, day_sums)})
+            for name in totals:
+                totals[name] += day_sums.get(name, 0)
+
+        self.queries += 1
+        self.last_query_ms = round((time.perf_counter() - started) * 1000, 2)
+        return {
+            "dataset": dataset,
+            "period": {"start_date": start_day.isoformat(), "end_date": end_day.isoformat()},
+            "sources": {
+                "engine": self.engine,
+                "columnar_days": len(columnar_days),
+                "mongodb_days": len(mongo_days)
+            },
+            "totals": _derive(dataset, totals),
+            "days": points,
+            "duration_ms": self.last_query_ms
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "lease": self.lease.get_stats(),
+            "engine": self.engine,
+            "path": str(self.path),
+            "interval": self.interval,
+            "settle_seconds": self.settle_seconds,
+            "datasets": {
+                dataset: {
+                    "days": len(self.exported_days(dataset)),
+                    "last_closed_day": self.last_closed_day(dataset).isoformat()
+                }
+                for dataset in DATASETS
+            },
+            "rebuilding": self._rebuild_task is not None and not self._rebuild_task.done(),
+            "days_exported": self.days_exported,
+            "days_refreshed": self.days_refreshed,
+            "rows_exported": self.rows_exported,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_export_at": self.last_export_at.isoformat() if self.last_export_at else None,
+            "last_export_ms": self.last_export_ms,
+            "queries": self.queries,
+            "last_query_ms": self.last_query_ms
+        }
+
+# Глобальный экземпляр
+_columnar_store: Optional[ColumnarStore] = None
+
+def get_columnar_store() -> ColumnarStore:
+    """Получение глобального колоночного хранилища"""
+    global _columnar_store
+    if _columnar_store is None:
+        _columnar_store = ColumnarStore()
+    return _columnar_store
@@ -85,9 +85,98 @@ class Config:
     # Пулы подключений
     MAX_WORKERS: int = int(os.getenv("MAX_WORKERS", "4"))
     WEBSOCKET_MAX_CONNECTIONS: int = int(os.getenv("WEBSOCKET_MAX_CONNECTIONS", "100"))
+    # Лимиты по ролям, например "operator:80,admin:10" (пусто - только общий лимит)
+    WEBSOCKET_MAX_CONNECTIONS_PER_ROLE: str = os.getenv("WEBSOCKET_MAX_CONNECTIONS_PER_ROLE", "")
+    
+    # Heartbeat: ping после интервала тишины, разрыв если нет ответа за таймаут
+    WEBSOCKET_HEARTBEAT_INTERVAL: int = int(os.getenv("WEBSOCKET_HEARTBEAT_INTERVAL", "20"))
+    WEBSOCKET_HEARTBEAT_TIMEOUT: int = int(os.getenv("WEBSOCKET_HEARTBEAT_TIMEOUT", "10"))
+    
+    # WebSocket backplane между воркерами: memory (один процесс), mongo (несколько воркеров)
+    WEBSOCKET_BACKPLANE: str = os.getenv("WEBSOCKET_BACKPLANE", "memory")
+    WEBSOCKET_BACKPLANE_COLLECTION: str = os.getenv("WEBSOCKET_BACKPLANE_COLLECTION", "websocket_events")
+    WEBSOCKET_BACKPLANE_SIZE_MB: int = int(os.getenv("WEBSOCKET_BACKPLANE_SIZE_MB", "16"))
     
     # Кеширование
     CACHE_TTL: int = int(os.getenv("CACHE_TTL", "300"))  # 5 минут
+    SYSTEM_STATS_REFRESH_INTERVAL: int = int(os.getenv("SYSTEM_STATS_REFRESH_INTERVAL", "15"))
+    
+    # Кэш аутентифицированных пользователей (0 - отключен)
+    AUTH_CACHE_TTL: int = int(os.getenv("AUTH_CACHE_TTL", "30"))
+    AUTH_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+    
+    # bcrypt вне event loop: потоков хеширования, одновременных логинов, ожидание слота (сек)
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+    LOGIN_CONCURRENCY_LIMIT: int = int(os.getenv("LOGIN_CONCURRENCY_LIMIT", "8"))
+    LOGIN_QUEUE_TIMEOUT: float = float(os.getenv("LOGIN_QUEUE_TIMEOUT", "10"))
+    
+    # Номерной план: интервал проверки изменений в БД (сек)
+    NUMBER_PLAN_RELOAD_INTERVAL: int = int(os.getenv("NUMBER_PLAN_RELOAD_INTERVAL", "30"))
+    
+    # Оценка ожидания в очередях (Erlang C): окно метрик, AHT по умолчанию, цель SLA (сек)
+    QUEUE_STATS_WINDOW_SECONDS: int = int(os.getenv("QUEUE_STATS_WINDOW_SECONDS", "900"))
+    DEFAULT_HANDLE_TIME: int = int(os.getenv("DEFAULT_HANDLE_TIME", "180"))
+    SERVICE_LEVEL_TARGET_SECONDS: int = int(os.getenv("SERVICE_LEVEL_TARGET_SECONDS", "20"))
+    
+    # Маршрутизация по навыкам (ACD): включение, резерв оператора под звонок до соединения (сек)
+    SKILL_ROUTING_ENABLED: bool = os.getenv("SKILL_ROUTING_ENABLED", "True").lower() == "true"
+    SKILL_ROUTING_RESERVATION_SECONDS: int = int(os.getenv("SKILL_ROUTING_RESERVATION_SECONDS", "30"))
+    
+    # Повторные звонки к последнему оператору: размер LRU (0 - отключено), глубина прогрева (дни),
+    # сколько звонящий может ждать занятого оператора (сек, 0 - только свободного)
+    CALLER_AFFINITY_MAX_SIZE: int = int(os.getenv("CALLER_AFFINITY_MAX_SIZE", "100000"))
+    CALLER_AFFINITY_HISTORY_DAYS: int = int(os.getenv("CALLER_AFFINITY_HISTORY_DAYS", "30"))
+    CALLER_AFFINITY_WAIT_SECONDS: int = int(os.getenv("CALLER_AFFINITY_WAIT_SECONDS", "20"))
+    
+    # Счетчики операторов в памяти: интервал сброса в БД через bulk $inc (сек)
+    OPERATOR_COUNTERS_FLUSH_INTERVAL: int = int(os.getenv("OPERATOR_COUNTERS_FLUSH_INTERVAL", "10"))
+    
+    # Дедлайны звонков (колесо таймеров): шаг (сек)
+    CALL_TIMER_TICK_SECONDS: float = float(os.getenv("CALL_TIMER_TICK_SECONDS", "0.5"))
+    
+    # Контекст dialplan с Queue(${QUEUE_NAME},,,,${QUEUE_TIMEOUT}) и запас (сек), после которого
+    # звонящий, не отпущенный очередью по собственному таймауту, снимается через ARI
+    QUEUE_CONTEXT: str = os.getenv("QUEUE_CONTEXT", "smart-queue")
+    QUEUE_TIMEOUT_GRACE_SECONDS: int = int(os.getenv("QUEUE_TIMEOUT_GRACE_SECONDS", "15"))
+    
+    # Аренда фоновых задач с единственным исполнителем среди воркеров: срок (сек)
+    WORKER_LEASE_TTL: int = int(os.getenv("WORKER_LEASE_TTL", "30"))
+    
+    # Синхронизация CDR Asterisk -> MongoDB: интервал (сек), размер порции,
+    # окно перечитывания перед отметкой для поздних CDR (сек) и период перечитывания (сек)
+    CDR_SYNC_INTERVAL: int = int(os.getenv("CDR_SYNC_INTERVAL", "5"))
+    CDR_SYNC_BATCH_SIZE: int = int(os.getenv("CDR_SYNC_BATCH_SIZE", "1000"))
+    CDR_SYNC_LOOKBACK_SECONDS: int = int(os.getenv("CDR_SYNC_LOOKBACK_SECONDS", "3600"))
+    CDR_SYNC_RESCAN_INTERVAL: int = int(os.getenv("CDR_SYNC_RESCAN_INTERVAL", "300"))
+    
+    # Потоковая выгрузка CDR: строк на одну выборку серверного курсора
+    CDR_EXPORT_FETCH_SIZE: int = int(os.getenv("CDR_EXPORT_FETCH_SIZE", "1000"))
+    
+    # Пересборка статистики очередей из queue_log: строк в порции векторной обработки
+    QUEUE_LOG_BATCH_SIZE: int = int(os.getenv("QUEUE_LOG_BATCH_SIZE", "50000"))
+    
+    # Сборка плеч звонков из CEL: строк на одну выборку серверного курсора
+    CEL_FETCH_SIZE: int = int(os.getenv("CEL_FETCH_SIZE", "5000"))
+    
+    # Сверка calls с CDR: интервал хэширования (мин), максимум строк в каждом списке расхождений,
+    # сдвиг calldate CDR (локальное время АТС) относительно UTC (мин)
+    RECONCILE_CHUNK_MINUTES: int = int(os.getenv("RECONCILE_CHUNK_MINUTES", "60"))
+    RECONCILE_MAX_DIFFERENCES: int = int(os.getenv("RECONCILE_MAX_DIFFERENCES", "1000"))
+    ASTERISK_CDR_UTC_OFFSET_MINUTES: int = int(os.getenv("ASTERISK_CDR_UTC_OFFSET_MINUTES", "0"))
+    
+    # Кэш отчетов по CDR: записей (0 - отключен), срок открытого периода (сек),
+    # через сколько после конца период считается закрытым (сек), округление открытого периода (сек)
+    REPORT_CACHE_MAX_SIZE: int = int(os.getenv("REPORT_CACHE_MAX_SIZE", "256"))
+    REPORT_CACHE_OPEN_TTL: int = int(os.getenv("REPORT_CACHE_OPEN_TTL", "30"))
+    REPORT_CACHE_SETTLE_SECONDS: int = int(os.getenv("REPORT_CACHE_SETTLE_SECONDS", "3600"))
+    REPORT_CACHE_RESOLUTION_SECONDS: int = int(os.getenv("REPORT_CACHE_RESOLUTION_SECONDS", "60"))
+    
+    # Колоночное хранилище отчетов (Parquet по дням, пустой путь - отключено): каталог, интервал выгрузки (сек),
+    # через сколько после конца день считается закрытым (сек), максимум дней за один проход выгрузки
+    COLUMNAR_STORE_PATH: str = os.getenv("COLUMNAR_STORE_PATH", "data/columnar")
+    COLUMNAR_EXPORT_INTERVAL: int = int(os.getenv("COLUMNAR_EXPORT_INTERVAL", "600"))
+    COLUMNAR_EXPORT_SETTLE_SECONDS: int = int(os.getenv("COLUMNAR_EXPORT_SETTLE_SECONDS", "3600"))
+    COLUMNAR_EXPORT_MAX_DAYS: int = int(os.getenv("COLUMNAR_EXPORT_MAX_DAYS", "31"))
     
     # ===== DOCKER/КОНТЕЙНЕРИЗАЦИЯ =====
     
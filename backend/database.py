@@ -3,10 +3,39 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 import os
 from models import *
+from principal_cache import get_principal_cache
+from skill_router import get_skill_router
+from operator_counters import get_operator_counters
+import asyncio
 import logging
 
+import bson
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from pymongoarrow.api import Schema, find_arrow_all
+    import pyarrow as pa
+    PYMONGOARROW_AVAILABLE = True
+except ImportError:
+    PYMONGOARROW_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+def _column_array(values: list) -> "np.ndarray":
+    """Значения поля порции -> float64 (None и нечисловые - NaN)"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([
+            value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+            for value in values
+        ], dtype=np.float64)
+
 class DatabaseManager:
     def __init__(self, mongo_url: str, db_name: str):
         self.client = AsyncIOMotorClient(mongo_url)
@@ -20,6 +49,12 @@ class DatabaseManager:
         self.calls = self.db.calls
         self.customers = self.db.customers
         self.settings = self.db.settings
+        self.number_plan = self.db.number_plan
+        self.cdr_records = self.db.cdr_records
+        self.sync_state = self.db.sync_state
+        self.queue_rollups = self.db.queue_rollups
+        self.call_legs = self.db.call_legs
+        self.worker_leases = self.db.worker_leases
         
     async def create_indexes(self):
         """Create database indexes for better performance"""
@@ -33,6 +68,7 @@ class DatabaseManager:
             await self.operators.create_index("user_id", unique=True)
             await self.operators.create_index("status")
             await self.operators.create_index("group_id")
+            await self.operators.create_index("extension")
             
             # Calls indexes
             await self.calls.create_index("caller_number")
@@ -41,6 +77,7 @@ class DatabaseManager:
             await self.calls.create_index("status")
             await self.calls.create_index("start_time")
             await self.calls.create_index([("start_time", -1)])  # Descending for recent calls
+            await self.calls.create_index("updated_at")  # Измененные звонки для колоночного хранилища
             
             # Customers indexes
             await self.customers.create_index("phone_number", unique=True)
@@ -48,6 +85,23 @@ class DatabaseManager:
             # Queues indexes
             await self.queues.create_index("name", unique=True)
             
+            # Number plan indexes
+            await self.number_plan.create_index([("pattern", 1), ("match_type", 1), ("length", 1)], unique=True)
+            
+            # CDR records (синхронизация из Asterisk)
+            await self.cdr_records.create_index("uniqueid", unique=True)
+            await self.cdr_records.create_index([("calldate", -1)])
+            await self.cdr_records.create_index("synced_at")
+            
+            # Дневные итоги очередей из queue_log
+            await self.queue_rollups.create_index([("queue_name", 1), ("date", 1)], unique=True)
+            await self.queue_rollups.create_index("date")
+            
+            # Плечи звонков из CEL
+            await self.call_legs.create_index("uniqueid", unique=True)
+            await self.call_legs.create_index("linkedid")
+            await self.call_legs.create_index([("operator_id", 1), ("start_time", -1)])
+            
             logger.info("Database indexes created successfully")
         except Exception as e:
             logger.error(f"Error creating indexes: {e}")
@@ -80,10 +134,13 @@ class DatabaseManager:
     async def update_user(self, user_id: str, updates: Dict[str, Any]) -> bool:
         updates["updated_at"] = datetime.utcnow()
         result = await self.users.update_one({"id": user_id}, {"$set": updates})
+        # Роль/активность могли измениться - сбрасываем закэшированные токены
+        get_principal_cache().invalidate_user(user_id)
         return result.modified_count > 0
     
     async def delete_user(self, user_id: str) -> bool:
         result = await self.users.delete_one({"id": user_id})
+        get_principal_cache().invalidate_user(user_id)
         return result.deleted_count > 0
     
     # Group operations
@@ -109,6 +166,8 @@ class DatabaseManager:
     async def create_queue(self, queue_data: QueueCreate) -> Queue:
         queue = Queue(**queue_data.dict())
         await self.queues.insert_one(queue.dict())
+        if queue.required_skills:
+            get_skill_router().set_queue_skills(queue.name, queue.required_skills)
         return queue
     
     async def get_queues(self) -> List[Queue]:
@@ -124,10 +183,48 @@ class DatabaseManager:
             return Queue(**queue_data)
         return None
     
+    # Number plan operations
+    async def get_number_plan_rules(self, active_only: bool = False) -> List[NumberPlanRule]:
+        query = {"is_active": True} if active_only else {}
+        cursor = self.number_plan.find(query).sort("pattern", 1)
+        rules = []
+        async for rule_data in cursor:
+            rules.append(NumberPlanRule(**rule_data))
+        return rules
+    
+    async def create_number_plan_rule(self, rule_data: NumberPlanRuleCreate) -> NumberPlanRule:
+        rule = NumberPlanRule(**rule_data.dict())
+        await self.number_plan.insert_one(rule.dict())
+        return rule
+    
+    async def seed_number_plan_rule(self, rule_data: NumberPlanRuleCreate) -> bool:
+        """Идемпотентное добавление правила по уникальному ключу (pattern, match_type, length)"""
+        rule = NumberPlanRule(**rule_data.dict())
+        result = await self.number_plan.update_one(
+            {"pattern": rule.pattern, "match_type": rule.match_type, "length": rule.length},
+            {"$setOnInsert": rule.dict()},
+            upsert=True
+        )
+        return result.upserted_id is not None
+    
+    async def delete_number_plan_rule(self, rule_id: str) -> bool:
+        result = await self.number_plan.delete_one({"id": rule_id})
+        return result.deleted_count > 0
+    
+    async def get_number_plan_fingerprint(self) -> Dict[str, Any]:
+        """Количество правил и время последнего изменения (для hot reload)"""
+        cursor = self.number_plan.aggregate([
+            {"$group": {"_id": None, "count": {"$sum": 1}, "updated_at": {"$max": "$updated_at"}}}
+        ])
+        async for result in cursor:
+            return {"count": result["count"], "updated_at": result["updated_at"]}
+        return {"count": 0, "updated_at": None}
+    
     # Operator operations
     async def create_operator(self, operator_data: OperatorCreate) -> Operator:
         operator = Operator(**operator_data.dict())
         await self.operators.insert_one(operator.dict())
+        get_skill_router().upsert_operator(operator)
         return operator
     
     async def get_operators(self, group_id: Optional[str] = None) -> List[Operator]:
@@ -147,12 +244,21 @@ class DatabaseManager:
             return Operator(**operator_data)
         return None
     
+    async def get_operator_by_extension(self, extension: str) -> Optional[Operator]:
+        operator_data = await self.operators.find_one({"extension": extension})
+        if operator_data:
+            return Operator(**operator_data)
+        return None
+    
     async def update_operator_status(self, operator_id: str, status: OperatorStatus) -> bool:
         updates = {
             "status": status,
             "last_activity": datetime.utcnow()
         }
         result = await self.operators.update_one({"id": operator_id}, {"$set": updates})
+        get_skill_router().set_operator_status(operator_id, status)
+        counters = get_operator_counters()
+        await counters.track_status(counters.key_for_operator(operator_id), status, self)
         return result.modified_count > 0
     
     # Call operations
@@ -490,6 +596,73 @@ class DatabaseManager:
         
         return queue_stats
     
+    # Columnar operations
+    async def get_numeric_arrays(self, collection: str, filter_query: Dict[str, Any], fields: List[str],
+                                 label_field: Optional[str] = None, batch_size: int = 10000) -> Dict[str, "np.ndarray"]:
+        """Числовые поля документов по фильтру в массивы NumPy (float64, NaN - нет значения)
+
+        С PyMongoArrow документы декодируются сразу в колонки Arrow; без нее
+        курсор читает сырые BSON-порции (find_raw_batches) и каждая порция
+        превращается в массивы целиком, минуя модели Pydantic. label_field -
+        строковое поле для группировки (массив object, None - нет значения).
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("NumPy not installed")
+
+        projection = {"_id": 0, **{field: 1 for field in fields}}
+        if label_field:
+            projection[label_field] = 1
+
+        if PYMONGOARROW_AVAILABLE:
+            schema = Schema({
+                **{field: pa.float64() for field in fields},
+                **({label_field: pa.string()} if label_field else {})
+            })
+            # PyMongoArrow работает с синхронным pymongo - выполняется в пуле потоков
+            table = await asyncio.get_running_loop().run_in_executor(
+                None,
+                lambda: find_arrow_all(self.db[collection].delegate, filter_query, schema=schema,
+                                       batch_size=batch_size)
+            )
+            result = {
+                field: table.column(field).to_numpy().astype(np.float64, copy=False)
+                for field in fields
+            }
+            if label_field:
+                result[label_field] = table.column(label_field).to_numpy().astype(object)
+            return result
+
+        chunks: Dict[str, list] = {field: [] for field in projection if field != "_id"}
+        cursor = self.db[collection].find_raw_batches(filter_query, projection, batch_size=batch_size)
+        async for batch in cursor:
+            documents = bson.decode_all(batch)
+            for field in fields:
+                chunks[field].append(_column_array([document.get(field) for document in documents]))
+            if label_field:
+                chunks[label_field].append(np.array([document.get(label_field) for document in documents], dtype=object))
+
+        return {
+            field: np.concatenate(parts) if parts else np.empty(0, dtype=object if field == label_field else np.float64)
+            for field, parts in chunks.items()
+        }
+
+    async def get_call_arrays(self, filters: CallFilters, fields: List[str],
+                              label_field: Optional[str] = None) -> Dict[str, "np.ndarray"]:
+        """Числовые поля звонков по фильтрам CallFilters в массивы NumPy"""
+        filter_query: Dict[str, Any] = {}
+        if filters.start_date or filters.end_date:
+            filter_query["start_time"] = {}
+            if filters.start_date:
+                filter_query["start_time"]["$gte"] = filters.start_date
+            if filters.end_date:
+                filter_query["start_time"]["$lt"] = filters.end_date
+        for field in ("status", "call_type", "category", "queue_name", "operator_id"):
+            value = getattr(filters, field)
+            if value is not None:
+                filter_query[field] = value.value if hasattr(value, "value") else value
+
+        return await self.get_numeric_arrays("calls", filter_query, fields, label_field)
+
     async def close(self):
         """Close database connection"""
         self.client.close()
\ No newline at end of file
@@ -44,6 +44,11 @@ class CallPriority(str, Enum):
     HIGH = "high"
     URGENT = "urgent"
 
+class NumberTargetType(str, Enum):
+    DIRECT_EXTENSION = "direct_extension"  # Extension оператора
+    QUEUE_NUMBER = "queue_number"          # Номер очереди
+    SERVICE_NUMBER = "service_number"      # Сервисный номер (IVR, voicemail)
+
 class OperatorStatus(str, Enum):
     OFFLINE = "offline"
     AVAILABLE = "available"
@@ -64,7 +69,9 @@ class AsteriskDatabaseConfig(BaseModel):
     ssl_mode: str = "disabled"
     charset: str = "utf8mb4"
     connection_timeout: int = 30
+    pool_min_size: int = 1
     pool_size: int = 10
+    statement_cache_size: int = 100  # Кэш подготовленных выражений asyncpg (0 - выключен)
 
 # ===== USER MODELS =====
 class User(BaseModel):
@@ -118,6 +125,10 @@ class Operator(BaseModel):
     calls_offered: int = 0     # предложенные звонки
     calls_answered: int = 0    # отвеченные звонки
     calls_missed: int = 0      # пропущенные звонки
+    
+    # Начало текущей смены / паузы (UTC, None - интервал закрыт)
+    session_started_at: Optional[datetime] = None
+    pause_started_at: Optional[datetime] = None
 
 class OperatorCreate(BaseModel):
     user_id: str
@@ -170,6 +181,11 @@ class Call(BaseModel):
     queue_position: Optional[int] = None
     abandon_reason: Optional[str] = None
     
+    # Перевод (по CEL): тип blind/attended и extension цели
+    transferred: bool = False
+    transfer_type: Optional[str] = None
+    transfer_target: Optional[str] = None
+    
     # Метаданные
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -236,6 +252,7 @@ class Queue(BaseModel):
     announce_frequency: int = 60
     announce_position: bool = True
     operator_ids: List[str] = []
+    required_skills: List[str] = []  # навыки для маршрутизации (по умолчанию - имя очереди)
     is_active: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -246,6 +263,7 @@ class QueueCreate(BaseModel):
     max_wait_time: int = 300
     priority: int = 1
     operator_ids: List[str] = []
+    required_skills: List[str] = []
 
 class QueueUpdate(BaseModel):
     name: Optional[str] = None
@@ -254,8 +272,32 @@ class QueueUpdate(BaseModel):
     max_wait_time: Optional[int] = None
     priority: Optional[int] = None
     operator_ids: Optional[List[str]] = None
+    required_skills: Optional[List[str]] = None
     is_active: Optional[bool] = None
 
+# ===== NUMBER PLAN MODELS =====
+class NumberPlanRule(BaseModel):
+    """Правило номерного плана (DID / префикс -> назначение)"""
+    id: str = Field(default_factory=generate_uuid)
+    pattern: str                       # Номер или префикс
+    match_type: str = "exact"          # exact или prefix
+    length: Optional[int] = None       # Для prefix: требуемая длина номера
+    target_type: NumberTargetType
+    target: Optional[str] = None       # Очередь или тип сервиса
+    description: Optional[str] = None
+    is_active: bool = True
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class NumberPlanRuleCreate(BaseModel):
+    pattern: str
+    match_type: str = "exact"
+    length: Optional[int] = None
+    target_type: NumberTargetType
+    target: Optional[str] = None
+    description: Optional[str] = None
+    is_active: bool = True
+
 # ===== ASTERISK CONFIG =====
 class AsteriskConfig(BaseModel):
     host: str = "localhost"
@@ -0,0 +1,315 @@
+"""
+Smart Call Center - Number Plan Routing Table
+=============================================
+
+Номерной план (DID, номера очередей, сервисные номера, префиксы
+extensions) загружается из коллекции number_plan и компилируется в
+префиксное дерево. Поиск назначения - один проход по цифрам номера
+(O(len(number))) с семантикой самого длинного совпадения.
+
+Перекомпиляция выполняется в фоне при изменении правил, новое дерево
+подменяется одной операцией присваивания без перезапуска сервиса.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import config
+from models import NumberPlanRule, NumberPlanRuleCreate, NumberTargetType
+
+logger = logging.getLogger(__name__)
+
+# Номерной план по умолчанию (перенесен из CallFlowLogic / CallFlowConfig)
+DEFAULT_NUMBER_PLAN = [
+    # Прямые extensions операторов: 4-значные, начинаются с 0, 1, 2
+    {"pattern": "0", "match_type": "prefix", "length": 4, "target_type": NumberTargetType.DIRECT_EXTENSION},
+    {"pattern": "1", "match_type": "prefix", "length": 4, "target_type": NumberTargetType.DIRECT_EXTENSION},
+    {"pattern": "2", "match_type": "prefix", "length": 4, "target_type": NumberTargetType.DIRECT_EXTENSION},
+    # Номера очередей
+    {"pattern": "100", "target_type": NumberTargetType.QUEUE_NUMBER, "target": "support"},
+    {"pattern": "101", "target_type": NumberTargetType.QUEUE_NUMBER, "target": "sales"},
+    {"pattern": "102", "target_type": NumberTargetType.QUEUE_NUMBER, "target": "technical"},
+    {"pattern": "200", "target_type": NumberTargetType.QUEUE_NUMBER, "target": "vip"},
+    # Сервисные номера
+    {"pattern": "500", "target_type": NumberTargetType.SERVICE_NUMBER, "target": "ivr_main"},
+    {"pattern": "501", "target_type": NumberTargetType.SERVICE_NUMBER, "target": "voicemail"},
+    {"pattern": "502", "target_type": NumberTargetType.SERVICE_NUMBER, "target": "callback_request"},
+]
+
+ALLOWED_NUMBER_CHARS = set("0123456789+*#")
+
+def normalize_number(number: Optional[str]) -> str:
+    """Нормализация номера: только цифры и символы набора (+, *, #)"""
+    if not number:
+        return ""
+    return "".join(char for char in str(number) if char in ALLOWED_NUMBER_CHARS)
+
+@dataclass(frozen=True)
+class RouteMatch:
+    """Результат поиска в номерном плане"""
+    target_type: str
+    target: Optional[str]
+    pattern: str
+    match_type: str
+    rule_id: Optional[str] = None
+
+class LatencyTracker:
+    """Скользящая выборка задержек для метрик (перцентили по последним N)"""
+
+    def __init__(self, sample_size: int = 1024):
+        self.samples = deque(maxlen=sample_size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def percentile(pct: float) -> float:
+            if not ordered:
+                return 0.0
+            index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+            return round(ordered[index] * 1_000_000, 2)
+
+        return {
+            "count": self.count,
+            "avg_us": round(self.total / self.count * 1_000_000, 2) if self.count else 0,
+            "p50_us": percentile(50),
+            "p95_us": percentile(95),
+            "p99_us": percentile(99),
+            "max_us": round(self.max * 1_000_000, 2)
+        }
+
+class _TrieNode:
+    __slots__ = ("children", "exact", "prefix_any", "prefix_by_length")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.exact: Optional[RouteMatch] = None
+        self.prefix_any: Optional[RouteMatch] = None
+        self.prefix_by_length: Dict[int, RouteMatch] = {}
+
+class CompiledNumberPlan:
+    """Неизменяемое префиксное дерево номерного плана
+
+    Приоритет: точное совпадение всего номера, затем самый длинный
+    префикс; на одной глубине префикс с указанной длиной номера
+    важнее префикса без ограничения длины.
+    """
+
+    def __init__(self, rules: Iterable[NumberPlanRule], version: int = 0, source: str = "defaults"):
+        self.root = _TrieNode()
+        self.version = version
+        self.source = source
+        self.compiled_at = datetime.utcnow()
+        self.rule_count = 0
+        self.conflicts = 0
+
+        for rule in rules:
+            self._add(rule)
+
+    def _add(self, rule: NumberPlanRule):
+        pattern = normalize_number(rule.pattern)
+        if not pattern:
+            logger.warning(f"⚠️ Skipping number plan rule with empty pattern: {rule.id}")
+            return
+
+        node = self.root
+        for char in pattern:
+            node = node.children.setdefault(char, _TrieNode())
+
+        target_type = getattr(rule.target_type, "value", rule.target_type)
+        match = RouteMatch(target_type, rule.target, pattern, rule.match_type, rule.id)
+
+        if rule.match_type == "prefix":
+            if rule.length:
+                existing = node.prefix_by_length.get(rule.length)
+                node.prefix_by_length[rule.length] = match
+            else:
+                existing = node.prefix_any
+                node.prefix_any = match
+        else:
+            existing = node.exact
+            node.exact = match
+
+        if existing:
+            self.conflicts += 1
+            logger.warning(f"⚠️ Number plan conflict for {pattern} ({rule.match_type}), last rule wins")
+        else:
+            self.rule_count += 1
+
+    def lookup(self, number: str) -> Optional[RouteMatch]:
+        """Самое длинное совпадение для номера"""
+        length = len(number)
+        node = self.root
+        best = None
+
+        for char in number:
+            node = node.children.get(char)
+            if node is None:
+                return best
+            prefix = node.prefix_by_length.get(length) or node.prefix_any
+            if prefix:
+                best = prefix
+
+        return node.exact or best
+
+class NumberPlanRouter:
+    """Номерной план с атомарной подменой скомпилированного дерева"""
+
+    def __init__(self, reload_interval: float = None):
+        self.reload_interval = reload_interval or config.NUMBER_PLAN_RELOAD_INTERVAL
+        self._plan = CompiledNumberPlan(build_default_rules(), version=0, source="defaults")
+        self._fingerprint: Optional[Dict[str, Any]] = None
+        self._reload_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.running = False
+
+        # Метрики
+        self.lookup_latency = LatencyTracker()
+        self.matches_by_type: Dict[str, int] = {}
+        self.misses = 0
+        self.reload_count = 0
+        self.reload_errors = 0
+        self.last_compile_ms = 0.0
+
+    @property
+    def plan(self) -> CompiledNumberPlan:
+        return self._plan
+
+    def lookup(self, number: Optional[str]) -> Optional[RouteMatch]:
+        """Поиск назначения для номера"""
+        started = time.perf_counter()
+        # Локальная ссылка - поиск идет по одной версии дерева даже при подмене
+        plan = self._plan
+        normalized = normalize_number(number)
+        match = plan.lookup(normalized) if normalized else None
+        self.lookup_latency.record(time.perf_counter() - started)
+
+        if match:
+            self.matches_by_type[match.target_type] = self.matches_by_type.get(match.target_type, 0) + 1
+        else:
+            self.misses += 1
+        return match
+
+    async def seed_defaults(self, db) -> int:
+        """Заполнение пустой коллекции номерного плана правилами по умолчанию
+
+        Воркеры стартуют параллельно и могут одновременно увидеть пустую
+        коллекцию, поэтому правила добавляются upsert'ом по уникальному
+        ключу: повторная вставка того же правила не дает DuplicateKeyError.
+        """
+        if await db.number_plan.count_documents({}, limit=1):
+            return 0
+
+        inserted = 0
+        for rule_data in DEFAULT_NUMBER_PLAN:
+            if await db.seed_number_plan_rule(NumberPlanRuleCreate(**rule_data)):
+                inserted += 1
+        if inserted:
+            logger.info(f"📇 Number plan seeded with {inserted} default rules")
+        return inserted
+
+    async def reload(self, db=None) -> CompiledNumberPlan:
+        """Загрузка правил из БД, компиляция и атомарная подмена дерева"""
+        if db is None:
+            from db import get_db
+            db = get_db()
+
+        async with self._reload_lock:
+            try:
+                fingerprint = await db.get_number_plan_fingerprint()
+                rules = await db.get_number_plan_rules(active_only=True)
+
+                started = time.perf_counter()
+                plan = CompiledNumberPlan(rules, version=self._plan.version + 1, source="database")
+                self.last_compile_ms = round((time.perf_counter() - started) * 1000, 3)
+
+                self._plan = plan
+                self._fingerprint = fingerprint
+                self.reload_count += 1
+                logger.info(f"📇 Number plan v{plan.version} compiled: {plan.rule_count} rules "
+                            f"in {self.last_compile_ms} ms")
+            except Exception as e:
+                self.reload_errors += 1
+                logger.error(f"Error reloading number plan: {e}")
+
+            return self._plan
+
+    async def reload_if_changed(self, db=None) -> bool:
+        """Перекомпиляция только при изменении правил в БД"""
+        if db is None:
+            from db import get_db
+            db = get_db()
+
+        try:
+            fingerprint = await db.get_number_plan_fingerprint()
+        except Exception as e:
+            logger.error(f"Error checking number plan changes: {e}")
+            return False
+
+        if fingerprint == self._fingerprint:
+            return False
+        await self.reload(db)
+        return True
+
+    def start(self, db=None):
+        """Запуск фоновой проверки изменений (для остальных воркеров)"""
+        if self._task is None or self._task.done():
+            self.running = True
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        """Остановка фоновой проверки"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, db):
+        while self.running:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload_if_changed(db)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики номерного плана"""
+        plan = self._plan
+        return {
+            "version": plan.version,
+            "source": plan.source,
+            "rules": plan.rule_count,
+            "conflicts": plan.conflicts,
+            "compiled_at": plan.compiled_at.isoformat(),
+            "last_compile_ms": self.last_compile_ms,
+            "reload_count": self.reload_count,
+            "reload_errors": self.reload_errors,
+            "matches_by_type": dict(self.matches_by_type),
+            "misses": self.misses,
+            "lookup_latency": self.lookup_latency.get_stats()
+        }
+
+def build_default_rules() -> List[NumberPlanRule]:
+    """Правила по умолчанию до первой загрузки из БД"""
+    return [NumberPlanRule(**rule_data) for rule_data in DEFAULT_NUMBER_PLAN]
+
+# Глобальный экземпляр
+_number_plan_router: Optional[NumberPlanRouter] = None
+
+def get_number_plan() -> NumberPlanRouter:
+    """Получение глобального номерного плана"""
+    global _number_plan_router
+    if _number_plan_router is None:
+        _number_plan_router = NumberPlanRouter()
+    return _number_plan_router
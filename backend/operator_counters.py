@@ -0,0 +1,220 @@
+"""
+Smart Call Center - Operator Counters
+=====================================
+
+Накопление KPI операторов в памяти (calls_offered, calls_answered,
+calls_missed) по событиям очередей и bridge. Счетчики периодически
+сбрасываются в коллекцию operators одним bulk_write с операциями $inc,
+поэтому KPI оператора читаются из его документа без агрегаций по calls.
+
+Время в сети и на паузе (total_login_time, pause_time) начисляется
+только на переходах статуса: начало смены/паузы сохраняется в документе
+оператора (session_started_at, pause_started_at), а закрытие интервала -
+одно атомарное обновление, которое добавляет прошедшее время и
+сбрасывает отметку. Поэтому при нескольких воркерах интервал
+учитывается ровно один раз, а воркер, не видевший выхода оператора,
+ничего не начисляет.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ("calls_offered", "calls_answered", "calls_missed")
+
+# Интервалы времени: поле отметки начала -> поле накопленных секунд
+SESSION_INTERVAL = ("session_started_at", "total_login_time")
+PAUSE_INTERVAL = ("pause_started_at", "pause_time")
+
+# Ключ оператора: ("extension", "0001") или ("id", operator_id) - фильтр для update
+OperatorKey = Tuple[str, str]
+
+class OperatorCounters:
+    """Буфер инкрементов счетчиков операторов с периодическим сбросом"""
+
+    def __init__(self, flush_interval: float = None):
+        self.flush_interval = flush_interval or config.OPERATOR_COUNTERS_FLUSH_INTERVAL
+        self.pending: Dict[OperatorKey, Dict[str, int]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.running = False
+
+        # Метрики
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.operations_written = 0
+        self.last_flush_ms = 0.0
+        self.intervals_opened = 0
+        self.intervals_closed = 0
+        self.interval_errors = 0
+
+    # === КЛЮЧИ ===
+
+    def key_for_extension(self, extension: str) -> Optional[OperatorKey]:
+        if not extension or extension == "unknown":
+            return None
+        return ("extension", extension)
+
+    def key_for_operator(self, operator_id: str) -> OperatorKey:
+        """Ключ по id; известный оператор - по extension, чтобы события и статусы совпадали"""
+        from skill_router import get_skill_router
+        agent = get_skill_router().get_agent_by_operator_id(operator_id)
+        return ("extension", agent.extension) if agent else ("id", operator_id)
+
+    # === СЧЕТЧИКИ ===
+
+    def increment(self, key: Optional[OperatorKey], field: str, value: int = 1):
+        if key is None or not value:
+            return
+        counters = self.pending.setdefault(key, {})
+        counters[field] = counters.get(field, 0) + value
+
+    # === ИНТЕРВАЛЫ ВРЕМЕНИ ===
+
+    async def _open_interval(self, db, key: OperatorKey, interval: Tuple[str, str]):
+        """Отметка начала интервала, если он еще не открыт (повтор от другого воркера - no-op)"""
+        started_field, _ = interval
+        field, value = key
+        try:
+            result = await db.operators.update_one(
+                {field: value, started_field: None},
+                [{"$set": {started_field: "$$NOW"}}]
+            )
+            self.intervals_opened += result.modified_count
+        except Exception as e:
+            self.interval_errors += 1
+            logger.error(f"Error opening {started_field} for operator {value}: {e}")
+
+    async def _close_interval(self, db, key: OperatorKey, interval: Tuple[str, str]):
+        """Начисление времени открытого интервала и сброс отметки одним атомарным обновлением"""
+        started_field, total_field = interval
+        field, value = key
+        elapsed = {"$max": [0, {"$toLong": {"$round": [
+            {"$divide": [{"$subtract": ["$$NOW", f"${started_field}"]}, 1000]}, 0
+        ]}}]}
+        try:
+            result = await db.operators.update_one(
+                {field: value, started_field: {"$type": "date"}},
+                [{"$set": {
+                    total_field: {"$add": [{"$ifNull": [f"${total_field}", 0]}, elapsed]},
+                    started_field: None
+                }}]
+            )
+            self.intervals_closed += result.modified_count
+        except Exception as e:
+            self.interval_errors += 1
+            logger.error(f"Error closing {started_field} for operator {value}: {e}")
+
+    async def start_pause(self, key: Optional[OperatorKey], db=None):
+        if key is not None:
+            await self._open_interval(db or self._get_db(), key, PAUSE_INTERVAL)
+
+    async def end_pause(self, key: Optional[OperatorKey], db=None):
+        if key is not None:
+            await self._close_interval(db or self._get_db(), key, PAUSE_INTERVAL)
+
+    async def track_status(self, key: OperatorKey, status, db=None):
+        """Смена статуса: начало/конец смены и паузы"""
+        status = getattr(status, "value", status)
+        db = db or self._get_db()
+
+        if status == "offline":
+            await self._close_interval(db, key, PAUSE_INTERVAL)
+            await self._close_interval(db, key, SESSION_INTERVAL)
+            return
+
+        await self._open_interval(db, key, SESSION_INTERVAL)
+        if status == "paused":
+            await self._open_interval(db, key, PAUSE_INTERVAL)
+        else:
+            await self._close_interval(db, key, PAUSE_INTERVAL)
+
+    @staticmethod
+    def _get_db():
+        from db import get_db
+        return get_db()
+
+    # === СБРОС В БД ===
+
+    async def flush(self, db=None) -> int:
+        """Один bulk_write с $inc для всех операторов с изменениями"""
+        if db is None:
+            db = self._get_db()
+
+        async with self._flush_lock:
+            if not self.pending:
+                return 0
+
+            batch, self.pending = self.pending, {}
+            operations = [
+                UpdateOne({field: value}, {"$inc": counters})
+                for (field, value), counters in batch.items()
+            ]
+
+            started = time.perf_counter()
+            try:
+                await db.operators.bulk_write(operations, ordered=False)
+                self.flush_count += 1
+                self.operations_written += len(operations)
+            except Exception as e:
+                # Возвращаем инкременты в буфер до следующей попытки
+                self.flush_errors += 1
+                for key, counters in batch.items():
+                    for field, value in counters.items():
+                        self.increment(key, field, value)
+                logger.error(f"Error flushing operator counters: {e}")
+                return 0
+            finally:
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+            logger.debug(f"📊 Flushed counters for {len(operations)} operators in {self.last_flush_ms} ms")
+            return len(operations)
+
+    def start(self, db=None):
+        """Запуск периодического сброса"""
+        if self._task is None or self._task.done():
+            self.running = True
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self, db=None):
+        """Остановка с финальным сбросом накопленного"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush(db)
+
+    async def _run(self, db):
+        while self.running:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush(db)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "flush_interval": self.flush_interval,
+            "pending_operators": len(self.pending),
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "operations_written": self.operations_written,
+            "last_flush_ms": self.last_flush_ms,
+            "intervals_opened": self.intervals_opened,
+            "intervals_closed": self.intervals_closed,
+            "interval_errors": self.interval_errors
+        }
+
+# Глобальный экземпляр
+_operator_counters: Optional[OperatorCounters] = None
+
+def get_operator_counters() -> OperatorCounters:
+    """Получение глобального буфера счетчиков операторов"""
+    global _operator_counters
+    if _operator_counters is None:
+        _operator_counters = OperatorCounters()
+    return _operator_counters
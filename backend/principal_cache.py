@@ -0,0 +1,127 @@
+"""
+Smart Call Center - Principal Cache
+===================================
+
+LRU+TTL кэш "токен -> пользователь" для get_current_user и WebSocket
+подключений. Проверки ролей (require_admin, require_supervisor_or_admin)
+разрешаются из памяти без запроса в MongoDB на каждый HTTP запрос.
+
+Записи инвалидируются явно из DatabaseManager.update_user/delete_user
+(в т.ч. при смене роли). В других воркерах запись живет не дольше TTL.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from config import config
+
+class PrincipalCache:
+    """LRU кэш аутентифицированных пользователей с ограничением по времени"""
+
+    def __init__(self, max_size: int = None, ttl_seconds: float = None):
+        self.max_size = max_size if max_size is not None else config.AUTH_CACHE_MAX_SIZE
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.AUTH_CACHE_TTL
+
+        # token -> (user, expires_at)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # user_id -> токены пользователя (для инвалидации)
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, token: str):
+        """Пользователь по токену или None при промахе/истечении"""
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        user, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self._remove(token)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def put(self, token: str, user, token_exp: Optional[float] = None):
+        """Сохранение пользователя; запись не переживает срок действия JWT"""
+        if not self.enabled:
+            return
+
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+            if ttl <= 0:
+                return
+
+        if token in self._entries:
+            self._remove(token)
+
+        self._entries[token] = (user, time.monotonic() + ttl)
+        self._tokens_by_user.setdefault(user.id, set()).add(token)
+
+        while len(self._entries) > self.max_size:
+            oldest_token = next(iter(self._entries))
+            self._remove(oldest_token)
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Удаление всех записей пользователя, возвращает количество"""
+        tokens = self._tokens_by_user.pop(user_id, set())
+        for token in tokens:
+            self._entries.pop(token, None)
+        if tokens:
+            self.invalidations += 1
+        return len(tokens)
+
+    def clear(self):
+        """Полная очистка"""
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_tokens = self._tokens_by_user.get(entry[0].id)
+        if user_tokens is not None:
+            user_tokens.discard(token)
+            if not user_tokens:
+                del self._tokens_by_user[entry[0].id]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+# Глобальный экземпляр
+_principal_cache: Optional[PrincipalCache] = None
+
+def get_principal_cache() -> PrincipalCache:
+    """Получение глобального кэша пользователей"""
+    global _principal_cache
+    if _principal_cache is None:
+        _principal_cache = PrincipalCache()
+    return _principal_cache
@@ -0,0 +1,280 @@
+"""
+Smart Call Center - Queue Wait Estimator
+========================================
+
+Оценка ожидания в очередях по живым метрикам (Erlang C).
+
+Для каждой очереди в скользящем окне отслеживаются интенсивность
+поступления звонков и среднее время обслуживания (AHT), а также
+состав операторов и их доступность. Метрики обновляются событиями
+Asterisk, маршрутизация читает оценку из памяти без запросов к MongoDB.
+"""
+
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Состояния операторов
+AGENT_AVAILABLE = "available"
+AGENT_BUSY = "busy"
+AGENT_PAUSED = "paused"
+AGENT_OFFLINE = "offline"
+
+# Соответствие OperatorStatus -> состояние оператора в оценщике
+OPERATOR_STATUS_STATES = {
+    "available": AGENT_AVAILABLE,
+    "busy": AGENT_BUSY,
+    "in_call": AGENT_BUSY,
+    "paused": AGENT_PAUSED,
+    "offline": AGENT_OFFLINE,
+}
+
+def erlang_c(traffic: float, agents: int) -> float:
+    """Вероятность ожидания по Erlang C (через рекуррентную формулу Erlang B)"""
+    if agents <= 0:
+        return 1.0
+    if traffic <= 0:
+        return 0.0
+    if traffic >= agents:
+        return 1.0
+
+    erlang_b = 1.0
+    for k in range(1, agents + 1):
+        erlang_b = traffic * erlang_b / (k + traffic * erlang_b)
+    return agents * erlang_b / (agents - traffic * (1 - erlang_b))
+
+class QueueLiveStats:
+    """Скользящие метрики одной очереди"""
+
+    __slots__ = ("arrivals", "handle_times", "handle_sum", "members", "waiting",
+                 "first_seen", "estimate", "estimated_at", "dirty")
+
+    def __init__(self, now: float):
+        self.arrivals: deque = deque()       # времена поступления
+        self.handle_times: deque = deque()   # (время, длительность обслуживания)
+        self.handle_sum = 0.0
+        self.members: Set[str] = set()       # extensions операторов очереди
+        self.waiting = 0
+        self.first_seen = now
+        self.estimate: Optional[Dict[str, Any]] = None
+        self.estimated_at = 0.0
+        self.dirty = True
+
+    def evict(self, now: float, window: float):
+        """Удаление событий за пределами окна"""
+        horizon = now - window
+        while self.arrivals and self.arrivals[0] < horizon:
+            self.arrivals.popleft()
+        while self.handle_times and self.handle_times[0][0] < horizon:
+            self.handle_sum -= self.handle_times.popleft()[1]
+
+class QueueWaitEstimator:
+    """Живой оценщик ожидания в очередях"""
+
+    def __init__(self, window_seconds: float = None, default_handle_time: float = None,
+                 service_level_target: float = None, cache_seconds: float = 1.0):
+        self.window_seconds = window_seconds or config.QUEUE_STATS_WINDOW_SECONDS
+        self.default_handle_time = default_handle_time or config.DEFAULT_HANDLE_TIME
+        self.service_level_target = service_level_target or config.SERVICE_LEVEL_TARGET_SECONDS
+        self.cache_seconds = cache_seconds
+
+        self.queues: Dict[str, QueueLiveStats] = {}
+        self.agent_states: Dict[str, str] = {}  # extension -> состояние
+        self.agent_queues: Dict[str, Set[str]] = {}  # extension -> очереди
+        self.estimates_computed = 0
+
+    def _queue(self, queue_name: str) -> QueueLiveStats:
+        stats = self.queues.get(queue_name)
+        if stats is None:
+            stats = QueueLiveStats(time.monotonic())
+            self.queues[queue_name] = stats
+        return stats
+
+    def _mark_agent_queues_dirty(self, extension: str):
+        for queue_name in self.agent_queues.get(extension, ()):
+            self.queues[queue_name].dirty = True
+
+    # === СОБЫТИЯ ОЧЕРЕДИ ===
+
+    def record_arrival(self, queue_name: str):
+        """Звонящий вошел в очередь"""
+        stats = self._queue(queue_name)
+        stats.arrivals.append(time.monotonic())
+        stats.waiting += 1
+        stats.dirty = True
+
+    def record_queue_leave(self, queue_name: str):
+        """Звонящий покинул очередь (ответ, таймаут, отказ)"""
+        stats = self._queue(queue_name)
+        stats.waiting = max(stats.waiting - 1, 0)
+        stats.dirty = True
+
+    def record_handle_time(self, queue_name: str, seconds: float):
+        """Завершенное обслуживание звонка очереди"""
+        if seconds < 0:
+            return
+        stats = self._queue(queue_name)
+        stats.handle_times.append((time.monotonic(), seconds))
+        stats.handle_sum += seconds
+        stats.dirty = True
+
+    # === ОПЕРАТОРЫ ===
+
+    def add_queue_member(self, queue_name: str, extension: str):
+        """Оператор обслуживает очередь"""
+        stats = self._queue(queue_name)
+        if extension not in stats.members:
+            stats.members.add(extension)
+            self.agent_queues.setdefault(extension, set()).add(queue_name)
+            self.agent_states.setdefault(extension, AGENT_AVAILABLE)
+            stats.dirty = True
+
+    def remove_queue_member(self, queue_name: str, extension: str):
+        """Оператор больше не обслуживает очередь"""
+        stats = self.queues.get(queue_name)
+        if stats and extension in stats.members:
+            stats.members.discard(extension)
+            self.agent_queues.get(extension, set()).discard(queue_name)
+            stats.dirty = True
+
+    def set_agent_state(self, extension: str, state: str):
+        """Смена состояния оператора"""
+        if self.agent_states.get(extension) == state:
+            return
+        self.agent_states[extension] = state
+        self._mark_agent_queues_dirty(extension)
+
+    def is_agent_known(self, extension: str) -> bool:
+        return extension in self.agent_states
+
+    def is_agent_available(self, extension: str) -> bool:
+        return self.agent_states.get(extension) == AGENT_AVAILABLE
+
+    def has_staffing_data(self, queue_name: str) -> bool:
+        """Известен ли состав операторов очереди"""
+        stats = self.queues.get(queue_name)
+        return bool(stats and stats.members)
+
+    def get_available_agents(self, queue_name: str) -> List[str]:
+        """Свободные операторы очереди"""
+        stats = self.queues.get(queue_name)
+        if not stats:
+            return []
+        return [ext for ext in stats.members if self.agent_states.get(ext) == AGENT_AVAILABLE]
+
+    # === ОЦЕНКА ===
+
+    def estimate(self, queue_name: str) -> Dict[str, Any]:
+        """Оценка ожидания и уровня сервиса (кэшируется до изменения метрик)"""
+        now = time.monotonic()
+        stats = self._queue(queue_name)
+
+        if stats.estimate is not None and not stats.dirty and now - stats.estimated_at < self.cache_seconds:
+            return stats.estimate
+
+        stats.evict(now, self.window_seconds)
+
+        # Интенсивность по фактически наблюдаемой части окна
+        observed = min(self.window_seconds, max(now - stats.first_seen, 60.0))
+        arrival_rate = len(stats.arrivals) / observed  # звонков в секунду
+        handle_time = (stats.handle_sum / len(stats.handle_times)
+                       if stats.handle_times else self.default_handle_time)
+        traffic = arrival_rate * handle_time  # Эрланги
+
+        staffed = sum(1 for ext in stats.members if self.agent_states.get(ext) in (AGENT_AVAILABLE, AGENT_BUSY))
+        available = sum(1 for ext in stats.members if self.agent_states.get(ext) == AGENT_AVAILABLE)
+
+        overloaded = staffed == 0 or traffic >= staffed
+        if overloaded:
+            # Erlang C не определен - оценка по времени разбора текущей очереди
+            prob_wait = 1.0
+            expected_wait = (stats.waiting + 1) * handle_time / max(staffed, 1)
+            service_level = 0.0
+        else:
+            prob_wait = erlang_c(traffic, staffed)
+            expected_wait = prob_wait * handle_time / (staffed - traffic)
+            service_level = 1 - prob_wait * math.exp(
+                -(staffed - traffic) * self.service_level_target / handle_time
+            )
+
+        stats.estimate = {
+            "queue_name": queue_name,
+            "arrival_rate_per_min": round(arrival_rate * 60, 3),
+            "avg_handle_time": round(handle_time, 1),
+            "traffic_erlangs": round(traffic, 3),
+            "staffed_agents": staffed,
+            "available_agents": available,
+            "waiting_calls": stats.waiting,
+            "probability_wait": round(prob_wait, 4),
+            "expected_wait_seconds": int(round(expected_wait)),
+            "service_level": round(service_level, 4),
+            "service_level_target_seconds": self.service_level_target,
+            "overloaded": overloaded
+        }
+        stats.estimated_at = now
+        stats.dirty = False
+        self.estimates_computed += 1
+        return stats.estimate
+
+    def get_all_estimates(self) -> Dict[str, Dict[str, Any]]:
+        return {queue_name: self.estimate(queue_name) for queue_name in list(self.queues)}
+
+    # === ПРОГРЕВ ===
+
+    async def load_from_db(self, db):
+        """Начальное заполнение: состав очередей, статусы операторов и звонки за окно"""
+        try:
+            operators = {operator.id: operator for operator in await db.get_operators()}
+            for operator in operators.values():
+                self.agent_states[operator.extension] = OPERATOR_STATUS_STATES.get(
+                    getattr(operator.status, "value", operator.status), AGENT_OFFLINE
+                )
+
+            for queue in await db.get_queues():
+                for operator_id in queue.operator_ids:
+                    operator = operators.get(operator_id)
+                    if operator:
+                        self.add_queue_member(queue.name, operator.extension)
+
+            # Поступления и время обслуживания за окно
+            now = time.monotonic()
+            now_utc = datetime.utcnow()
+            since = now_utc - timedelta(seconds=self.window_seconds)
+            cursor = db.calls.find(
+                {"start_time": {"$gte": since}, "queue_name": {"$ne": None}},
+                {"queue_name": 1, "start_time": 1, "talk_time": 1, "_id": 0}
+            ).sort("start_time", 1)
+
+            loaded = 0
+            async for call in cursor:
+                stats = self._queue(call["queue_name"])
+                stats.first_seen = min(stats.first_seen, now - self.window_seconds)
+                started = now - (now_utc - call["start_time"]).total_seconds()
+                stats.arrivals.append(started)
+                if call.get("talk_time"):
+                    stats.handle_times.append((started, call["talk_time"]))
+                    stats.handle_sum += call["talk_time"]
+                stats.dirty = True
+                loaded += 1
+
+            logger.info(f"📈 Queue estimator warmed up: {len(self.queues)} queues, "
+                        f"{len(self.agent_states)} agents, {loaded} recent calls")
+        except Exception as e:
+            logger.error(f"Error warming up queue estimator: {e}")
+
+# Глобальный экземпляр
+_queue_estimator: Optional[QueueWaitEstimator] = None
+
+def get_queue_estimator() -> QueueWaitEstimator:
+    """Получение глобального оценщика очередей"""
+    global _queue_estimator
+    if _queue_estimator is None:
+        _queue_estimator = QueueWaitEstimator()
+    return _queue_estimator
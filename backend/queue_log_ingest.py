@@ -0,0 +1,299 @@
+"""
+Smart Call Center - Queue Log Ingester
+======================================
+
+Восстановление исторической статистики очередей из таблицы queue_log
+Asterisk (ENTERQUEUE / CONNECT / ABANDON / COMPLETE* / EXIT*).
+
+queue_log читается большими порциями серверным курсором. Каждая порция
+обрабатывается NumPy целиком: ожидание и разговор берутся из полей
+завершающих событий (holdtime в CONNECT, waittime в ABANDON/EXIT*,
+calltime в COMPLETE*), поэтому для сборки звонка не нужно связывать
+строки между порциями. Итоги складываются по (очередь, день) через
+bincount и сохраняются в queue_rollups, откуда статистика за любой
+период собирается в формате QueueStats дашборда.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import DeleteMany, UpdateOne
+
+from config import config
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+QUEUE_LOG_EVENTS = (
+    "ENTERQUEUE", "CONNECT", "ABANDON", "COMPLETECALLER", "COMPLETEAGENT",
+    "TRANSFER", "EXITWITHTIMEOUT", "EXITEMPTY", "EXITWITHKEY"
+)
+
+# Суммы дневного итога очереди
+ROLLUP_FIELDS = (
+    "offered", "answered", "abandoned", "timeout", "answered_in_sla",
+    "wait_sum", "answer_wait_sum", "talk_sum", "talk_count"
+)
+
+def _to_number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _numeric(column: tuple, mask: "np.ndarray") -> "np.ndarray":
+    """Числовые значения поля data* только для строк нужных событий (остальные - 0)"""
+    values = np.zeros(len(column), dtype=np.float64)
+    index = np.flatnonzero(mask)
+    if len(index):
+        selected = np.asarray(column, dtype=object)[index]
+        try:
+            values[index] = selected.astype(np.float64)
+        except (TypeError, ValueError):
+            # Пустые или нечисловые значения - построчно
+            values[index] = np.fromiter((_to_number(value) for value in selected), dtype=np.float64, count=len(index))
+    return values
+
+def _day_ordinal(value) -> int:
+    """Время события (datetime или строка из varchar-колонки) -> номер дня"""
+    if isinstance(value, datetime):
+        return value.toordinal()
+    return date.fromisoformat(str(value)[:10]).toordinal()
+
+def day_bounds(start_date: datetime, end_date: datetime) -> Tuple[datetime, datetime]:
+    """Целые дни, покрывающие [start_date, end_date): начало дня start, конец округляется вверх"""
+    start_day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    end_day = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    if end_day < end_date:
+        end_day += timedelta(days=1)
+    return start_day, end_day
+
+def rollup_to_queue_stats(queue_id: str, queue_name: str, sums: Dict[str, float]) -> Dict[str, Any]:
+    """Суммы -> поля QueueStats (те же формулы, что в DatabaseManager.get_queue_stats)"""
+    answered = sums.get("answered", 0)
+    total_calls = answered + sums.get("abandoned", 0) + sums.get("timeout", 0)
+
+    return {
+        "queue_id": queue_id,
+        "queue_name": queue_name,
+        "total_calls": int(total_calls),
+        "answered_calls": int(answered),
+        "missed_calls": int(sums.get("timeout", 0)),
+        "abandoned_calls": int(sums.get("abandoned", 0)),
+        "avg_wait_time": round(sums.get("wait_sum", 0) / total_calls, 2) if total_calls else 0.0,
+        "avg_talk_time": round(sums.get("talk_sum", 0) / sums["talk_count"], 2) if sums.get("talk_count") else 0.0,
+        "service_level": round(sums.get("answered_in_sla", 0) / total_calls * 100, 2) if total_calls else 0.0,
+        "answer_rate": round(answered / total_calls * 100, 2) if total_calls else 0.0,
+        "max_wait_time": float(sums.get("max_wait", 0))
+    }
+
+class QueueLogIngester:
+    """Пересборка дневных итогов очередей из queue_log"""
+
+    def __init__(self, batch_size: int = None, sla_seconds: int = None):
+        self.batch_size = batch_size or config.QUEUE_LOG_BATCH_SIZE
+        self.sla_seconds = sla_seconds or config.SERVICE_LEVEL_TARGET_SECONDS
+        self._task: Optional[asyncio.Task] = None
+
+        # Состояние последней пересборки
+        self.last_range: Optional[Tuple[datetime, datetime]] = None
+        self.last_started_at: Optional[datetime] = None
+        self.last_finished_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.rows_processed = 0
+        self.rollups_written = 0
+        self.last_duration_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # === ВЕКТОРНАЯ ОБРАБОТКА ПОРЦИИ ===
+
+    def aggregate_chunk(self, rows: List[tuple], totals: Dict[Tuple[str, str], Dict[str, float]]):
+        """Порция строк queue_log (QUEUE_LOG_COLUMNS) -> суммы по (очередь, день)"""
+        if not rows:
+            return
+
+        times, _, queues, _, events, data1, data2, data3, data4 = zip(*rows)
+        count = len(rows)
+
+        events = np.array(events, dtype=str)
+        days = np.fromiter((_day_ordinal(value) for value in times), dtype=np.int64, count=count)
+
+        is_enter = events == "ENTERQUEUE"
+        is_connect = events == "CONNECT"
+        is_abandon = events == "ABANDON"
+        is_timeout = np.isin(events, ("EXITWITHTIMEOUT", "EXITEMPTY", "EXITWITHKEY"))
+        is_complete = np.isin(events, ("COMPLETECALLER", "COMPLETEAGENT"))
+        is_transfer = events == "TRANSFER"
+
+        # Поля data* разбираются только у событий, где они числовые
+        d1 = _numeric(data1, is_connect)
+        d2 = _numeric(data2, is_complete)
+        d3 = _numeric(data3, is_abandon | is_timeout)
+        d4 = _numeric(data4, is_transfer | (events == "EXITWITHKEY"))
+
+        # Ожидание: holdtime в CONNECT, waittime в ABANDON/EXIT* (в EXITWITHKEY - data4)
+        wait = np.select(
+            [is_connect, is_abandon, events == "EXITWITHKEY", is_timeout],
+            [d1, d3, d4, d3],
+            default=0.0
+        )
+        # Разговор: calltime в COMPLETE* (data2) и TRANSFER (data4)
+        talk = np.select([is_complete, is_transfer], [d2, d4], default=0.0)
+
+        # Группа = очередь x день
+        queue_names, queue_index = np.unique(np.array(queues, dtype=str), return_inverse=True)
+        day_values, day_index = np.unique(days, return_inverse=True)
+        groups = queue_index * len(day_values) + day_index
+        size = len(queue_names) * len(day_values)
+
+        def bincount(weights) -> "np.ndarray":
+            return np.bincount(groups, weights=weights.astype(np.float64), minlength=size)
+
+        is_talk = is_complete | is_transfer
+        sums = {
+            "offered": bincount(is_enter),
+            "answered": bincount(is_connect),
+            "abandoned": bincount(is_abandon),
+            "timeout": bincount(is_timeout),
+            "answered_in_sla": bincount(is_connect & (d1 <= self.sla_seconds)),
+            "wait_sum": bincount(np.where(is_connect | is_abandon | is_timeout, wait, 0.0)),
+            "answer_wait_sum": bincount(np.where(is_connect, wait, 0.0)),
+            "talk_sum": bincount(talk),
+            "talk_count": bincount(is_talk)
+        }
+        max_wait = np.zeros(size)
+        np.maximum.at(max_wait, groups, wait)
+
+        for group in np.flatnonzero(np.bincount(groups, minlength=size)):
+            day = date.fromordinal(int(day_values[group % len(day_values)]))
+            key = (str(queue_names[group // len(day_values)]), day.isoformat())
+            target = totals.setdefault(key, dict.fromkeys(ROLLUP_FIELDS, 0.0) | {"max_wait": 0.0})
+            for field in ROLLUP_FIELDS:
+                target[field] += float(sums[field][group])
+            target["max_wait"] = max(target["max_wait"], float(max_wait[group]))
+
+    # === ПЕРЕСБОРКА ===
+
+    async def rebuild(self, db, asterisk_db, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        """Пересборка дневных итогов за целые дни, покрывающие [start_date, end_date)"""
+        start_day, end_day = day_bounds(start_date, end_date)
+
+        started = time.perf_counter()
+        self.last_range = (start_day, end_day)
+        self.last_started_at = datetime.utcnow()
+        self.last_error = None
+        self.rows_processed = 0
+
+        totals: Dict[Tuple[str, str], Dict[str, float]] = {}
+        async for chunk in asterisk_db.stream_queue_log(start_day, end_day, QUEUE_LOG_EVENTS, self.batch_size):
+            self.aggregate_chunk(chunk, totals)
+            self.rows_processed += len(chunk)
+            await asyncio.sleep(0)
+
+        # Итоги периода заменяются целиком: дни и очереди, которых больше нет
+        # в queue_log, не должны остаться в статистике. ordered - удаление
+        # выполняется до записи новых итогов
+        updated_at = datetime.utcnow()
+        operations = [DeleteMany({"date": {"$gte": start_day.strftime("%Y-%m-%d"),
+                                           "$lt": end_day.strftime("%Y-%m-%d")}})]
+        operations.extend(
+            UpdateOne(
+                {"queue_name": queue_name, "date": date},
+                {"$set": {**sums, "queue_name": queue_name, "date": date, "updated_at": updated_at}},
+                upsert=True
+            )
+            for (queue_name, date), sums in totals.items()
+        )
+        await db.queue_rollups.bulk_write(operations, ordered=True)
+
+        self.rollups_written = len(totals)
+        self.last_finished_at = datetime.utcnow()
+        self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        logger.info(f"📈 Queue log rebuilt {start_day:%Y-%m-%d}..{end_day:%Y-%m-%d}: "
+                    f"{self.rows_processed} events -> {self.rollups_written} rollups in {self.last_duration_ms} ms")
+        return self.get_stats()
+
+    def start_rebuild(self, db, asterisk_db, start_date: datetime, end_date: datetime) -> bool:
+        """Пересборка в фоне; False - предыдущая еще выполняется"""
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self._run_rebuild(db, asterisk_db, start_date, end_date))
+        return True
+
+    async def _run_rebuild(self, db, asterisk_db, start_date: datetime, end_date: datetime):
+        try:
+            await self.rebuild(db, asterisk_db, start_date, end_date)
+        except Exception as e:
+            self.last_error = str(e)
+            self.last_finished_at = datetime.utcnow()
+            logger.error(f"Error rebuilding queue log rollups: {e}")
+
+    # === ЧТЕНИЕ ИТОГОВ ===
+
+    async def get_queue_history(self, db, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        """Статистика очередей за целые дни, покрывающие [start_date, end_date) (формат QueueStats)"""
+        start_day, end_day = day_bounds(start_date, end_date)
+        start = start_day.strftime("%Y-%m-%d")
+        end = end_day.strftime("%Y-%m-%d")
+
+        per_queue: Dict[str, Dict[str, float]] = {}
+        daily = []
+        cursor = db.queue_rollups.find({"date": {"$gte": start, "$lt": end}}, {"_id": 0}).sort("date", 1)
+        async for rollup in cursor:
+            totals = per_queue.setdefault(rollup["queue_name"], dict.fromkeys(ROLLUP_FIELDS, 0.0) | {"max_wait": 0.0})
+            for field in ROLLUP_FIELDS:
+                totals[field] += rollup.get(field, 0)
+            totals["max_wait"] = max(totals["max_wait"], rollup.get("max_wait", 0))
+            daily.append({"date": rollup["date"], **rollup_to_queue_stats(None, rollup["queue_name"], rollup)})
+
+        queue_ids = {queue.name: queue.id for queue in await db.get_queues()}
+        queues = [
+            rollup_to_queue_stats(queue_ids.get(queue_name, queue_name), queue_name, totals)
+            for queue_name, totals in sorted(per_queue.items())
+        ]
+        for day in daily:
+            day["queue_id"] = queue_ids.get(day["queue_name"], day["queue_name"])
+
+        return {
+            "period": {"start_date": start, "end_date": end},
+            "queues": queues,
+            "daily": daily
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "batch_size": self.batch_size,
+            "range": {
+                "start_date": self.last_range[0].isoformat(),
+                "end_date": self.last_range[1].isoformat()
+            } if self.last_range else None,
+            "started_at": self.last_started_at.isoformat() if self.last_started_at else None,
+            "finished_at": self.last_finished_at.isoformat() if self.last_finished_at else None,
+            "rows_processed": self.rows_processed,
+            "rollups_written": self.rollups_written,
+            "duration_ms": self.last_duration_ms,
+            "error": self.last_error
+        }
+
+# Глобальный экземпляр
+_queue_log_ingester: Optional[QueueLogIngester] = None
+
+def get_queue_log_ingester() -> QueueLogIngester:
+    """Получение глобального загрузчика queue_log"""
+    global _queue_log_ingester
+    if _queue_log_ingester is None:
+        _queue_log_ingester = QueueLogIngester()
+    return _queue_log_ingester
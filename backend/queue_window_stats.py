@@ -0,0 +1,101 @@
+"""
+Smart Call Center - Sliding Window Queue Statistics
+===================================================
+
+Статистика очередей реального времени в памяти.
+
+Для каждой очереди ведется кольцевой буфер поминутных корзин
+(60 минут): предложенные, отвеченные, брошенные звонки, ответы в
+пределах SLA и суммарное ожидание. Окна 5/15/60 минут считаются
+суммой последних корзин, текущие ожидающие звонящие хранятся в
+порядке входа в очередь (самое долгое ожидание - первый элемент).
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+WINDOWS_MINUTES = (5, 15, 60)
+BUCKET_SECONDS = 60
+RING_SIZE = max(WINDOWS_MINUTES)
+
+# Поля корзины
+COUNTERS = ("offered", "answered", "abandoned", "timeout", "answered_in_sla", "answer_wait_sum", "abandon_wait_sum")
+
+class MinuteRing:
+    """Кольцевой буфер поминутных счетчиков"""
+
+    __slots__ = ("minutes", "buckets")
+
+    def __init__(self):
+        self.minutes = [-1] * RING_SIZE
+        self.buckets = [dict.fromkeys(COUNTERS, 0) for _ in range(RING_SIZE)]
+
+    def add(self, counter: str, value: float = 1, now: float = None):
+        minute = int((now or time.time()) // BUCKET_SECONDS)
+        index = minute % RING_SIZE
+        bucket = self.buckets[index]
+        if self.minutes[index] != minute:
+            # Корзина осталась от прошлого круга - обнуляем
+            for key in COUNTERS:
+                bucket[key] = 0
+            self.minutes[index] = minute
+        bucket[counter] += value
+
+    def window(self, minutes: int, now: float = None) -> Dict[str, float]:
+        """Сумма счетчиков за последние N минут (включая текущую)"""
+        current = int((now or time.time()) // BUCKET_SECONDS)
+        totals = dict.fromkeys(COUNTERS, 0)
+        for minute in range(current - minutes + 1, current + 1):
+            index = minute % RING_SIZE
+            if self.minutes[index] == minute:
+                bucket = self.buckets[index]
+                for key in COUNTERS:
+                    totals[key] += bucket[key]
+        return totals
+
+class QueueWindowStats:
+    """Скользящие окна и текущие ожидающие одной очереди"""
+
+    __slots__ = ("queue_name", "ring", "waiting")
+
+    def __init__(self, queue_name: str):
+        self.queue_name = queue_name
+        self.ring = MinuteRing()
+        self.waiting: "OrderedDict[str, float]" = OrderedDict()  # uniqueid -> время входа
+
+    def snapshot(self, sla_seconds: int, now: float = None) -> Dict[str, Any]:
+        now = now or time.time()
+        longest_wait = now - next(iter(self.waiting.values())) if self.waiting else 0
+
+        windows = {}
+        for minutes in WINDOWS_MINUTES:
+            totals = self.ring.window(minutes, now)
+            handled = totals["answered"] + totals["abandoned"] + totals["timeout"]
+            windows[f"{minutes}m"] = {
+                "offered": totals["offered"],
+                "answered": totals["answered"],
+                "abandoned": totals["abandoned"],
+                "timeout": totals["timeout"],
+                "answer_rate": round(totals["answered"] / handled, 4) if handled else None,
+                # Уровень сервиса: отвеченные в пределах SLA от всех завершивших ожидание
+                "service_level": round(totals["answered_in_sla"] / handled, 4) if handled else None,
+                "avg_answer_wait": round(totals["answer_wait_sum"] / totals["answered"], 1) if totals["answered"] else 0,
+                "avg_abandon_wait": round(totals["abandon_wait_sum"] / totals["abandoned"], 1) if totals["abandoned"] else 0
+            }
+
+        return {
+            "queue_name": self.queue_name,
+            "waiting_calls": len(self.waiting),
+            "longest_wait_seconds": int(max(longest_wait, 0)),
+            "service_level_target_seconds": sla_seconds,
+            "windows": windows
+        }
+
+    @staticmethod
+    def timestamp(value: Optional[datetime]) -> Optional[float]:
+        """datetime (UTC, naive) -> unix time для корзин"""
+        if value is None:
+            return None
+        return (value - datetime(1970, 1, 1)).total_seconds()
@@ -0,0 +1,234 @@
+"""
+Smart Call Center - CDR Reconciliation
+======================================
+
+Сверка звонков SmartCallCenter (calls) с CDR Asterisk.
+
+Период делится на интервалы по времени начала звонка. Для каждого
+интервала обе стороны дают (число строк, XOR хэшей строк
+uniqueid|disposition|billsec): CDR - одной группирующей выборкой в
+СУБД, calls - потоковым проходом по проекции. Построчно сравниваются
+только интервалы с разными хэшами, поэтому год данных проверяется за
+минуты, а отчет содержит конкретные расходящиеся звонки.
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Статус звонка SmartCallCenter -> disposition CDR
+STATUS_DISPOSITION = {
+    "answered": "ANSWERED",
+    "completed": "ANSWERED",
+    "transferred": "ANSWERED",
+    "failed": "FAILED"
+}
+
+def record_digest(dialect: str, uniqueid: str, disposition: str, billsec: int) -> int:
+    """Хэш строки, совпадающий с вычисляемым в СУБД (CRC32 / MD5[:32 бит])"""
+    value = f"{uniqueid}|{disposition}|{billsec}".encode("utf-8")
+    if dialect == "mysql":
+        return zlib.crc32(value)
+    return int(hashlib.md5(value).hexdigest()[:8], 16)
+
+def _naive_utc(value: datetime) -> datetime:
+    """Даты calls из MongoDB - naive UTC; aware дата запроса (...Z) приводится к ним"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def call_to_record(call: Dict[str, Any]) -> Optional[Tuple[str, str, int]]:
+    """Документ calls -> (uniqueid, disposition, billsec) в терминах CDR"""
+    uniqueid = call.get("uniqueid") or call.get("channel_id")
+    if not uniqueid:
+        return None
+    disposition = STATUS_DISPOSITION.get(call.get("status"), "NO ANSWER")
+    billsec = int(call.get("talk_time") or 0) if disposition == "ANSWERED" else 0
+    return str(uniqueid), disposition, billsec
+
+class CdrReconciler:
+    """Сверка calls и CDR по хэшам интервалов с детализацией расхождений"""
+
+    def __init__(self, chunk_minutes: int = None, max_differences: int = None):
+        self.chunk_minutes = chunk_minutes or config.RECONCILE_CHUNK_MINUTES
+        self.max_differences = max_differences or config.RECONCILE_MAX_DIFFERENCES
+        # Сдвиг calldate (локальное время АТС) относительно UTC в calls
+        self.cdr_offset = timedelta(minutes=config.ASTERISK_CDR_UTC_OFFSET_MINUTES)
+        self._task: Optional[asyncio.Task] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _calls_chunk_digests(self, db, dialect: str, start_date: datetime, end_date: datetime,
+                                   chunk_seconds: int) -> Dict[int, Tuple[int, int]]:
+        """Хэши интервалов calls одним потоковым проходом по проекции"""
+        digests: Dict[int, List[int]] = {}
+        cursor = db.calls.find(
+            {"start_time": {"$gte": start_date, "$lt": end_date}},
+            {"_id": 0, "uniqueid": 1, "channel_id": 1, "status": 1, "talk_time": 1, "start_time": 1}
+        ).batch_size(5000)
+
+        async for call in cursor:
+            record = call_to_record(call)
+            if record is None:
+                continue
+            chunk = int((call["start_time"] - start_date).total_seconds()) // chunk_seconds
+            entry = digests.setdefault(chunk, [0, 0])
+            entry[0] += 1
+            entry[1] ^= record_digest(dialect, *record)
+
+        return {chunk: (count, digest) for chunk, (count, digest) in digests.items()}
+
+    async def _drill_down(self, db, asterisk_db, chunk_start: datetime,
+                          chunk_end: datetime) -> Tuple[Dict[str, tuple], Dict[str, tuple]]:
+        """Построчные записи обеих сторон для расходящегося интервала"""
+        cdr_records = {}
+        for row in await asterisk_db.get_cdr_reconcile_rows(chunk_start + self.cdr_offset, chunk_end + self.cdr_offset):
+            cdr_records[str(row["uniqueid"])] = (row["disposition"], int(row["billsec"] or 0), row["calldate"] - self.cdr_offset)
+
+        call_records = {}
+        cursor = db.calls.find(
+            {"start_time": {"$gte": chunk_start, "$lt": chunk_end}},
+            {"_id": 0, "id": 1, "uniqueid": 1, "channel_id": 1, "status": 1, "talk_time": 1, "start_time": 1}
+        )
+        async for call in cursor:
+            record = call_to_record(call)
+            if record is not None:
+                call_records[record[0]] = (record[1], record[2], call["start_time"], call.get("id"))
+
+        return cdr_records, call_records
+
+    @staticmethod
+    def _differs(cdr: tuple, call: tuple, billsec_tolerance: int) -> bool:
+        return cdr[0] != call[0] or abs(cdr[1] - call[1]) > billsec_tolerance
+
+    @staticmethod
+    def _mismatch(uniqueid: str, cdr: tuple, call: tuple) -> Dict[str, Any]:
+        return {
+            "uniqueid": uniqueid,
+            "call_id": call[3],
+            "start_time": call[2].isoformat(),
+            "cdr": {"disposition": cdr[0], "billsec": cdr[1]},
+            "calls": {"disposition": call[0], "billsec": call[1]}
+        }
+
+    async def reconcile(self, db, asterisk_db, start_date: datetime, end_date: datetime,
+                        billsec_tolerance: int = 0) -> Dict[str, Any]:
+        """Сверка периода: хэши всех интервалов, детализация только различающихся"""
+        start_date, end_date = _naive_utc(start_date), _naive_utc(end_date)
+        started = time.perf_counter()
+        dialect = asterisk_db.config.db_type.lower()
+        chunk_seconds = self.chunk_minutes * 60
+
+        cdr_digests = await asterisk_db.get_cdr_chunk_digests(
+            start_date + self.cdr_offset, end_date + self.cdr_offset, chunk_seconds
+        )
+        call_digests = await self._calls_chunk_digests(db, dialect, start_date, end_date, chunk_seconds)
+
+        total_chunks = int((end_date - start_date).total_seconds() + chunk_seconds - 1) // chunk_seconds
+        different = sorted(
+            chunk for chunk in set(cdr_digests) | set(call_digests)
+            if cdr_digests.get(chunk, (0, 0)) != call_digests.get(chunk, (0, 0))
+        )
+
+        only_in_cdr: Dict[str, tuple] = {}
+        only_in_calls: Dict[str, tuple] = {}
+        mismatched = []
+        for chunk in different:
+            chunk_start = start_date + timedelta(seconds=chunk * chunk_seconds)
+            chunk_end = min(chunk_start + timedelta(seconds=chunk_seconds), end_date)
+            cdr_records, call_records = await self._drill_down(db, asterisk_db, chunk_start, chunk_end)
+
+            for uniqueid, cdr in cdr_records.items():
+                call = call_records.pop(uniqueid, None)
+                if call is None:
+                    only_in_cdr[uniqueid] = cdr
+                elif self._differs(cdr, call, billsec_tolerance):
+                    mismatched.append(self._mismatch(uniqueid, cdr, call))
+            only_in_calls.update(call_records)
+            await asyncio.sleep(0)
+
+        # Звонок на границе интервалов (секунда расхождения во времени начала)
+        # попадает в "только CDR" одного интервала и "только calls" соседнего
+        for uniqueid in set(only_in_cdr) & set(only_in_calls):
+            cdr, call = only_in_cdr.pop(uniqueid), only_in_calls.pop(uniqueid)
+            if self._differs(cdr, call, billsec_tolerance):
+                mismatched.append(self._mismatch(uniqueid, cdr, call))
+
+        limit = self.max_differences
+        report = {
+            "period": {"start_date": start_date.isoformat(), "end_date": end_date.isoformat()},
+            "chunk_minutes": self.chunk_minutes,
+            "billsec_tolerance": billsec_tolerance,
+            "chunks_total": total_chunks,
+            "chunks_different": len(different),
+            "totals": {
+                "cdr_rows": sum(count for count, _ in cdr_digests.values()),
+                "calls_rows": sum(count for count, _ in call_digests.values())
+            },
+            "differences": {
+                "only_in_cdr_count": len(only_in_cdr),
+                "only_in_calls_count": len(only_in_calls),
+                "mismatched_count": len(mismatched),
+                "only_in_cdr": [
+                    {"uniqueid": uniqueid, "calldate": cdr[2].isoformat(), "disposition": cdr[0], "billsec": cdr[1]}
+                    for uniqueid, cdr in sorted(only_in_cdr.items(), key=lambda item: item[1][2])[:limit]
+                ],
+                "only_in_calls": [
+                    {"uniqueid": uniqueid, "call_id": call[3], "start_time": call[2].isoformat(),
+                     "disposition": call[0], "billsec": call[1]}
+                    for uniqueid, call in sorted(only_in_calls.items(), key=lambda item: item[1][2])[:limit]
+                ],
+                "mismatched": sorted(mismatched, key=lambda item: item["start_time"])[:limit]
+            },
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            "finished_at": datetime.utcnow().isoformat()
+        }
+
+        logger.info(f"🔍 Reconciled {start_date:%Y-%m-%d}..{end_date:%Y-%m-%d}: {len(different)}/{total_chunks} chunks differ, "
+                    f"{len(only_in_cdr)} only in CDR, {len(only_in_calls)} only in calls, {len(mismatched)} mismatched")
+        return report
+
+    def start_reconcile(self, db, asterisk_db, start_date: datetime, end_date: datetime,
+                        billsec_tolerance: int = 0) -> bool:
+        """Сверка в фоне; False - предыдущая еще выполняется"""
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self._run(db, asterisk_db, start_date, end_date, billsec_tolerance))
+        return True
+
+    async def _run(self, db, asterisk_db, start_date: datetime, end_date: datetime, billsec_tolerance: int):
+        self.last_error = None
+        try:
+            self.last_report = await self.reconcile(db, asterisk_db, start_date, end_date, billsec_tolerance)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Error reconciling calls with CDR: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "error": self.last_error,
+            "report": self.last_report
+        }
+
+# Глобальный экземпляр
+_cdr_reconciler: Optional[CdrReconciler] = None
+
+def get_cdr_reconciler() -> CdrReconciler:
+    """Получение глобального сверщика calls/CDR"""
+    global _cdr_reconciler
+    if _cdr_reconciler is None:
+        _cdr_reconciler = CdrReconciler()
+    return _cdr_reconciler
@@ -0,0 +1,176 @@
+"""
+Smart Call Center - Report Cache
+================================
+
+Кэш результатов отчетов по CDR (/admin/reports/cdr-data,
+/admin/reports/hybrid-statistics), чтобы обновление страницы не
+нагружало БД АТС, которую параллельно использует сам Asterisk.
+
+Ключ - (вид запроса, нормализованный период, фильтры). Закрытый период
+(конец раньше now - REPORT_CACHE_SETTLE_SECONDS, после которого поздние
+CDR длинных звонков уже записаны) хранится без срока; открытый период
+округляется до REPORT_CACHE_RESOLUTION_SECONDS и живет
+REPORT_CACHE_OPEN_TTL секунд. Одновременные запросы одного ключа ждут
+одно вычисление (single-flight), размер ограничен LRU.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from config import config
+
+def _floor(value: datetime, resolution: int) -> datetime:
+    """Округление вниз до resolution секунд (делитель суток)"""
+    seconds = value.hour * 3600 + value.minute * 60 + value.second
+    return value.replace(microsecond=0) - timedelta(seconds=seconds % resolution)
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+class ReportCache:
+    """LRU кэш результатов отчетов с single-flight и сроком жизни открытых периодов"""
+
+    def __init__(self, max_size: int = None, open_ttl: float = None,
+                 settle_seconds: int = None, resolution: int = None):
+        self.max_size = max_size if max_size is not None else config.REPORT_CACHE_MAX_SIZE
+        self.open_ttl = open_ttl if open_ttl is not None else config.REPORT_CACHE_OPEN_TTL
+        self.settle_seconds = config.REPORT_CACHE_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+        self.resolution = resolution or config.REPORT_CACHE_RESOLUTION_SECONDS
+        # calldate CDR - локальное время АТС
+        self.cdr_offset = timedelta(minutes=config.ASTERISK_CDR_UTC_OFFSET_MINUTES)
+
+        # key -> (value, expires_at | None для закрытого периода)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # key -> вычисление в процессе
+        self._pending: Dict[Hashable, asyncio.Task] = {}
+        # Увеличивается при clear(): вычисление, начатое до очистки, не сохраняется
+        self._generation = 0
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    # === КЛЮЧИ ===
+
+    def normalize_range(self, start_date: datetime, end_date: datetime) -> Tuple[datetime, datetime, bool]:
+        """(start, end, closed): открытый период округляется, чтобы обновления страницы попадали в кэш"""
+        settled_before = datetime.utcnow() + self.cdr_offset - timedelta(seconds=self.settle_seconds)
+        if _naive_utc(end_date) <= settled_before:
+            return start_date, end_date, True
+        return _floor(start_date, self.resolution), _floor(end_date, self.resolution), False
+
+    @staticmethod
+    def make_key(kind: str, start_date: datetime = None, end_date: datetime = None, **filters) -> Hashable:
+        return (
+            kind,
+            start_date.isoformat() if start_date else None,
+            end_date.isoformat() if end_date else None,
+            tuple(sorted(filters.items()))
+        )
+
+    # === ЧТЕНИЕ / ВЫЧИСЛЕНИЕ ===
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._entries[key]
+            return False, None
+
+        self._entries.move_to_end(key)
+        return True, value
+
+    def put(self, key: Hashable, value: Any, closed: bool):
+        if not self.enabled:
+            return
+
+        if key in self._entries:
+            del self._entries[key]
+        self._entries[key] = (value, None if closed else time.monotonic() + self.open_ttl)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], closed: bool,
+                             cacheable: Callable[[Any], bool] = None) -> Any:
+        """Значение из кэша или одно общее вычисление для всех одновременных запросов ключа
+
+        cacheable - условие сохранения результата (например, не кэшировать
+        пустой ответ, которым менеджер БД сообщает об ошибке).
+        """
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            return value
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            pending = self._pending[key] = asyncio.create_task(self._compute(key, compute, closed, cacheable))
+            # Исключение забирается, даже если все ожидающие запросы отменены
+            pending.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        # Отключившийся клиент не отменяет вычисление для остальных
+        return await asyncio.shield(pending)
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], closed: bool,
+                       cacheable: Optional[Callable[[Any], bool]]) -> Any:
+        generation = self._generation
+        try:
+            value = await compute()
+            if generation == self._generation and (cacheable is None or cacheable(value)):
+                self.put(key, value, closed)
+            return value
+        finally:
+            self._pending.pop(key, None)
+
+    def clear(self):
+        """Полная очистка (например, при смене БД Asterisk)"""
+        self._entries.clear()
+        self._generation += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики кэша"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "open_ttl_seconds": self.open_ttl,
+            "settle_seconds": self.settle_seconds,
+            "resolution_seconds": self.resolution,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+            "closed_entries": sum(1 for _, expires_at in self._entries.values() if expires_at is None),
+            "in_flight": len(self._pending)
+        }
+
+# Глобальный экземпляр
+_report_cache: Optional[ReportCache] = None
+
+def get_report_cache() -> ReportCache:
+    """Получение глобального кэша отчетов"""
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = ReportCache()
+    return _report_cache
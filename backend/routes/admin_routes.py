@@ -1,17 +1,23 @@
 from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
 from models import (
     User, UserCreate, UserResponse, Group, GroupCreate,
     SystemSettings, SystemSettingsUpdate, AsteriskConfig,
-    APIResponse, UserRole, OperatorCreate
+    APIResponse, UserRole, OperatorCreate,
+    NumberPlanRule, NumberPlanRuleCreate
 )
 from database import DatabaseManager
-from auth import require_admin, get_password_hash
+from auth import require_admin, get_password_hash_async
+from principal_cache import get_principal_cache
+from number_plan import get_number_plan, normalize_number
+from skill_router import get_skill_router
+from caller_affinity import get_caller_affinity
+from operator_counters import get_operator_counters
 
 # Import the get_db function from db
 import sys
@@ -65,7 +71,7 @@ async def create_user(
     # Hash password and create user
     from models import User as UserModel
     user_dict = user_data.dict()
-    user_dict["password_hash"] = get_password_hash(user_data.password)
+    user_dict["password_hash"] = await get_password_hash_async(user_data.password)
     del user_dict["password"]
     
     # Remove extension from user data if present
@@ -163,7 +169,7 @@ async def update_user(
     
     # Hash password if provided
     if "password" in user_updates:
-        user_updates["password_hash"] = get_password_hash(user_updates["password"])
+        user_updates["password_hash"] = await get_password_hash_async(user_updates["password"])
         del user_updates["password"]
     
     success = await db.update_user(user_id, user_updates)
@@ -229,6 +235,8 @@ async def delete_user(
     operator = await db.get_operator_by_user_id(user_id)
     if operator:
         await db.operators.delete_one({"user_id": user_id})
+        get_skill_router().remove_operator(operator.id)
+        get_caller_affinity().forget_operator(operator.id)
     
     # Delete user
     success = await db.delete_user(user_id)
@@ -286,6 +294,11 @@ async def update_user_operator_info(
         {"$set": update_dict}
     )
     
+    # Навыки/extension/статус могли измениться - обновляем индекс маршрутизации
+    updated_operator = await db.get_operator_by_user_id(user_id)
+    if updated_operator:
+        get_skill_router().upsert_operator(updated_operator)
+    
     if result.modified_count > 0:
         return APIResponse(success=True, message="Operator updated successfully")
     else:
@@ -374,6 +387,91 @@ async def get_groups(
     groups = await db.get_groups()
     return groups
 
+# Number Plan
+@router.get("/number-plan", response_model=Dict[str, Any])
+async def get_number_plan_rules(
+    current_user: User = Depends(require_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Get number plan rules and routing table status (admin only)"""
+    rules = await db.get_number_plan_rules()
+    return {
+        "rules": [rule.dict() for rule in rules],
+        "routing_table": get_number_plan().get_stats()
+    }
+
+@router.post("/number-plan", response_model=NumberPlanRule)
+async def create_number_plan_rule(
+    rule_data: NumberPlanRuleCreate,
+    current_user: User = Depends(require_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Create number plan rule and hot-reload routing table (admin only)"""
+    rule_data.pattern = normalize_number(rule_data.pattern)
+    if not rule_data.pattern:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pattern must contain digits"
+        )
+    
+    if rule_data.match_type not in ("exact", "prefix"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="match_type must be 'exact' or 'prefix'"
+        )
+    
+    existing = await db.number_plan.find_one({
+        "pattern": rule_data.pattern,
+        "match_type": rule_data.match_type,
+        "length": rule_data.length
+    })
+    if existing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Rule for {rule_data.pattern} ({rule_data.match_type}) already exists"
+        )
+    
+    rule = await db.create_number_plan_rule(rule_data)
+    await get_number_plan().reload(db)
+    return rule
+
+@router.delete("/number-plan/{rule_id}", response_model=APIResponse)
+async def delete_number_plan_rule(
+    rule_id: str,
+    current_user: User = Depends(require_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Delete number plan rule and hot-reload routing table (admin only)"""
+    success = await db.delete_number_plan_rule(rule_id)
+    if not success:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Number plan rule not found"
+        )
+    
+    await get_number_plan().reload(db)
+    return APIResponse(
+        success=True,
+        message="Number plan rule deleted successfully"
+    )
+
+@router.post("/number-plan/reload", response_model=Dict[str, Any])
+async def reload_number_plan(
+    current_user: User = Depends(require_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Recompile routing table from database (admin only)"""
+    await get_number_plan().reload(db)
+    return get_number_plan().get_stats()
+
+@router.get("/routing/stats", response_model=Dict[str, Any])
+async def get_routing_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Routing decision latency, number plan and skill routing metrics (admin only)"""
+    from call_flow_logic import call_flow_logic
+    return call_flow_logic.get_routing_stats()
+
 # System Settings
 @router.get("/settings", response_model=Optional[SystemSettings])
 async def get_system_settings(
@@ -393,6 +491,12 @@ async def update_system_settings(
     """Update system settings (admin only)"""
     settings = await db.update_system_settings(settings_update, current_user.id)
     
+    # Таймауты звонков применяются к новым дедлайнам без перезапуска
+    from asterisk_event_handler import get_event_handler
+    event_handler = get_event_handler()
+    if event_handler:
+        await event_handler.load_timeout_settings(db)
+    
     # Initialize ARI client if Asterisk settings are provided and enabled
     if settings.asterisk_config and settings.asterisk_config.enabled:
         from asterisk_client import initialize_ari_client
@@ -443,7 +547,9 @@ async def get_asterisk_database_settings(
                 "ssl_mode": config.ssl_mode,
                 "charset": config.charset,
                 "connection_timeout": config.connection_timeout,
-                "pool_size": config.pool_size
+                "pool_min_size": config.pool_min_size,
+                "pool_size": config.pool_size,
+                "statement_cache_size": config.statement_cache_size
             }
         else:
             # Настройки по умолчанию
@@ -458,7 +564,9 @@ async def get_asterisk_database_settings(
                 "ssl_mode": "disabled",
                 "charset": "utf8mb4",
                 "connection_timeout": 30,
-                "pool_size": 10
+                "pool_min_size": 1,
+                "pool_size": 10,
+                "statement_cache_size": 100
             }
             
     except Exception as e:
@@ -592,6 +700,7 @@ async def get_cdr_data(
     try:
         from asterisk_database import get_asterisk_db_manager
         from datetime import datetime, timedelta
+        from report_cache import get_report_cache
         
         asterisk_db = get_asterisk_db_manager()
         
@@ -613,12 +722,25 @@ async def get_cdr_data(
         else:
             end_dt = datetime.utcnow()
         
+        # Повторные просмотры отчета не ходят в БД АТС: закрытый период кэшируется без срока
+        report_cache = get_report_cache()
+        start_dt, end_dt, closed = report_cache.normalize_range(start_dt, end_dt)
+        
         # Получаем CDR данные
-        cdr_data = await asterisk_db.get_cdr_data(start_dt, end_dt, limit)
+        cdr_data = await report_cache.get_or_compute(
+            report_cache.make_key("cdr_data", start_dt, end_dt, limit=limit),
+            lambda: asterisk_db.get_cdr_data(start_dt, end_dt, limit),
+            closed,
+            cacheable=bool
+        )
         
-        # Получаем статистику
-        statistics = await asterisk_db.get_call_statistics(
-            (end_dt - start_dt).days or 1
+        # Получаем статистику (период от текущего момента - всегда открытый)
+        period_days = (end_dt - start_dt).days or 1
+        statistics = await report_cache.get_or_compute(
+            report_cache.make_key("call_statistics", period_days=period_days),
+            lambda: asterisk_db.get_call_statistics(period_days),
+            False,
+            cacheable=bool
         )
         
         return {
@@ -641,6 +763,486 @@ async def get_cdr_data(
             detail=str(e)
         )
 
+def _parse_utc_datetime(value: str) -> datetime:
+    """Дата запроса (ISO, в т.ч. ...Z) -> naive UTC, как calldate в БД Asterisk и даты в MongoDB"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        return parsed
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _cdr_export_value(value: Any) -> Any:
+    """Значение CDR для выгрузки: даты в ISO, Decimal и прочее - в строку"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+@router.get("/reports/cdr-data/export")
+async def export_cdr_data(
+    start_date: str = None,
+    end_date: str = None,
+    format: str = "ndjson",
+    after_calldate: str = None,
+    after_uniqueid: str = "",
+    current_user: User = Depends(require_manager_or_admin)
+):
+    """Потоковая выгрузка CDR за период (NDJSON или CSV) в постоянной памяти
+    
+    Строки идут по возрастанию (calldate, uniqueid). Прерванную выгрузку
+    можно продолжить, передав calldate и uniqueid последней полученной строки
+    в after_calldate/after_uniqueid.
+    """
+    try:
+        from asterisk_database import get_asterisk_db_manager, CDR_COLUMNS
+        from fastapi.responses import StreamingResponse
+        from datetime import timedelta
+        from config import config
+        import csv
+        import io
+        import json
+        
+        if format not in ("ndjson", "csv"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Формат выгрузки: ndjson или csv"
+            )
+        
+        asterisk_db = get_asterisk_db_manager()
+        if not asterisk_db or not asterisk_db.connected:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="БД Asterisk не подключена"
+            )
+        
+        start_dt = _parse_utc_datetime(start_date) if start_date else datetime.utcnow() - timedelta(days=7)
+        end_dt = _parse_utc_datetime(end_date) if end_date else datetime.utcnow()
+        after = (_parse_utc_datetime(after_calldate), after_uniqueid) if after_calldate else None
+        columns = [column.strip() for column in CDR_COLUMNS.split(",")]
+        fetch_size = config.CDR_EXPORT_FETCH_SIZE
+        
+        async def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if format == "csv":
+                writer.writerow(columns)
+            
+            try:
+                async for chunk in asterisk_db.stream_cdr_data(start_dt, end_dt, after, fetch_size):
+                    for row in chunk:
+                        if format == "csv":
+                            writer.writerow([_cdr_export_value(row.get(column)) for column in columns])
+                        else:
+                            buffer.write(json.dumps(
+                                {column: _cdr_export_value(row.get(column)) for column in columns},
+                                ensure_ascii=False
+                            ))
+                            buffer.write("\n")
+                    # Одна порция - один фрагмент ответа
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            except Exception as e:
+                # Заголовки уже отправлены - обрываем поток, клиент продолжит с последней строки
+                logger.error(f"Error streaming CDR export: {e}")
+                raise
+            
+            if buffer.tell():
+                yield buffer.getvalue()
+        
+        filename = f"cdr_{start_dt:%Y%m%d}_{end_dt:%Y%m%d}.{format}"
+        return StreamingResponse(
+            generate(),
+            media_type="application/x-ndjson" if format == "ndjson" else "text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error exporting CDR data: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/reports/cdr-analytics", response_model=Dict[str, Any])
+async def get_cdr_analytics(
+    start_date: str,
+    end_date: str,
+    top: int = 20,
+    current_user: User = Depends(require_manager_or_admin)
+):
+    """Аналитика CDR за период: ряды по дням, часам, disposition, dcontext, src/dst, accountcode"""
+    try:
+        from asterisk_database import get_asterisk_db_manager
+        
+        asterisk_db = get_asterisk_db_manager()
+        if not asterisk_db or not asterisk_db.connected:
+            return {
+                "success": False,
+                "message": "БД Asterisk не подключена",
+                "data": {}
+            }
+        
+        start_dt = _parse_utc_datetime(start_date)
+        end_dt = _parse_utc_datetime(end_date)
+        if end_dt <= start_dt:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="end_date должна быть позже start_date"
+            )
+        
+        return {
+            "success": True,
+            "data": await asterisk_db.get_cdr_analytics(start_dt, end_dt, max(1, min(top, 1000)))
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting CDR analytics: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/reports/cdr-index-advice", response_model=Dict[str, Any])
+async def get_cdr_index_advice(
+    current_user: User = Depends(require_admin)
+):
+    """Проверка индексов таблицы cdr по calldate"""
+    try:
+        from asterisk_database import get_asterisk_db_manager
+        
+        asterisk_db = get_asterisk_db_manager()
+        if not asterisk_db or not asterisk_db.connected:
+            return {
+                "success": False,
+                "message": "БД Asterisk не подключена",
+                "data": {}
+            }
+        
+        return {
+            "success": True,
+            "data": await asterisk_db.get_cdr_index_advice()
+        }
+        
+    except Exception as e:
+        logger.error(f"Error checking CDR indexes: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post("/reports/queue-log/rebuild", response_model=APIResponse)
+async def rebuild_queue_log_rollups(
+    start_date: str,
+    end_date: str,
+    current_user: User = Depends(require_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Фоновая пересборка дневной статистики очередей из queue_log за период"""
+    try:
+        from asterisk_database import get_asterisk_db_manager
+        from queue_log_ingest import NUMPY_AVAILABLE, get_queue_log_ingester
+        
+        if not NUMPY_AVAILABLE:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="NumPy не установлен - пересборка queue_log недоступна"
+            )
+        
+        asterisk_db = get_asterisk_db_manager()
+        if not asterisk_db or not asterisk_db.connected:
+            return APIResponse(success=False, message="БД Asterisk не подключена")
+        
+        start_dt = _parse_utc_datetime(start_date)
+        end_dt = _parse_utc_datetime(end_date)
+        
+        ingester = get_queue_log_ingester()
+        if not ingester.start_rebuild(db, asterisk_db, start_dt, end_dt):
+            return APIResponse(
+                success=False,
+                message="Пересборка уже выполняется",
+                data=ingester.get_stats()
+            )
+        
+        return APIResponse(
+            success=True,
+            message="Пересборка статистики очередей запущена",
+            data=ingester.get_stats()
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting queue log rebuild: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/reports/queue-log/status", response_model=Dict[str, Any])
+async def get_queue_log_rebuild_status(
+    current_user: User = Depends(require_manager_or_admin)
+):
+    """Состояние последней пересборки статистики очередей"""
+    try:
+        from queue_log_ingest import get_queue_log_ingester
+        return {
+            "success": True,
+            "data": get_queue_log_ingester().get_stats()
+        }
+    except Exception as e:
+        logger.error(f"Error getting queue log rebuild status: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post("/reports/call-legs/rebuild", response_model=APIResponse)
+async def rebuild_call_legs(
+    start_date: str,
+    end_date: str,
+    current_user: User = Depends(require_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Фоновая сборка плеч звонков (переводы, удержание) из CEL за период"""
+    try:
+        from asterisk_database import get_asterisk_db_manager
+        from call_legs import get_call_leg_builder
+        
+        asterisk_db = get_asterisk_db_manager()
+        if not asterisk_db or not asterisk_db.connected:
+            return APIResponse(success=False, message="БД Asterisk не подключена")
+        
+        start_dt = _parse_utc_datetime(start_date)
+        end_dt = _parse_utc_datetime(end_date)
+        
+        builder = get_call_leg_builder()
+        if not builder.start_rebuild(db, asterisk_db, start_dt, end_dt):
+            return APIResponse(
+                success=False,
+                message="Сборка плеч звонков уже выполняется",
+                data=builder.get_stats()
+            )
+        
+        return APIResponse(
+            success=True,
+            message="Сборка плеч звонков запущена",
+            data=builder.get_stats()
+        )
+        
+    except Exception as e:
+        logger.error(f"Error starting call legs rebuild: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/reports/call-legs/status", response_model=Dict[str, Any])
+async def get_call_legs_status(
+    current_user: User = Depends(require_manager_or_admin)
+):
+    """Состояние последней сборки плеч звонков"""
+    try:
+        from call_legs import get_call_leg_builder
+        return {
+            "success": True,
+            "data": get_call_leg_builder().get_stats()
+        }
+    except Exception as e:
+        logger.error(f"Error getting call legs status: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post("/reports/reconcile", response_model=APIResponse)
+async def start_cdr_reconciliation(
+    start_date: str,
+    end_date: str,
+    billsec_tolerance: int = 0,
+    current_user: User = Depends(require_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Фоновая сверка звонков SmartCallCenter с CDR за период"""
+    try:
+        from asterisk_database import get_asterisk_db_manager
+        from reconciliation import get_cdr_reconciler
+        
+        asterisk_db = get_asterisk_db_manager()
+        if not asterisk_db or not asterisk_db.connected:
+            return APIResponse(success=False, message="БД Asterisk не подключена")
+        
+        start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+        end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+        
+        reconciler = get_cdr_reconciler()
+        if not reconciler.start_reconcile(db, asterisk_db, start_dt, end_dt, max(billsec_tolerance, 0)):
+            return APIResponse(success=False, message="Сверка уже выполняется")
+        
+        return APIResponse(success=True, message="Сверка с CDR запущена")
+        
+    except Exception as e:
+        logger.error(f"Error starting CDR reconciliation: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/reports/reconcile", response_model=Dict[str, Any])
+async def get_cdr_reconciliation_report(
+    current_user: User = Depends(require_manager_or_admin)
+):
+    """Отчет последней сверки с CDR"""
+    try:
+        from reconciliation import get_cdr_reconciler
+        return {
+            "success": True,
+            "data": get_cdr_reconciler().get_status()
+        }
+    except Exception as e:
+        logger.error(f"Error getting CDR reconciliation report: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/reports/asterisk-db/stats", response_model=Dict[str, Any])
+async def get_asterisk_db_stats(
+    current_user: User = Depends(require_admin)
+):
+    """Пул соединений и задержки запросов БД Asterisk"""
+    try:
+        from asterisk_database import get_asterisk_db_manager
+        
+        asterisk_db = get_asterisk_db_manager()
+        if not asterisk_db:
+            return {
+                "success": False,
+                "message": "БД Asterisk не подключена",
+                "data": {}
+            }
+        
+        return {
+            "success": True,
+            "data": asterisk_db.get_stats()
+        }
+        
+    except Exception as e:
+        logger.error(f"Error getting Asterisk database stats: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post("/reports/columnar/export", response_model=APIResponse)
+async def export_columnar_partitions(
+    start_date: str,
+    end_date: str,
+    current_user: User = Depends(require_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Повторная выгрузка закрытых дней в колоночное хранилище (после правки звонков задним числом)"""
+    try:
+        from columnar_store import get_columnar_store
+        
+        store = get_columnar_store()
+        if not store.enabled:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Колоночное хранилище отключено (pyarrow не установлен или не задан COLUMNAR_STORE_PATH)"
+            )
+        
+        start_day = datetime.fromisoformat(start_date.replace('Z', '+00:00')).date()
+        end_day = datetime.fromisoformat(end_date.replace('Z', '+00:00')).date()
+        
+        if not store.start_export_range(db, start_day, end_day):
+            return APIResponse(
+                success=False,
+                message="Выгрузка уже выполняется",
+                data=store.get_stats()
+            )
+        
+        return APIResponse(
+            success=True,
+            message="Выгрузка в колоночное хранилище запущена",
+            data=store.get_stats()
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting columnar export: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/reports/columnar/status", response_model=Dict[str, Any])
+async def get_columnar_status(
+    current_user: User = Depends(require_manager_or_admin)
+):
+    """Состояние колоночного хранилища: выгруженные дни, движок, ошибки"""
+    try:
+        from columnar_store import get_columnar_store
+        return {
+            "success": True,
+            "data": get_columnar_store().get_stats()
+        }
+    except Exception as e:
+        logger.error(f"Error getting columnar store status: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/reports/cdr-sync", response_model=Dict[str, Any])
+async def get_cdr_sync_status(
+    current_user: User = Depends(require_manager_or_admin)
+):
+    """Состояние синхронизации CDR: отметка, отставание, счетчики"""
+    try:
+        from cdr_sync import get_cdr_sync_worker
+        return {
+            "success": True,
+            "data": get_cdr_sync_worker().get_stats()
+        }
+    except Exception as e:
+        logger.error(f"Error getting CDR sync status: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.post("/reports/cdr-sync/reset", response_model=APIResponse)
+async def reset_cdr_sync(
+    since: str = None,
+    current_user: User = Depends(require_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Перезапуск синхронизации CDR с даты (без даты - с начала таблицы)"""
+    try:
+        from cdr_sync import get_cdr_sync_worker
+        from datetime import datetime
+        
+        since_dt = _parse_utc_datetime(since) if since else None
+        await get_cdr_sync_worker().reset_checkpoint(db, since_dt)
+        
+        return APIResponse(
+            success=True,
+            message="Синхронизация CDR будет выполнена заново",
+            data={"since": since_dt.isoformat() if since_dt else None}
+        )
+    except Exception as e:
+        logger.error(f"Error resetting CDR sync: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @router.get("/reports/hybrid-statistics", response_model=Dict[str, Any])
 async def get_hybrid_statistics(
     period: str = "today",
@@ -650,6 +1252,8 @@ async def get_hybrid_statistics(
     """Получение гибридной статистики (наша БД + CDR)"""
     try:
         from asterisk_database import get_asterisk_db_manager
+        from cdr_sync import get_cdr_sync_worker
+        from report_cache import get_report_cache
         from datetime import datetime, timedelta
         
         # Получаем статистику из нашей БД
@@ -663,7 +1267,13 @@ async def get_hybrid_statistics(
         if asterisk_db and asterisk_db.connected:
             try:
                 period_days = 1 if period == "today" else 7
-                asterisk_stats = await asterisk_db.get_call_statistics(period_days)
+                report_cache = get_report_cache()
+                asterisk_stats = await report_cache.get_or_compute(
+                    report_cache.make_key("call_statistics", period_days=period_days),
+                    lambda: asterisk_db.get_call_statistics(period_days),
+                    False,
+                    cacheable=bool
+                )
             except Exception as e:
                 logger.error(f"Error getting Asterisk statistics: {e}")
                 asterisk_stats = {"error": str(e)}
@@ -685,7 +1295,8 @@ async def get_hybrid_statistics(
                 "period": period,
                 "comparison": {
                     "data_sources": ["SmartCallCenter DB", "Asterisk CDR"],
-                    "sync_status": "active" if asterisk_db and asterisk_db.connected else "disconnected"
+                    "sync_status": "active" if asterisk_db and asterisk_db.connected else "disconnected",
+                    "cdr_sync": get_cdr_sync_worker().get_stats()
                 }
             }
         }
@@ -723,6 +1334,15 @@ async def get_system_info(
         # Get system settings and test connections
         settings = await db.get_system_settings()
         
+        # Call deadline timers of the Asterisk event handler
+        from asterisk_event_handler import get_event_handler
+        event_handler = get_event_handler()
+        
+        # Asterisk CDR database pool and query latency
+        from asterisk_database import get_asterisk_db_manager
+        asterisk_db = get_asterisk_db_manager()
+        from report_cache import get_report_cache
+        
         # Test database connection
         try:
             await db.users.count_documents({})
@@ -790,6 +1410,11 @@ async def get_system_info(
                 "status": "Running",
                 "version": "1.0.0"
             },
+            "auth_cache": get_principal_cache().get_stats(),
+            "operator_counters": get_operator_counters().get_stats(),
+            "call_timers": event_handler.get_timer_stats() if event_handler else None,
+            "asterisk_database": asterisk_db.get_stats() if asterisk_db else None,
+            "report_cache": get_report_cache().get_stats(),
             "system": {
                 "timestamp": datetime.utcnow().isoformat(),
                 "environment": os.environ.get('ENVIRONMENT', 'production'),
@@ -7,8 +7,7 @@ from models import UserLogin, User, APIResponse, Token
 from database import DatabaseManager
 from auth import (
     create_access_token, 
-    get_password_hash, 
-    verify_password,
+    verify_login_password,
     get_current_active_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
@@ -31,7 +30,7 @@ async def login(
         # Аутентификация пользователя
         user = await db.get_user_by_username(user_credentials.username)
         
-        if not user or not verify_password(user_credentials.password, user.password_hash):
+        if not user or not await verify_login_password(user_credentials.password, user.password_hash):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
@@ -44,11 +43,8 @@ async def login(
                 detail="User account is deactivated"
             )
         
-        # Обновление времени последнего входа
-        await db.users.update_one(
-            {"id": user.id},
-            {"$set": {"last_login": datetime.utcnow()}}
-        )
+        # Обновление времени последнего входа (через update_user - сброс кэша принципалов)
+        await db.update_user(user.id, {"last_login": datetime.utcnow()})
         
         # Создание JWT токена
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from typing import Dict, Any, List
 from datetime import datetime, timedelta
 import logging
+import time
 
 from models import User, StatsQuery, CallStats, OperatorStats, QueueStats, CallFilters
 from database import DatabaseManager
@@ -276,6 +277,265 @@ async def get_queue_performance(
             detail=str(e)
         )
 
+@router.get("/analytics/queue-history", response_model=Dict[str, Any])
+async def get_queue_history(
+    start_date: str,
+    end_date: str,
+    current_user: User = Depends(require_manager_or_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Историческая статистика очередей за период из итогов queue_log"""
+    try:
+        from queue_log_ingest import get_queue_log_ingester
+        
+        start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+        end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+        
+        return await get_queue_log_ingester().get_queue_history(db, start_dt, end_dt)
+        
+    except Exception as e:
+        logger.error(f"Error getting queue history: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/analytics/long-range", response_model=Dict[str, Any])
+async def get_long_range_report(
+    start_date: str,
+    end_date: str,
+    dataset: str = "calls",
+    current_user: User = Depends(require_manager_or_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Показатели по дням за длинный период (включительно) из колоночного хранилища
+
+    dataset: calls - звонки SmartCallCenter, cdr - синхронизированные CDR Asterisk.
+    """
+    try:
+        from columnar_store import DATASETS, get_columnar_store
+        
+        if dataset not in DATASETS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown dataset: {dataset}"
+            )
+        
+        start_day = datetime.fromisoformat(start_date.replace('Z', '+00:00')).date()
+        end_day = datetime.fromisoformat(end_date.replace('Z', '+00:00')).date()
+        if end_day < start_day:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="end_date must not be earlier than start_date"
+            )
+        
+        return await get_columnar_store().get_daily_report(db, dataset, start_day, end_day)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting long-range report: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/analytics/distributions", response_model=Dict[str, Any])
+async def get_call_distributions(
+    start_date: str,
+    end_date: str,
+    fields: str = "wait_time,talk_time",
+    queue_name: str = None,
+    operator_id: str = None,
+    call_status: str = None,
+    bins: int = 20,
+    max_seconds: float = None,
+    percentiles: str = "50,75,90,95,99",
+    by_operator: bool = False,
+    current_user: User = Depends(require_supervisor_or_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Распределения длительностей звонков: гистограммы и CDF, перцентили, std
+    
+    fields - через запятую из wait_time, ring_time, talk_time.
+    by_operator - дополнительно среднее, std и дисперсия по операторам.
+    """
+    from call_distributions import (
+        DISTRIBUTION_FIELDS, NUMPY_AVAILABLE, compute_distributions, parse_percentiles
+    )
+    
+    if not NUMPY_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="NumPy не установлен - распределения недоступны"
+        )
+    
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in DISTRIBUTION_FIELDS]
+    if not selected or unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"fields must be a subset of {', '.join(DISTRIBUTION_FIELDS)}"
+        )
+    if not 1 <= bins <= 500:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bins must be between 1 and 500"
+        )
+    try:
+        percentile_list = parse_percentiles(percentiles)
+        filters = CallFilters(
+            start_date=datetime.fromisoformat(start_date.replace('Z', '+00:00')),
+            end_date=datetime.fromisoformat(end_date.replace('Z', '+00:00')),
+            queue_name=queue_name,
+            operator_id=operator_id,
+            status=call_status
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    try:
+        started = time.perf_counter()
+        arrays = await db.get_call_arrays(filters, selected, label_field="operator_id" if by_operator else None)
+        fetch_ms = round((time.perf_counter() - started) * 1000, 2)
+        
+        result = compute_distributions(
+            arrays, selected, bins, percentile_list, max_seconds,
+            group_field="operator_id" if by_operator else None
+        )
+        
+        return {
+            "period": {"start_date": filters.start_date.isoformat(), "end_date": filters.end_date.isoformat()},
+            "calls": int(arrays[selected[0]].size),
+            **result,
+            "fetch_ms": fetch_ms
+        }
+        
+    except Exception as e:
+        logger.error(f"Error getting call distributions: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/analytics/call-legs", response_model=Dict[str, Any])
+async def get_call_legs_analytics(
+    start_date: str,
+    end_date: str,
+    current_user: User = Depends(require_supervisor_or_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Время разговора операторов по плечам звонков (с учетом переводов)"""
+    try:
+        from call_legs import get_call_leg_builder
+        
+        start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+        end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+        
+        return {
+            "period": {"start_date": start_dt.isoformat(), "end_date": end_dt.isoformat()},
+            "operators": await get_call_leg_builder().get_operator_summary(db, start_dt, end_dt)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error getting call legs analytics: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/calls/{linkedid}/legs", response_model=Dict[str, Any])
+async def get_call_legs(
+    linkedid: str,
+    current_user: User = Depends(require_supervisor_or_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Плечи одного звонка по linkedid"""
+    try:
+        legs = await db.call_legs.find({"linkedid": linkedid}, {"_id": 0}).sort("start_time", 1).to_list(None)
+        return {"linkedid": linkedid, "legs": legs}
+        
+    except Exception as e:
+        logger.error(f"Error getting call legs: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+@router.get("/forecast/staffing", response_model=Dict[str, Any])
+async def get_staffing_forecast(
+    history_weeks: int = 4,
+    horizon_days: int = 7,
+    interval_minutes: int = 30,
+    sla: str = "80/20",
+    queues: str = None,
+    wrapup_seconds: int = 0,
+    patience_seconds: float = None,
+    max_abandon_rate: float = 0.05,
+    timezone: str = "UTC",
+    current_user: User = Depends(require_manager_or_admin),
+    db: DatabaseManager = Depends(get_db)
+):
+    """Прогноз необходимого числа операторов по интервалам (Erlang C / Erlang A)
+    
+    sla - цели уровня сервиса "процент/секунды" через запятую, например "80/20,90/30".
+    patience_seconds - среднее терпение клиента; если указано, дополнительно
+    считается штат по допустимой доле отказов max_abandon_rate (Erlang A).
+    """
+    from staffing_forecast import (
+        NUMPY_AVAILABLE, SUPPORTED_INTERVALS, get_staffing_forecaster, parse_sla_targets
+    )
+    
+    if not NUMPY_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="NumPy не установлен - прогноз штата недоступен"
+        )
+    
+    try:
+        sla_targets = parse_sla_targets(sla)
+    except ValueError:
+        sla_targets = []
+    
+    if not sla_targets or any(not 0 < level < 1 or seconds <= 0 for level, seconds in sla_targets):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="sla должен быть в формате 80/20,90/30"
+        )
+    if interval_minutes not in SUPPORTED_INTERVALS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"interval_minutes должен быть одним из {SUPPORTED_INTERVALS}"
+        )
+    if not 1 <= history_weeks <= 12 or not 1 <= horizon_days <= 28:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="history_weeks: 1-12, horizon_days: 1-28"
+        )
+    
+    try:
+        queue_names = [name.strip() for name in queues.split(",") if name.strip()] if queues else None
+        
+        return await get_staffing_forecaster().forecast(
+            db,
+            history_weeks=history_weeks,
+            horizon_days=horizon_days,
+            interval_minutes=interval_minutes,
+            sla_targets=sla_targets,
+            queue_names=queue_names,
+            wrapup_seconds=max(wrapup_seconds, 0),
+            patience_seconds=patience_seconds if patience_seconds and patience_seconds > 0 else None,
+            max_abandon=max_abandon_rate,
+            timezone=timezone
+        )
+        
+    except Exception as e:
+        logger.error(f"Error computing staffing forecast: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 @router.get("/realtime", response_model=Dict[str, Any])
 async def get_realtime_dashboard(
     current_user: User = Depends(get_current_active_user),
@@ -298,6 +558,9 @@ async def get_realtime_dashboard(
         # Последние звонки
         recent_calls = await db.get_calls(CallFilters(), limit=20)
         
+        # Ожидающие в очередях - из скользящей статистики в памяти
+        from call_flow_logic import call_stats_processor
+        
         return {
             "timestamp": datetime.utcnow().isoformat(),
             "asterisk": asterisk_data,
@@ -305,7 +568,7 @@ async def get_realtime_dashboard(
                 "active_calls": asterisk_data.get("active_calls", 0),
                 "active_channels": asterisk_data.get("active_channels", 0),
                 "online_operators": len(online_operators),
-                "waiting_calls": 0  # Можно получить из Asterisk очередей
+                "waiting_calls": call_stats_processor.get_waiting_calls()
             },
             "today_summary": {
                 "total_calls": len(today_calls),
@@ -344,6 +607,29 @@ async def get_realtime_dashboard(
             detail=str(e)
         )
 
+@router.get("/realtime/queues", response_model=Dict[str, Any])
+async def get_realtime_queues(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Очереди в реальном времени: окна 5/15/60 мин, ожидающие, самое долгое ожидание"""
+    try:
+        from call_flow_logic import call_stats_processor
+        queues = call_stats_processor.get_realtime_queue_stats()
+        
+        return {
+            "timestamp": datetime.utcnow().isoformat(),
+            "waiting_calls": sum(queue["waiting_calls"] for queue in queues.values()),
+            "longest_wait_seconds": max((queue["longest_wait_seconds"] for queue in queues.values()), default=0),
+            "queues": queues
+        }
+        
+    except Exception as e:
+        logger.error(f"Error getting realtime queue stats: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
 # Вспомогательные функции
 async def get_asterisk_realtime_stats() -> Dict[str, Any]:
     """Получение статистики из Asterisk в реальном времени"""
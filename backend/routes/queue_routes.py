@@ -133,6 +133,11 @@ async def update_queue(
         )
     
     updated_queue = await db.get_queue_by_id(queue_id)
+    
+    # Навыки очереди для маршрутизации по навыкам
+    from skill_router import get_skill_router
+    get_skill_router().set_queue_skills(updated_queue.name, updated_queue.required_skills)
+    
     return updated_queue
 
 @router.delete("/{queue_id}", response_model=APIResponse)
@@ -140,9 +140,15 @@ async def migrate_operators_from_asterisk(
         skipped_operators = []
         errors = []
         
-        from auth import get_password_hash
-        from models import UserCreate, UserRole, OperatorCreate
+        from auth import hash_passwords_bulk
+        from models import UserRole, OperatorCreate
         
+        temporary_password = "changeme123"  # Временный пароль
+        
+        # Первый проход: проверка конфликтов без хеширования
+        candidates = []
+        batch_usernames = set()
+        batch_extensions = set()
         for ext_data in selected_extensions:
             extension = ext_data.get("extension")
             username = ext_data.get("username", f"operator_{extension}")
@@ -150,6 +156,22 @@ async def migrate_operators_from_asterisk(
             email = ext_data.get("email", f"operator_{extension}@callcenter.com")
             
             try:
+                # Повторы внутри пачки: в БД их еще нет, проверка ниже их не увидит
+                if username in batch_usernames:
+                    skipped_operators.append({
+                        "extension": extension,
+                        "username": username,
+                        "reason": "Пользователь повторяется в списке миграции"
+                    })
+                    continue
+                if extension in batch_extensions:
+                    skipped_operators.append({
+                        "extension": extension,
+                        "username": username,
+                        "reason": "Extension повторяется в списке миграции"
+                    })
+                    continue
+                
                 # Проверяем существующего пользователя
                 existing_user = await db.get_user_by_username(username)
                 if existing_user:
@@ -170,17 +192,34 @@ async def migrate_operators_from_asterisk(
                     })
                     continue
                 
+                candidates.append((extension, username, name, email))
+                batch_usernames.add(username)
+                batch_extensions.add(extension)
+                
+            except Exception as e:
+                logger.error(f"Error checking extension {extension}: {e}")
+                errors.append({
+                    "extension": extension,
+                    "username": username,
+                    "error": str(e)
+                })
+        
+        # Хеширование паролей пачкой в пуле процессов, вне event loop
+        password_hashes = await hash_passwords_bulk([temporary_password] * len(candidates))
+        
+        # Второй проход: создание пользователей и операторов
+        for (extension, username, name, email), password_hash in zip(candidates, password_hashes):
+            try:
                 # Создаем пользователя
-                user_data = UserCreate(
+                user = User(
                     username=username,
                     email=email,
                     name=name,
-                    password="changeme123",  # Временный пароль
+                    password_hash=password_hash,
                     role=UserRole.OPERATOR,
                     group_id=default_group_id
                 )
-                
-                user = await db.create_user(user_data)
+                await db.users.insert_one(user.dict())
                 
                 # Создаем оператора
                 operator_data = OperatorCreate(
@@ -200,7 +239,7 @@ async def migrate_operators_from_asterisk(
                     "extension": extension,
                     "name": name,
                     "email": email,
-                    "temporary_password": "changeme123"
+                    "temporary_password": temporary_password
                 })
                 
                 logger.info(f"Created operator: {username} with extension {extension}")
@@ -4,7 +4,7 @@ import logging
 import json
 from datetime import datetime
 
-from auth import get_current_user_websocket
+from auth import get_current_user_websocket, require_admin
 from websocket_manager import get_websocket_manager
 from models import User
 
@@ -15,8 +15,12 @@ logger = logging.getLogger(__name__)
 async def websocket_endpoint(
     websocket: WebSocket,
     token: str = Query(...),
+    encoding: Optional[str] = Query(None),
 ):
-    """WebSocket endpoint для real-time уведомлений"""
+    """WebSocket endpoint для real-time уведомлений
+
+    encoding: json (по умолчанию) или msgpack - компактный бинарный протокол
+    """
     websocket_manager = get_websocket_manager()
     user = None
     
@@ -27,8 +31,9 @@ async def websocket_endpoint(
             await websocket.close(code=4001, reason="Invalid token")
             return
         
-        # Подключаем WebSocket
-        await websocket_manager.connect(websocket, user.id, user.role)
+        # Подключаем WebSocket (с проверкой лимитов)
+        if not await websocket_manager.connect(websocket, user.id, user.role, encoding):
+            return
         
         # Отправляем начальные данные
         await send_initial_data(websocket, user, websocket_manager)
@@ -36,10 +41,19 @@ async def websocket_endpoint(
         # Слушаем сообщения от клиента
         while True:
             try:
-                data = await websocket.receive_text()
-                message = json.loads(data)
-                await handle_client_message(message, user, websocket_manager)
+                frame = await websocket.receive()
+                if frame["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(frame.get("code", 1000))
+                websocket_manager.touch(websocket)
                 
+                data = frame.get("text")
+                if data is None:
+                    data = frame.get("bytes")
+                message = websocket_manager.decode_client_message(websocket, data)
+                await handle_client_message(message, user, websocket, websocket_manager)
+                
+            except WebSocketDisconnect:
+                raise
             except json.JSONDecodeError:
                 logger.error("Invalid JSON received from WebSocket client")
             except Exception as e:
@@ -53,6 +67,11 @@ async def websocket_endpoint(
         if user:
             websocket_manager.disconnect(websocket, user.id, user.role)
 
+@router.get("/stats")
+async def websocket_stats(current_user: User = Depends(require_admin)):
+    """Метрики WebSocket подключений: лимиты, жизненный цикл, heartbeat"""
+    return get_websocket_manager().get_connection_stats()
+
 async def send_initial_data(websocket: WebSocket, user: User, websocket_manager):
     """Отправка начальных данных при подключении"""
     try:
@@ -110,17 +129,21 @@ async def send_initial_data(websocket: WebSocket, user: User, websocket_manager)
     except Exception as e:
         logger.error(f"Error sending initial data: {e}")
 
-async def handle_client_message(message: dict, user: User, websocket_manager):
+async def handle_client_message(message: dict, user: User, websocket: WebSocket, websocket_manager):
     """Обработка сообщений от клиента"""
     try:
         message_type = message.get("type")
         
-        if message_type == "ping":
+        if message_type == "pong":
+            # Ответ на heartbeat - активность уже отмечена при получении
+            pass
+        
+        elif message_type == "ping":
             # Ответ на ping
-            await websocket_manager.send_to_user(user.id, {
+            await websocket_manager.send_personal_message({
                 "type": "pong",
                 "timestamp": datetime.utcnow().isoformat()
-            })
+            }, websocket)
             
         elif message_type == "request_update":
             # Запрос обновления данных
@@ -129,11 +152,11 @@ async def handle_client_message(message: dict, user: User, websocket_manager):
                 from db import get_db
                 db = get_db()
                 system_stats = await get_system_stats(db)
-                await websocket_manager.send_to_user(user.id, {
+                await websocket_manager.send_personal_message({
                     "type": "system_stats_update",
                     "data": system_stats,
                     "timestamp": datetime.utcnow().isoformat()
-                })
+                }, websocket)
                 
         elif message_type == "operator_status_change":
             # Изменение статуса оператора
@@ -155,47 +178,10 @@ async def handle_client_message(message: dict, user: User, websocket_manager):
         logger.error(f"Error handling client message: {e}")
 
 async def get_system_stats(db):
-    """Получение системной статистики"""
+    """Получение системной статистики (из кэша фонового сервиса)"""
     try:
-        from datetime import datetime, timedelta
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        # Основные счетчики
-        total_users = len(await db.get_users())
-        total_operators = len(await db.get_operators())
-        total_queues = len(await db.get_queues())
-        
-        # Звонки за сегодня
-        today_calls = await db.calls.count_documents({
-            "start_time": {"$gte": today}
-        })
-        
-        # Статус Asterisk
-        settings = await db.get_system_settings()
-        asterisk_connected = False
-        if settings and settings.asterisk_config and settings.asterisk_config.enabled:
-            try:
-                from asterisk_client import AsteriskARIClient
-                test_client = AsteriskARIClient(
-                    host=settings.asterisk_config.host,
-                    port=settings.asterisk_config.port,
-                    username=settings.asterisk_config.username,
-                    password=settings.asterisk_config.password
-                )
-                result = await test_client.test_connection()
-                await test_client.disconnect()
-                asterisk_connected = result["success"]
-            except:
-                asterisk_connected = False
-        
-        return {
-            "users": total_users,
-            "operators": total_operators,
-            "queues": total_queues,
-            "calls_today": today_calls,
-            "asterisk_connected": asterisk_connected,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        from system_stats_service import get_system_stats_service
+        return await get_system_stats_service().get_stats(db)
         
     except Exception as e:
         logger.error(f"Error getting system stats: {e}")
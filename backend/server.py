@@ -71,11 +71,67 @@ async def lifespan(app: FastAPI):
     # Initialize default data if needed
     await initialize_default_data(db_manager)
     
+    # WebSocket backplane для доставки событий между воркерами
+    from websocket_manager import get_websocket_manager
+    from websocket_backplane import create_backplane
+    websocket_manager = get_websocket_manager()
+    await websocket_manager.start_backplane(create_backplane(db_manager))
+    
+    # Фоновое обновление системной статистики для админских подключений
+    from system_stats_service import get_system_stats_service
+    system_stats_service = get_system_stats_service()
+    system_stats_service.start(db_manager)
+    
+    # Номерной план: компиляция из БД и фоновая проверка изменений
+    from number_plan import get_number_plan
+    number_plan = get_number_plan()
+    await number_plan.seed_defaults(db_manager)
+    await number_plan.reload(db_manager)
+    number_plan.start(db_manager)
+    
+    # Живые метрики очередей для оценки ожидания (Erlang C)
+    from queue_estimator import get_queue_estimator
+    await get_queue_estimator().load_from_db(db_manager)
+    
+    # Скользящие окна статистики очередей (5/15/60 мин) за последний час
+    from call_flow_logic import call_stats_processor
+    await call_stats_processor.load_from_db(db_manager)
+    
+    # Индекс операторов по навыкам для маршрутизации (ACD)
+    from skill_router import get_skill_router
+    await get_skill_router().load_from_db(db_manager)
+    
+    # Повторные звонящие -> последний оператор (прогрев по недавним звонкам)
+    from caller_affinity import get_caller_affinity
+    await get_caller_affinity().load_from_db(db_manager)
+    
+    # Счетчики KPI операторов: периодический сброс через bulk $inc
+    from operator_counters import get_operator_counters
+    operator_counters = get_operator_counters()
+    operator_counters.start(db_manager)
+    
+    # Инкрементальная синхронизация CDR Asterisk в cdr_records (когда БД Asterisk подключена;
+    # выполняет один воркер - владелец аренды)
+    from cdr_sync import get_cdr_sync_worker
+    cdr_sync_worker = get_cdr_sync_worker()
+    cdr_sync_worker.start(db_manager)
+    
+    # Выгрузка закрытых дней calls/CDR в Parquet для отчетов за длинные периоды (один воркер по аренде)
+    from columnar_store import get_columnar_store
+    columnar_store = get_columnar_store()
+    columnar_store.start(db_manager)
+    
     logger.info("Application started successfully")
     
     yield
     
     # Shutdown
+    await columnar_store.stop()
+    await cdr_sync_worker.stop()
+    await operator_counters.stop(db_manager)
+    await number_plan.stop()
+    await system_stats_service.stop()
+    await websocket_manager.shutdown()
     if db_manager:
         await db_manager.close()
     logger.info("Application shut down")
@@ -170,14 +226,14 @@ async def initialize_default_data(db: DatabaseManager):
         if not admin_user:
             logger.info("Initializing admin user...")
             
-            from auth import get_password_hash
+            from auth import get_password_hash_async
             
             # Create only admin user
             admin_user_data = User(
                 username="admin",
                 email="admin@callcenter.com",
                 name="Системный администратор",
-                password_hash=get_password_hash("admin"),
+                password_hash=await get_password_hash_async("admin"),
                 role=UserRole.ADMIN
             )
             await db.users.insert_one(admin_user_data.dict())
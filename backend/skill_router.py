@@ -0,0 +1,415 @@
+"""
+Smart Call Center - Skill-Based Routing (ACD)
+=============================================
+
+Распределение звонков по навыкам операторов в памяти.
+
+Каждому навыку назначается номер бита, навыки оператора хранятся как
+битовая маска (int). Для каждого навыка и стратегии ведется куча
+свободных операторов:
+- leastrecent - дольше всех свободен
+- fewestcalls - меньше всех звонков
+
+Поиск оператора для звонка - извлечение из кучи самого редкого
+требуемого навыка с проверкой маски (O(log n)), без запросов к MongoDB.
+Устаревшие записи куч отбрасываются лениво по версии оператора.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from config import config
+from number_plan import LatencyTracker
+from queue_estimator import (
+    AGENT_AVAILABLE, AGENT_BUSY, AGENT_OFFLINE, OPERATOR_STATUS_STATES
+)
+
+logger = logging.getLogger(__name__)
+
+# Стратегии выбора оператора
+STRATEGY_LEAST_RECENT = "leastrecent"
+STRATEGY_FEWEST_CALLS = "fewestcalls"
+ROUTING_STRATEGIES = (STRATEGY_LEAST_RECENT, STRATEGY_FEWEST_CALLS)
+
+# Куча всех свободных операторов (звонок без требований к навыкам)
+ANY_SKILL = -1
+
+class SkillRegistry:
+    """Соответствие навык -> номер бита"""
+
+    def __init__(self):
+        self.bits: Dict[str, int] = {}
+
+    def bit(self, skill: str) -> int:
+        """Номер бита навыка (новые навыки регистрируются)"""
+        skill = skill.strip().lower()
+        if skill not in self.bits:
+            self.bits[skill] = len(self.bits)
+        return self.bits[skill]
+
+    def mask(self, skills: Iterable[str], register: bool = True) -> Optional[int]:
+        """Битовая маска набора навыков (None - навык неизвестен и не регистрируется)"""
+        result = 0
+        for skill in skills or ():
+            if not skill or not skill.strip():
+                continue
+            name = skill.strip().lower()
+            if name not in self.bits and not register:
+                return None
+            result |= 1 << self.bit(name)
+        return result
+
+    def names(self, mask: int) -> List[str]:
+        return [skill for skill, bit in self.bits.items() if mask >> bit & 1]
+
+class AgentEntry:
+    """Оператор в индексе маршрутизации"""
+
+    __slots__ = ("extension", "operator_id", "user_id", "skills_mask", "state",
+                 "idle_since", "calls_handled", "version", "reserved_until")
+
+    def __init__(self, extension: str, operator_id: Optional[str] = None,
+                 user_id: Optional[str] = None, skills_mask: int = 0):
+        self.extension = extension
+        self.operator_id = operator_id
+        self.user_id = user_id
+        self.skills_mask = skills_mask
+        self.state = AGENT_OFFLINE
+        self.idle_since = time.monotonic()
+        self.calls_handled = 0
+        self.version = 0
+        self.reserved_until = 0.0
+
+    def sort_key(self, strategy: str) -> Tuple:
+        if strategy == STRATEGY_FEWEST_CALLS:
+            return (self.calls_handled, self.idle_since)
+        return (self.idle_since,)
+
+class SkillBasedRouter:
+    """Индекс свободных операторов по навыкам"""
+
+    def __init__(self, reservation_seconds: float = None):
+        self.reservation_seconds = reservation_seconds or config.SKILL_ROUTING_RESERVATION_SECONDS
+        self.skills = SkillRegistry()
+        self.agents: Dict[str, AgentEntry] = {}        # extension -> оператор
+        self.operator_extensions: Dict[str, str] = {}  # operator_id -> extension
+        self.queue_skills: Dict[str, int] = {}         # очередь -> маска навыков
+        self._heaps: Dict[Tuple[str, int], List] = {}  # (стратегия, бит) -> куча
+        self._reserved: Dict[str, AgentEntry] = {}
+        self._waiters: Dict[str, deque] = {}           # extension -> ожидающие звонки
+        self._sequence = itertools.count()
+
+        # Метрики
+        self.select_latency = LatencyTracker()
+        self.matches = 0
+        self.misses = 0
+        self.skipped_entries = 0
+
+    # === ОПЕРАТОРЫ ===
+
+    def upsert_operator(self, operator) -> AgentEntry:
+        """Добавление/обновление оператора (модель Operator)"""
+        extension = operator.extension
+        previous_extension = self.operator_extensions.get(operator.id)
+        if previous_extension and previous_extension != extension:
+            self.remove_operator(operator.id)
+
+        agent = self.agents.get(extension)
+        if agent is None:
+            agent = AgentEntry(extension)
+            self.agents[extension] = agent
+
+        agent.operator_id = operator.id
+        agent.user_id = operator.user_id
+        agent.skills_mask = self.skills.mask(operator.skills)
+        self.operator_extensions[operator.id] = extension
+
+        status = getattr(operator.status, "value", operator.status)
+        self._set_state(agent, OPERATOR_STATUS_STATES.get(status, AGENT_OFFLINE), force=True)
+        return agent
+
+    def remove_operator(self, operator_id: str):
+        """Удаление оператора из индекса"""
+        extension = self.operator_extensions.pop(operator_id, None)
+        agent = self.agents.pop(extension, None) if extension else None
+        if agent:
+            agent.version += 1
+            self._reserved.pop(extension, None)
+
+    def get_agent(self, extension: str) -> Optional[AgentEntry]:
+        return self.agents.get(extension)
+
+    def get_agent_by_operator_id(self, operator_id: str) -> Optional[AgentEntry]:
+        extension = self.operator_extensions.get(operator_id)
+        return self.agents.get(extension) if extension else None
+
+    def set_agent_state(self, extension: str, state: str):
+        """Смена состояния оператора по событиям Asterisk / статусу в БД"""
+        agent = self.agents.get(extension)
+        if agent:
+            # Событие подтверждает резерв (или отменяет его)
+            self._reserved.pop(extension, None)
+            self._set_state(agent, state)
+
+    def set_operator_status(self, operator_id: str, status):
+        """Смена статуса оператора (OperatorStatus)"""
+        agent = self.get_agent_by_operator_id(operator_id)
+        if agent:
+            self._reserved.pop(agent.extension, None)
+            status = getattr(status, "value", status)
+            self._set_state(agent, OPERATOR_STATUS_STATES.get(status, AGENT_OFFLINE))
+
+    def record_call_handled(self, extension: str):
+        """Оператор обслужил звонок (для стратегии fewestcalls)"""
+        agent = self.agents.get(extension)
+        if agent:
+            agent.calls_handled += 1
+
+    def reserve(self, agent: AgentEntry):
+        """Резерв оператора под звонок до соединения (или истечения резерва)"""
+        self._set_state(agent, AGENT_BUSY)
+        agent.reserved_until = time.monotonic() + self.reservation_seconds
+        self._reserved[agent.extension] = agent
+
+    def release(self, extension: str):
+        """Снятие резерва, если звонок так и не был соединен"""
+        agent = self._reserved.get(extension)
+        if agent:
+            self._set_state(agent, AGENT_AVAILABLE)
+
+    def _set_state(self, agent: AgentEntry, state: str, force: bool = False):
+        if agent.state == state and not force:
+            return
+
+        was_available = agent.state == AGENT_AVAILABLE
+        agent.state = state
+        agent.version += 1
+        self._reserved.pop(agent.extension, None)
+
+        if state == AGENT_AVAILABLE:
+            if not was_available:
+                agent.idle_since = time.monotonic()
+            if self._hand_off(agent):
+                return
+            self._push(agent)
+
+    def _hand_off(self, agent: AgentEntry) -> bool:
+        """Освободившийся оператор сразу достается ожидающему его звонку"""
+        waiters = self._waiters.get(agent.extension)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                self.reserve(agent)
+                future.set_result(True)
+                return True
+        return False
+
+    def _push(self, agent: AgentEntry):
+        """Запись свободного оператора в кучи всех его навыков"""
+        bits = [ANY_SKILL]
+        mask = agent.skills_mask
+        while mask:
+            low = mask & -mask
+            bits.append(low.bit_length() - 1)
+            mask ^= low
+
+        sequence = next(self._sequence)
+        for strategy in ROUTING_STRATEGIES:
+            entry = (agent.sort_key(strategy), sequence, agent.version, agent.extension)
+            for bit in bits:
+                heap = self._heaps.setdefault((strategy, bit), [])
+                heapq.heappush(heap, entry)
+                # Компактификация при накоплении устаревших записей
+                if len(heap) > 4 * len(self.agents) + 64:
+                    self._compact(heap)
+
+    def _compact(self, heap: List):
+        heap[:] = [entry for entry in heap if self._is_current(entry)]
+        heapq.heapify(heap)
+
+    def _is_current(self, entry) -> bool:
+        agent = self.agents.get(entry[3])
+        return agent is not None and agent.version == entry[2] and agent.state == AGENT_AVAILABLE
+
+    def _expire_reservations(self):
+        """Возврат операторов, резерв которых истек без соединения"""
+        if not self._reserved:
+            return
+        now = time.monotonic()
+        for extension, agent in list(self._reserved.items()):
+            if agent.reserved_until <= now:
+                logger.info(f"⏱️ Reservation expired for operator {extension}")
+                self._set_state(agent, AGENT_AVAILABLE)
+
+    async def wait_for_agent(self, extension: str, timeout: float) -> bool:
+        """Ожидание освобождения конкретного оператора (с резервом под звонок)"""
+        agent = self.agents.get(extension)
+        if agent is None:
+            return False
+        if agent.state == AGENT_AVAILABLE:
+            self.reserve(agent)
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(extension, deque())
+        waiters.append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            # Оператор мог быть передан ожиданию прямо перед отменой - снимаем резерв
+            if future.done() and not future.cancelled() and future.result():
+                self.release(extension)
+            raise
+        finally:
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(extension, None)
+
+    # === ОЧЕРЕДИ ===
+
+    def set_queue_skills(self, queue_name: str, skills: Iterable[str]):
+        """Требуемые навыки очереди"""
+        mask = self.skills.mask(skills)
+        if mask:
+            self.queue_skills[queue_name] = mask
+        else:
+            self.queue_skills.pop(queue_name, None)
+
+    def queue_skill_mask(self, queue_name: str) -> Optional[int]:
+        """Навыки очереди: явно заданные или навык с именем очереди
+
+        None - очередь нельзя обслужить по навыкам (решение за Asterisk).
+        """
+        mask = self.queue_skills.get(queue_name)
+        if mask is not None:
+            return mask
+        return self.skills.mask([queue_name], register=False)
+
+    # === ВЫБОР ОПЕРАТОРА ===
+
+    def select_operator(self, required_mask: int, strategy: str = STRATEGY_LEAST_RECENT,
+                        exclude: Optional[Set[str]] = None, reserve: bool = True) -> Optional[AgentEntry]:
+        """Лучший свободный оператор со всеми требуемыми навыками"""
+        started = time.perf_counter()
+        try:
+            self._expire_reservations()
+            if strategy not in ROUTING_STRATEGIES:
+                strategy = STRATEGY_LEAST_RECENT
+
+            heap = self._pick_heap(required_mask, strategy)
+            if not heap:
+                self.misses += 1
+                return None
+
+            skipped = []
+            found = None
+            while heap:
+                entry = heap[0]
+                if not self._is_current(entry):
+                    heapq.heappop(heap)
+                    continue
+
+                agent = self.agents[entry[3]]
+                if agent.skills_mask & required_mask != required_mask or (exclude and agent.extension in exclude):
+                    # Подходит не по всем навыкам - вернем в кучу после поиска
+                    skipped.append(heapq.heappop(heap))
+                    continue
+
+                found = agent
+                if reserve:
+                    heapq.heappop(heap)
+                break
+
+            for entry in skipped:
+                heapq.heappush(heap, entry)
+            self.skipped_entries += len(skipped)
+
+            if found is None:
+                self.misses += 1
+                return None
+
+            if reserve:
+                self.reserve(found)
+            self.matches += 1
+            return found
+        finally:
+            self.select_latency.record(time.perf_counter() - started)
+
+    def _pick_heap(self, required_mask: int, strategy: str) -> Optional[List]:
+        """Куча самого редкого требуемого навыка (меньше всего кандидатов)"""
+        if not required_mask:
+            return self._heaps.get((strategy, ANY_SKILL))
+
+        best = None
+        mask = required_mask
+        while mask:
+            low = mask & -mask
+            heap = self._heaps.get((strategy, low.bit_length() - 1))
+            if not heap:
+                return None
+            if best is None or len(heap) < len(best):
+                best = heap
+            mask ^= low
+        return best
+
+    def available_count(self, required_mask: int = 0) -> int:
+        """Количество свободных операторов с навыками (для метрик, O(n))"""
+        return sum(
+            1 for agent in self.agents.values()
+            if agent.state == AGENT_AVAILABLE and agent.skills_mask & required_mask == required_mask
+        )
+
+    # === ЗАГРУЗКА ===
+
+    async def load_from_db(self, db):
+        """Заполнение индекса операторами и навыками очередей из БД"""
+        try:
+            for operator in await db.get_operators():
+                self.upsert_operator(operator)
+
+            for queue in await db.get_queues():
+                if queue.required_skills:
+                    self.set_queue_skills(queue.name, queue.required_skills)
+
+            logger.info(f"🎯 Skill router loaded: {len(self.agents)} operators, "
+                        f"{len(self.skills.bits)} skills, {len(self.queue_skills)} queues with skills")
+        except Exception as e:
+            logger.error(f"Error loading skill router: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики маршрутизации по навыкам"""
+        states: Dict[str, int] = {}
+        for agent in self.agents.values():
+            states[agent.state] = states.get(agent.state, 0) + 1
+
+        return {
+            "operators": len(self.agents),
+            "states": states,
+            "reserved": len(self._reserved),
+            "waiting_calls": sum(len(waiters) for waiters in self._waiters.values()),
+            "skills": dict(self.skills.bits),
+            "queue_skills": {queue: self.skills.names(mask) for queue, mask in self.queue_skills.items()},
+            "heap_entries": sum(len(heap) for heap in self._heaps.values()),
+            "matches": self.matches,
+            "misses": self.misses,
+            "skipped_entries": self.skipped_entries,
+            "select_latency": self.select_latency.get_stats()
+        }
+
+# Глобальный экземпляр
+_skill_router: Optional[SkillBasedRouter] = None
+
+def get_skill_router() -> SkillBasedRouter:
+    """Получение глобального маршрутизатора по навыкам"""
+    global _skill_router
+    if _skill_router is None:
+        _skill_router = SkillBasedRouter()
+    return _skill_router
@@ -0,0 +1,329 @@
+"""
+Smart Call Center - Staffing Forecast
+=====================================
+
+Прогноз необходимого количества операторов по интервалам (Erlang C / Erlang A).
+
+История звонков за несколько недель собирается одной агрегацией по
+коллекции calls в профиль "очередь x день недели x интервал", который
+разворачивается на горизонт планирования. Расчет выполняется NumPy
+сразу для всех интервалов, очередей и целевых уровней сервиса: цикл
+идет только по числу операторов, каждая итерация векторизована.
+"""
+
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import config
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+SUPPORTED_INTERVALS = (15, 30, 60)
+
+def parse_sla_targets(value: str) -> List[Tuple[float, int]]:
+    """Разбор целей SLA вида "80/20,90/30" (процент / секунды)"""
+    targets = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        percent, seconds = item.split("/")
+        targets.append((float(percent) / 100, int(seconds)))
+    return targets
+
+# === ВЕКТОРНЫЕ ФОРМУЛЫ ===
+
+def max_agents_for(traffic) -> int:
+    """Верхняя граница перебора числа операторов"""
+    peak = float(traffic.max()) if traffic.size else 0.0
+    return int(math.ceil(peak + 6 * math.sqrt(peak) + 10))
+
+def erlang_c_staffing(traffic, handle_time, sla_levels, sla_seconds, max_agents: int):
+    """Минимальное число операторов для каждой цели SLA (Erlang C)
+
+    traffic, handle_time: массивы формы (cells,)
+    sla_levels, sla_seconds: массивы формы (targets,)
+    Возвращает (erlang_b_table (max_agents+1, cells), staffing (targets, cells)).
+    """
+    cells = traffic.shape[0]
+    targets = sla_levels.shape[0]
+
+    erlang_b = np.ones(cells)
+    b_table = np.empty((max_agents + 1, cells))
+    b_table[0] = erlang_b
+
+    staffing = np.full((targets, cells), max_agents, dtype=np.int64)
+    found = np.zeros((targets, cells), dtype=bool)
+
+    # Без нагрузки операторы не нужны
+    idle = traffic <= 0
+    staffing[:, idle] = 0
+    found[:, idle] = True
+
+    safe_handle = np.where(handle_time > 0, handle_time, 1.0)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for agents in range(1, max_agents + 1):
+            # Рекуррентная формула Erlang B для всех ячеек сразу
+            erlang_b = traffic * erlang_b / (agents + traffic * erlang_b)
+            b_table[agents] = erlang_b
+
+            stable = traffic < agents
+            prob_wait = np.where(
+                stable,
+                agents * erlang_b / (agents - traffic * (1 - erlang_b)),
+                1.0
+            )
+            # SL(t) = 1 - C * exp(-(N - A) * t / AHT), для всех целей сразу
+            service_level = 1 - prob_wait[None, :] * np.exp(
+                -(agents - traffic)[None, :] * sla_seconds[:, None] / safe_handle[None, :]
+            )
+            met = stable[None, :] & (service_level >= sla_levels[:, None]) & ~found
+            staffing[met] = agents
+            found |= met
+
+    return b_table, staffing
+
+def erlang_a_abandon_probability(agents, arrival_rate, service_rate, patience_rate, erlang_b):
+    """Вероятность отказа клиента в модели Erlang A (M/M/n+M)
+
+    Использует A(x, y) = 1 + sum_j y^j / prod_{i<=j}(x + i), x = n*mu/theta,
+    y = lambda/theta; ряд считается в логарифмах для устойчивости.
+    """
+    x = agents * service_rate / patience_rate
+    y = arrival_rate / patience_rate
+
+    terms = int(math.ceil(max(float((y - x).max()), 0.0) + 10 * math.sqrt(float(y.max()) + 1) + 20))
+    steps = np.arange(1, terms + 1)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        log_terms = np.cumsum(np.log(y)[:, None] - np.log(x[:, None] + steps[None, :]), axis=1)
+        peak = np.maximum(log_terms.max(axis=1), 0.0)
+        log_series = peak + np.log(np.exp(-peak) + np.exp(log_terms - peak[:, None]).sum(axis=1))
+
+        # P(wait) = S*E / (1 + (S-1)*E), P(ab|wait) = 1/(rho*S) + 1 - 1/rho
+        prob_wait = 1 / (1 + np.exp(np.log1p(-erlang_b) - np.log(erlang_b) - log_series))
+        rho = arrival_rate / (agents * service_rate)
+        abandon_given_wait = np.exp(-np.log(rho) - log_series) + 1 - 1 / rho
+        result = prob_wait * abandon_given_wait
+
+    return np.clip(np.nan_to_num(result, nan=1.0), 0.0, 1.0)
+
+def erlang_a_staffing(arrival_rate, handle_time, patience_seconds: float, max_abandon: float,
+                      b_table, max_agents: int):
+    """Минимальное число операторов при допустимой доле отказов (Erlang A)
+
+    Доля отказов монотонно убывает с ростом числа операторов, поэтому
+    используется векторный бинарный поиск по всем ячейкам одновременно.
+    """
+    cells = arrival_rate.shape[0]
+    active = arrival_rate > 0
+    service_rate = np.where(handle_time > 0, 1 / np.where(handle_time > 0, handle_time, 1.0), 1.0)
+    patience_rate = 1.0 / patience_seconds
+
+    # Среднее число занятых операторов A*(1 - P(ab)) не превышает штат - нижняя граница поиска
+    traffic = arrival_rate * handle_time
+    low = np.clip(np.ceil(traffic * (1 - max_abandon)), 1, max_agents).astype(np.int64)
+    high = np.full(cells, max_agents, dtype=np.int64)
+    index = np.arange(cells)
+
+    while True:
+        searching = active & (low < high)
+        if not searching.any():
+            break
+        middle = (low + high) // 2
+        abandon = erlang_a_abandon_probability(
+            middle[searching], arrival_rate[searching], service_rate[searching],
+            patience_rate, b_table[middle[searching], index[searching]]
+        )
+        ok = abandon <= max_abandon
+        high[np.flatnonzero(searching)[ok]] = middle[searching][ok]
+        low[np.flatnonzero(searching)[~ok]] = middle[searching][~ok] + 1
+
+    return np.where(active, low, 0)
+
+def compute_staffing(volume, handle_time, interval_minutes: int, sla_targets: List[Tuple[float, int]],
+                     patience_seconds: float = None, max_abandon: float = None) -> Dict[str, Any]:
+    """Расчет для массива произвольной формы (например queues x days x intervals)"""
+    shape = volume.shape
+    volume_flat = volume.reshape(-1).astype(float)
+    handle_flat = handle_time.reshape(-1).astype(float)
+
+    arrival_rate = volume_flat / (interval_minutes * 60)
+    traffic = arrival_rate * handle_flat
+    max_agents = max_agents_for(traffic)
+
+    sla_levels = np.array([level for level, _ in sla_targets], dtype=float)
+    sla_seconds = np.array([seconds for _, seconds in sla_targets], dtype=float)
+
+    b_table, staffing = erlang_c_staffing(traffic, handle_flat, sla_levels, sla_seconds, max_agents)
+
+    result = {
+        "traffic": traffic.reshape(shape),
+        "erlang_c": staffing.reshape((len(sla_targets),) + shape),
+        "max_agents": max_agents
+    }
+
+    if patience_seconds and max_abandon is not None:
+        result["erlang_a"] = erlang_a_staffing(
+            arrival_rate, handle_flat, patience_seconds, max_abandon, b_table, max_agents
+        ).reshape(shape)
+
+    return result
+
+# === ИСТОРИЯ И ПРОГНОЗ ===
+
+class StaffingForecaster:
+    """Прогноз штата операторов по истории звонков"""
+
+    def __init__(self, default_handle_time: float = None):
+        self.default_handle_time = default_handle_time or config.DEFAULT_HANDLE_TIME
+
+    async def fetch_profile(self, db, history_weeks: int, interval_minutes: int,
+                            queue_names: Optional[List[str]] = None, timezone: str = "UTC"):
+        """Недельный профиль: средний объем и AHT по (очередь, день недели, интервал)"""
+        since = datetime.utcnow() - timedelta(weeks=history_weeks)
+        match: Dict[str, Any] = {"start_time": {"$gte": since}, "queue_name": {"$ne": None}}
+        if queue_names:
+            match["queue_name"] = {"$in": queue_names}
+
+        date = {"date": "$start_time", "timezone": timezone}
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {
+                    "queue": "$queue_name",
+                    "day": {"$isoDayOfWeek": date},
+                    "slot": {"$floor": {"$divide": [
+                        {"$add": [{"$multiply": [{"$hour": date}, 60]}, {"$minute": date}]},
+                        interval_minutes
+                    ]}}
+                },
+                "calls": {"$sum": 1},
+                "talk_time": {"$sum": {"$ifNull": ["$talk_time", 0]}},
+                "answered": {"$sum": {"$cond": [{"$gt": [{"$ifNull": ["$talk_time", 0]}, 0]}, 1, 0]}}
+            }}
+        ]
+
+        rows = await db.calls.aggregate(pipeline).to_list(None)
+
+        queues = sorted(queue_names or {row["_id"]["queue"] for row in rows})
+        queue_index = {name: i for i, name in enumerate(queues)}
+        slots = 24 * 60 // interval_minutes
+
+        calls = np.zeros((len(queues), 7, slots))
+        talk_time = np.zeros_like(calls)
+        answered = np.zeros_like(calls)
+
+        if rows:
+            q = np.array([queue_index[row["_id"]["queue"]] for row in rows])
+            d = np.array([row["_id"]["day"] - 1 for row in rows])
+            s = np.array([int(row["_id"]["slot"]) for row in rows])
+            np.add.at(calls, (q, d, s), [row["calls"] for row in rows])
+            np.add.at(talk_time, (q, d, s), [row["talk_time"] for row in rows])
+            np.add.at(answered, (q, d, s), [row["answered"] for row in rows])
+
+        volume = calls / history_weeks
+
+        # AHT интервала, при отсутствии данных - AHT очереди или значение по умолчанию
+        queue_answered = answered.sum(axis=(1, 2))
+        queue_aht = np.where(
+            queue_answered > 0,
+            talk_time.sum(axis=(1, 2)) / np.maximum(queue_answered, 1),
+            self.default_handle_time
+        )
+        handle_time = np.where(
+            answered > 0,
+            talk_time / np.maximum(answered, 1),
+            queue_aht[:, None, None]
+        )
+
+        return queues, volume, handle_time, len(rows)
+
+    async def forecast(self, db, history_weeks: int = 4, horizon_days: int = 7, interval_minutes: int = 30,
+                       sla_targets: Optional[List[Tuple[float, int]]] = None, queue_names: Optional[List[str]] = None,
+                       wrapup_seconds: int = 0, patience_seconds: Optional[float] = None,
+                       max_abandon: Optional[float] = None, timezone: str = "UTC") -> Dict[str, Any]:
+        """Прогноз штата на горизонт планирования"""
+        sla_targets = sla_targets or [(0.8, config.SERVICE_LEVEL_TARGET_SECONDS)]
+
+        queues, volume, handle_time, groups = await self.fetch_profile(
+            db, history_weeks, interval_minutes, queue_names, timezone
+        )
+
+        # Разворачиваем недельный профиль на даты горизонта
+        start_date = datetime.utcnow().date() + timedelta(days=1)
+        dates = [start_date + timedelta(days=i) for i in range(horizon_days)]
+        weekdays = np.array([date.weekday() for date in dates], dtype=np.int64)
+
+        plan_volume = volume[:, weekdays, :]
+        plan_handle = handle_time[:, weekdays, :] + wrapup_seconds
+
+        started = time.perf_counter()
+        result = compute_staffing(
+            plan_volume, plan_handle, interval_minutes, sla_targets, patience_seconds, max_abandon
+        )
+        compute_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        slots = volume.shape[2]
+        interval_labels = [
+            f"{(i * interval_minutes) // 60:02d}:{(i * interval_minutes) % 60:02d}" for i in range(slots)
+        ]
+        sla_labels = [f"{int(round(level * 100))}/{seconds}" for level, seconds in sla_targets]
+
+        queues_result = {}
+        for qi, queue_name in enumerate(queues):
+            queue_result = {
+                "forecast_calls": np.round(plan_volume[qi], 2).tolist(),
+                "avg_handle_time": np.round(plan_handle[qi], 1).tolist(),
+                "traffic_erlangs": np.round(result["traffic"][qi], 3).tolist(),
+                "required_agents": {
+                    label: result["erlang_c"][ti, qi].tolist() for ti, label in enumerate(sla_labels)
+                },
+                "peak_agents": {
+                    label: int(result["erlang_c"][ti, qi].max()) if result["erlang_c"][ti, qi].size else 0
+                    for ti, label in enumerate(sla_labels)
+                }
+            }
+            if "erlang_a" in result:
+                queue_result["required_agents_abandon"] = result["erlang_a"][qi].tolist()
+            queues_result[queue_name] = queue_result
+
+        return {
+            "parameters": {
+                "history_weeks": history_weeks,
+                "horizon_days": horizon_days,
+                "interval_minutes": interval_minutes,
+                "sla_targets": sla_labels,
+                "wrapup_seconds": wrapup_seconds,
+                "patience_seconds": patience_seconds,
+                "max_abandon_rate": max_abandon,
+                "timezone": timezone
+            },
+            "dates": [date.isoformat() for date in dates],
+            "days": [DAY_NAMES[day] for day in weekdays],
+            "intervals": interval_labels,
+            "queues": queues_result,
+            "history_groups": groups,
+            "compute_ms": compute_ms,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+# Глобальный экземпляр
+_staffing_forecaster: Optional[StaffingForecaster] = None
+
+def get_staffing_forecaster() -> StaffingForecaster:
+    """Получение глобального прогнозировщика штата"""
+    global _staffing_forecaster
+    if _staffing_forecaster is None:
+        _staffing_forecaster = StaffingForecaster()
+    return _staffing_forecaster
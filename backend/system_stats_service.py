@@ -0,0 +1,133 @@
+"""
+Smart Call Center - System Stats Service
+========================================
+
+Фоновое обновление системной статистики для админских WebSocket
+подключений. Счетчики берутся через count_documents /
+estimated_document_count, статус Asterisk - из глобального ARI клиента,
+поэтому подключение и запрос обновления обслуживаются из памяти.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+class SystemStatsService:
+    """Кэш системной статистики с фоновым обновлением"""
+
+    def __init__(self, refresh_interval: float = None):
+        self.refresh_interval = refresh_interval or config.SYSTEM_STATS_REFRESH_INTERVAL
+        self.stats: Dict[str, Any] = {}
+        self.refreshed_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.running = False
+
+        # Метрики
+        self.refresh_count = 0
+        self.refresh_errors = 0
+        self.last_refresh_ms = 0.0
+
+    async def get_stats(self, db=None) -> Dict[str, Any]:
+        """Получение статистики из кэша (обновление только если кэш пуст или устарел)"""
+        if self._is_stale():
+            await self.refresh(db)
+        return self.stats
+
+    def _is_stale(self) -> bool:
+        if self.refreshed_at is None:
+            return True
+        # Запас на случай остановки фонового цикла
+        loop_time = asyncio.get_running_loop().time()
+        return loop_time - self.refreshed_at > self.refresh_interval * 2
+
+    async def refresh(self, db=None) -> Dict[str, Any]:
+        """Пересчет статистики (single-flight: параллельные вызовы ждут один запрос)"""
+        started_at = asyncio.get_running_loop().time()
+        async with self._lock:
+            # Пока ждали блокировку, статистику мог обновить другой вызов
+            if self.refreshed_at is not None and self.refreshed_at >= started_at:
+                return self.stats
+
+            if db is None:
+                from db import get_db
+                db = get_db()
+
+            try:
+                self.stats = await self._collect(db)
+                self.refresh_count += 1
+            except Exception as e:
+                self.refresh_errors += 1
+                logger.error(f"Error refreshing system stats: {e}")
+
+            now = asyncio.get_running_loop().time()
+            self.refreshed_at = now
+            self.last_refresh_ms = round((now - started_at) * 1000, 2)
+            return self.stats
+
+    async def _collect(self, db) -> Dict[str, Any]:
+        """Сбор счетчиков без загрузки документов"""
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        total_users, total_operators, total_queues, today_calls = await asyncio.gather(
+            db.users.estimated_document_count(),
+            db.operators.estimated_document_count(),
+            db.queues.count_documents({"is_active": True}),
+            db.calls.count_documents({"start_time": {"$gte": today}})
+        )
+
+        # Статус Asterisk из уже установленного подключения
+        from asterisk_client import get_ari_client
+        ari_client = await get_ari_client()
+        asterisk_connected = bool(ari_client and ari_client.connected)
+
+        return {
+            "users": total_users,
+            "operators": total_operators,
+            "queues": total_queues,
+            "calls_today": today_calls,
+            "asterisk_connected": asterisk_connected,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+    def start(self, db=None):
+        """Запуск фонового обновления"""
+        if self._task is None or self._task.done():
+            self.running = True
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        """Остановка фонового обновления"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, db):
+        while self.running:
+            await self.refresh(db)
+            await asyncio.sleep(self.refresh_interval)
+
+    def get_service_stats(self) -> Dict[str, Any]:
+        """Метрики сервиса"""
+        return {
+            "refresh_interval": self.refresh_interval,
+            "refresh_count": self.refresh_count,
+            "refresh_errors": self.refresh_errors,
+            "last_refresh_ms": self.last_refresh_ms
+        }
+
+# Глобальный экземпляр
+_system_stats_service: Optional[SystemStatsService] = None
+
+def get_system_stats_service() -> SystemStatsService:
+    """Получение глобального сервиса системной статистики"""
+    global _system_stats_service
+    if _system_stats_service is None:
+        _system_stats_service = SystemStatsService()
+    return _system_stats_service
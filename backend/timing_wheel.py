@@ -0,0 +1,213 @@
+"""
+Smart Call Center - Hierarchical Timing Wheel
+=============================================
+
+Иерархическое колесо таймеров для тысяч одновременных дедлайнов
+(heartbeat WebSocket, таймауты звонков) без отдельной asyncio задачи
+на каждый таймер. Планирование и отмена - O(1), один фоновый цикл
+продвигает колесо с шагом tick_seconds.
+"""
+
+import asyncio
+import inspect
+import itertools
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Timer:
+    """Таймер в колесе"""
+
+    __slots__ = ("timer_id", "deadline_tick", "deadline", "callback", "args", "cancelled", "slot")
+
+    def __init__(self, timer_id: int, deadline_tick: int, deadline: float, callback: Callable, args: tuple):
+        self.timer_id = timer_id
+        self.deadline_tick = deadline_tick
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.slot: Optional[Dict[int, "Timer"]] = None
+
+class TimingWheel:
+    """Иерархическое колесо таймеров
+
+    Уровень 0 имеет wheel_size слотов по одному тику, каждый следующий
+    уровень - слоты в wheel_size раз крупнее. При обороте младшего уровня
+    таймеры из очередного слота старшего уровня переносятся вниз.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, wheel_size: int = 64, levels: int = 4, name: str = "timers"):
+        self.tick_seconds = tick_seconds
+        self.wheel_size = wheel_size
+        self.levels = levels
+        self.name = name
+
+        self.wheels: List[List[Dict[int, Timer]]] = [
+            [{} for _ in range(wheel_size)] for _ in range(levels)
+        ]
+        self.start_time = time.monotonic()
+        self.current_tick = 0
+        self._ids = itertools.count(1)
+        self._task: Optional[asyncio.Task] = None
+        self._callback_tasks: set = set()
+        self.running = False
+
+        # Метрики
+        self.active_count = 0
+        self.scheduled_total = 0
+        self.fired_total = 0
+        self.cancelled_total = 0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    # === ПЛАНИРОВАНИЕ ===
+
+    def schedule(self, delay_seconds: float, callback: Callable, *args) -> Timer:
+        """Запланировать вызов callback(*args) через delay_seconds"""
+        deadline = time.monotonic() + max(delay_seconds, 0)
+        deadline_tick = max(
+            self.current_tick + 1,
+            math.ceil((deadline - self.start_time) / self.tick_seconds)
+        )
+        timer = Timer(next(self._ids), deadline_tick, deadline, callback, args)
+        self._insert(timer)
+
+        self.active_count += 1
+        self.scheduled_total += 1
+        return timer
+
+    def cancel(self, timer: Optional[Timer]) -> bool:
+        """Отмена таймера"""
+        if timer is None or timer.cancelled or timer.slot is None:
+            return False
+
+        timer.slot.pop(timer.timer_id, None)
+        timer.slot = None
+        timer.cancelled = True
+        self.active_count -= 1
+        self.cancelled_total += 1
+        return True
+
+    def _insert(self, timer: Timer):
+        """Размещение таймера в слоте подходящего уровня"""
+        remaining = timer.deadline_tick - self.current_tick
+        span = 1
+        for level in range(self.levels):
+            if remaining < span * self.wheel_size or level == self.levels - 1:
+                # Таймеры за горизонтом колеса ставятся в дальний слот старшего уровня
+                target_tick = min(timer.deadline_tick, self.current_tick + span * self.wheel_size - 1)
+                slot = self.wheels[level][(target_tick // span) % self.wheel_size]
+                slot[timer.timer_id] = timer
+                timer.slot = slot
+                return
+            span *= self.wheel_size
+
+    # === ПРОДВИЖЕНИЕ КОЛЕСА ===
+
+    def _advance_one_tick(self) -> List[Timer]:
+        """Продвижение на один тик, возвращает истекшие таймеры"""
+        self.current_tick += 1
+        tick = self.current_tick
+
+        # Перенос таймеров со старших уровней (сначала самый старший)
+        cascade_levels = []
+        span = self.wheel_size
+        for level in range(1, self.levels):
+            if tick % span != 0:
+                break
+            cascade_levels.append((level, span))
+            span *= self.wheel_size
+
+        for level, span in reversed(cascade_levels):
+            index = (tick // span) % self.wheel_size
+            timers = self.wheels[level][index]
+            self.wheels[level][index] = {}
+            for timer in timers.values():
+                self._insert(timer)
+
+        index = tick % self.wheel_size
+        expired = self.wheels[0][index]
+        self.wheels[0][index] = {}
+
+        due = []
+        for timer in expired.values():
+            if timer.deadline_tick <= tick:
+                timer.slot = None
+                due.append(timer)
+            else:
+                # Таймер за горизонтом - возвращаем в колесо
+                self._insert(timer)
+        return due
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """Продвижение колеса до текущего времени, возвращает число сработавших таймеров"""
+        now = time.monotonic() if now is None else now
+        target_tick = int((now - self.start_time) / self.tick_seconds)
+        fired = 0
+
+        while self.current_tick < target_tick:
+            for timer in self._advance_one_tick():
+                self._fire(timer, now)
+                fired += 1
+        return fired
+
+    def _fire(self, timer: Timer, now: float):
+        """Вызов callback сработавшего таймера"""
+        self.active_count -= 1
+        self.fired_total += 1
+
+        lag = max(now - timer.deadline, 0.0)
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+
+        try:
+            result = timer.callback(*timer.args)
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._callback_tasks.add(task)
+                task.add_done_callback(self._on_callback_done)
+        except Exception as e:
+            logger.error(f"Error in {self.name} timer callback: {e}")
+
+    def _on_callback_done(self, task: asyncio.Task):
+        """Логирование ошибок асинхронных callback'ов"""
+        self._callback_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error in {self.name} timer callback: {task.exception()}")
+
+    # === ФОНОВЫЙ ЦИКЛ ===
+
+    def start(self):
+        """Запуск фонового цикла продвижения колеса"""
+        if self._task is None or self._task.done():
+            self.running = True
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка фонового цикла"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while self.running:
+            await asyncio.sleep(self.tick_seconds)
+            self.advance()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики таймеров"""
+        return {
+            "name": self.name,
+            "tick_seconds": self.tick_seconds,
+            "active_timers": self.active_count,
+            "scheduled_total": self.scheduled_total,
+            "fired_total": self.fired_total,
+            "cancelled_total": self.cancelled_total,
+            "avg_lag_ms": round(self.total_lag / self.fired_total * 1000, 2) if self.fired_total else 0,
+            "max_lag_ms": round(self.max_lag * 1000, 2)
+        }
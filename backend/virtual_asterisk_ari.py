@@ -337,6 +337,55 @@ class VirtualAsteriskARI:
                 "error": f"Channel {channel_id} not found"
             }
     
+    async def set_channel_variable(self, channel_id: str, variable: str, value: Any) -> Dict[str, Any]:
+        """Имитация установки переменной канала"""
+        if not self.is_connected:
+            return {"success": False, "error": "Not connected"}
+            
+        if channel_id in self.active_channels:
+            self.active_channels[channel_id].setdefault("variables", {})[variable] = str(value)
+            return {
+                "success": True,
+                "message": f"Variable {variable} set on {channel_id}"
+            }
+        else:
+            return {
+                "success": False,
+                "error": f"Channel {channel_id} not found"
+            }
+    
+    async def continue_in_dialplan(self, channel_id: str, context: str, extension: str = "s",
+                                   priority: int = 1) -> Dict[str, Any]:
+        """Имитация выхода канала из Stasis в dialplan"""
+        if not self.is_connected:
+            return {"success": False, "error": "Not connected"}
+            
+        if channel_id in self.active_channels:
+            self.active_channels[channel_id].update({
+                "context": context,
+                "extension": extension,
+                "priority": priority
+            })
+            return {
+                "success": True,
+                "message": f"Channel {channel_id} continued to {context},{extension},{priority}"
+            }
+        else:
+            return {
+                "success": False,
+                "error": f"Channel {channel_id} not found"
+            }
+    
+    async def send_channel_to_queue(self, channel_id: str, queue_name: str, context: str,
+                                    timeout: Optional[int] = None) -> Dict[str, Any]:
+        """Имитация передачи канала в Queue() с лимитом ожидания"""
+        result = await self.set_channel_variable(channel_id, "QUEUE_NAME", queue_name)
+        if result["success"] and timeout:
+            result = await self.set_channel_variable(channel_id, "QUEUE_TIMEOUT", int(timeout))
+        if not result["success"]:
+            return result
+        return await self.continue_in_dialplan(channel_id, context)
+    
     async def generate_call_event(self, event_type: str = "StasisStart") -> Dict[str, Any]:
         """Генерация случайного события звонка для тестирования"""
         channel_id = f"channel-{uuid.uuid4().hex[:8]}"
@@ -0,0 +1,268 @@
+"""
+Smart Call Center - WebSocket Backplane
+=======================================
+
+Межпроцессная шина (pub/sub) для доставки WebSocket событий между
+воркерами uvicorn. Каждый воркер публикует локально возникшие события
+один раз и доставляет полученные из шины события только своим сокетам.
+
+Реализации:
+- InProcessBackplane - в памяти процесса (тесты, один воркер)
+- MongoBackplane - capped collection MongoDB с tailable cursor
+
+По умолчанию используется InProcessBackplane; MongoBackplane включается
+явно (WEBSOCKET_BACKPLANE=mongo) при запуске нескольких воркеров.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Обработчик входящих событий: (topic, message) -> None
+BackplaneHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+def generate_worker_id() -> str:
+    """Уникальный идентификатор воркера"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+class WebSocketBackplane(ABC):
+    """Базовый класс backplane для WebSocket событий"""
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or generate_worker_id()
+        self.handler: Optional[BackplaneHandler] = None
+        self.running = False
+
+        # Метрики
+        self.published_count = 0
+        self.received_count = 0
+
+    async def start(self, handler: BackplaneHandler):
+        """Запуск backplane с обработчиком входящих событий"""
+        self.handler = handler
+        self.running = True
+
+    async def stop(self):
+        """Остановка backplane"""
+        self.running = False
+
+    @abstractmethod
+    async def publish(self, topic: str, message: Dict[str, Any]):
+        """Публикация события в шину"""
+
+    async def _dispatch(self, origin: str, topic: str, message: Dict[str, Any]):
+        """Доставка события локальному обработчику (свои события пропускаются)"""
+        if origin == self.worker_id or not self.handler:
+            return
+
+        self.received_count += 1
+        try:
+            await self.handler(topic, message)
+        except Exception as e:
+            logger.error(f"Error dispatching backplane event {topic}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика backplane"""
+        return {
+            "type": self.__class__.__name__,
+            "worker_id": self.worker_id,
+            "running": self.running,
+            "published": self.published_count,
+            "received": self.received_count
+        }
+
+class InProcessHub:
+    """Общая шина в памяти для InProcessBackplane"""
+
+    def __init__(self):
+        self.subscribers: List["InProcessBackplane"] = []
+
+    def publish(self, envelope: Dict[str, Any]):
+        """Рассылка события всем подписчикам"""
+        for subscriber in self.subscribers:
+            subscriber.inbox.put_nowait(envelope)
+
+# Шина по умолчанию для воркеров внутри одного процесса
+_default_hub = InProcessHub()
+
+class InProcessBackplane(WebSocketBackplane):
+    """Backplane в памяти процесса (для тестов и одного воркера)"""
+
+    def __init__(self, hub: Optional[InProcessHub] = None, worker_id: Optional[str] = None):
+        super().__init__(worker_id)
+        self.hub = hub or _default_hub
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self._consumer_task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: BackplaneHandler):
+        await super().start(handler)
+        self.hub.subscribers.append(self)
+        # Один потребитель на воркер - порядок событий сохраняется (FIFO)
+        self._consumer_task = asyncio.create_task(self._consume())
+        logger.info(f"✅ In-process WebSocket backplane started: {self.worker_id}")
+
+    async def stop(self):
+        await super().stop()
+        if self in self.hub.subscribers:
+            self.hub.subscribers.remove(self)
+        if self._consumer_task:
+            self._consumer_task.cancel()
+            self._consumer_task = None
+
+    async def publish(self, topic: str, message: Dict[str, Any]):
+        self.published_count += 1
+        self.hub.publish({
+            "origin": self.worker_id,
+            "topic": topic,
+            "message": message
+        })
+
+    async def _consume(self):
+        """Цикл доставки входящих событий"""
+        while self.running:
+            envelope = await self.inbox.get()
+            await self._dispatch(envelope["origin"], envelope["topic"], envelope["message"])
+
+class MongoBackplane(WebSocketBackplane):
+    """Backplane на capped collection MongoDB
+
+    Capped collection сохраняет порядок вставки, поэтому события одного
+    топика доставляются в порядке публикации. Публикация идет через
+    единственную задачу-писатель воркера, чтение - через tailable cursor.
+
+    ObjectId генерируется клиентом и между процессами не монотонен,
+    поэтому позиция чтения - последний обработанный документ в порядке
+    $natural, а не диапазон по _id.
+    """
+
+    def __init__(self, database, collection_name: str = "websocket_events",
+                 size_bytes: int = 16 * 1024 * 1024, worker_id: Optional[str] = None):
+        super().__init__(worker_id)
+        self.database = database
+        self.collection_name = collection_name
+        self.size_bytes = size_bytes
+        self.collection = None
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._last_id = None
+
+    async def start(self, handler: BackplaneHandler):
+        await super().start(handler)
+        await self._ensure_collection()
+
+        # Начинаем чтение с последнего существующего события
+        last = await self.collection.find_one({}, sort=[("$natural", -1)])
+        if last is None:
+            # Tailable cursor не работает на пустой capped collection
+            result = await self.collection.insert_one({
+                "origin": self.worker_id,
+                "topic": "__init__",
+                "created_at": datetime.utcnow()
+            })
+            self._last_id = result.inserted_id
+        else:
+            self._last_id = last["_id"]
+
+        self._tasks = [
+            asyncio.create_task(self._publisher_loop()),
+            asyncio.create_task(self._tail_loop())
+        ]
+        logger.info(f"✅ MongoDB WebSocket backplane started: {self.worker_id}")
+
+    async def stop(self):
+        await super().stop()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _ensure_collection(self):
+        """Создание capped collection при необходимости"""
+        existing = await self.database.list_collection_names()
+        if self.collection_name not in existing:
+            try:
+                await self.database.create_collection(
+                    self.collection_name,
+                    capped=True,
+                    size=self.size_bytes
+                )
+            except Exception as e:
+                # Коллекцию мог создать параллельно другой воркер
+                logger.debug(f"Backplane collection create skipped: {e}")
+        self.collection = self.database[self.collection_name]
+
+    async def publish(self, topic: str, message: Dict[str, Any]):
+        self.published_count += 1
+        self.outbox.put_nowait({
+            "origin": self.worker_id,
+            "topic": topic,
+            "payload": json.dumps(message, default=str),
+            "created_at": datetime.utcnow()
+        })
+
+    async def _publisher_loop(self):
+        """Единственный писатель воркера: пачечная вставка с сохранением порядка"""
+        while self.running:
+            batch = [await self.outbox.get()]
+            while not self.outbox.empty() and len(batch) < 500:
+                batch.append(self.outbox.get_nowait())
+            try:
+                await self.collection.insert_many(batch, ordered=True)
+            except Exception as e:
+                logger.error(f"Error publishing {len(batch)} backplane events: {e}")
+
+    async def _tail_loop(self):
+        """Чтение новых событий через tailable await cursor"""
+        from pymongo import CursorType
+
+        while self.running:
+            try:
+                # Переоткрытый курсор читает коллекцию с начала в порядке
+                # $natural и пропускает все до последнего обработанного события
+                skipping = await self.collection.count_documents({"_id": self._last_id}, limit=1) > 0
+                if not skipping:
+                    logger.warning("Backplane resume point was overwritten in capped collection, "
+                                   "delivering all retained events")
+
+                cursor = self.collection.find(
+                    {},
+                    cursor_type=CursorType.TAILABLE_AWAIT,
+                    sort=[("$natural", 1)]
+                )
+                while self.running and cursor.alive:
+                    async for doc in cursor:
+                        if skipping:
+                            skipping = doc["_id"] != self._last_id
+                            continue
+                        self._last_id = doc["_id"]
+                        if "payload" not in doc:
+                            continue
+                        await self._dispatch(doc["origin"], doc["topic"], json.loads(doc["payload"]))
+                    await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Backplane tail error: {e}")
+                await asyncio.sleep(1)
+
+def create_backplane(db_manager=None) -> WebSocketBackplane:
+    """Создание backplane согласно конфигурации"""
+    from config import config
+
+    # MAX_WORKERS не связан с реальным числом процессов uvicorn, поэтому
+    # MongoDB backplane включается только явно
+    if config.WEBSOCKET_BACKPLANE.lower() == "mongo" and db_manager is not None:
+        return MongoBackplane(
+            db_manager.db,
+            collection_name=config.WEBSOCKET_BACKPLANE_COLLECTION,
+            size_bytes=config.WEBSOCKET_BACKPLANE_SIZE_MB * 1024 * 1024
+        )
+
+    return InProcessBackplane()
@@ -1,16 +1,42 @@
 import asyncio
-import json
 import logging
-from typing import Dict, Any, Set
+import time
+from typing import Dict, Any, Set, Optional
 from fastapi import WebSocket, WebSocketDisconnect
 from datetime import datetime
 
+from config import config
+from timing_wheel import TimingWheel
+from websocket_backplane import WebSocketBackplane
+from websocket_protocol import JSON_CODEC, REVERSE_KEY_MAP, get_codec
+
 logger = logging.getLogger(__name__)
 
+# Коды закрытия WebSocket
+WS_CLOSE_TRY_AGAIN_LATER = 1013     # Превышен лимит подключений
+WS_CLOSE_HEARTBEAT_TIMEOUT = 4008   # Клиент не ответил на ping
+
+def parse_role_limits(value: str) -> Dict[str, int]:
+    """Разбор лимитов по ролям из строки вида operator:80,admin:10"""
+    limits = {}
+    for item in (value or "").split(","):
+        if ":" not in item:
+            continue
+        role, limit = item.split(":", 1)
+        try:
+            limits[role.strip()] = int(limit)
+        except ValueError:
+            logger.warning(f"Invalid WebSocket role limit: {item}")
+    return limits
+
 class WebSocketManager:
     """Менеджер WebSocket подключений для real-time уведомлений"""
     
-    def __init__(self):
+    def __init__(self,
+                 max_connections: int = None,
+                 role_limits: Dict[str, int] = None,
+                 heartbeat_interval: float = None,
+                 heartbeat_timeout: float = None):
         # Активные подключения по типам
         self.active_connections: Dict[str, Set[WebSocket]] = {
             "admin": set(),
@@ -22,9 +48,137 @@ class WebSocketManager:
         # Подключения по user_id
         self.user_connections: Dict[str, WebSocket] = {}
         
-    async def connect(self, websocket: WebSocket, user_id: str, user_role: str):
-        """Подключение WebSocket клиента"""
-        await websocket.accept()
+        # Кодек (json/msgpack), согласованный при подключении
+        self.connection_codecs: Dict[WebSocket, Any] = {}
+        
+        # Метаданные подключений: user_id, role, last_seen, heartbeat таймер
+        self.connection_meta: Dict[WebSocket, Dict[str, Any]] = {}
+        
+        # Лимиты допуска
+        self.max_connections = max_connections if max_connections is not None else config.WEBSOCKET_MAX_CONNECTIONS
+        self.role_limits = role_limits if role_limits is not None else parse_role_limits(config.WEBSOCKET_MAX_CONNECTIONS_PER_ROLE)
+        
+        # Слоты, занятые рукопожатиями до регистрации подключения (role -> count)
+        self.admission_reservations: Dict[str, int] = {}
+        
+        # Heartbeat на колесе таймеров (одна задача на все подключения)
+        self.heartbeat_interval = heartbeat_interval or config.WEBSOCKET_HEARTBEAT_INTERVAL
+        self.heartbeat_timeout = heartbeat_timeout or config.WEBSOCKET_HEARTBEAT_TIMEOUT
+        self.heartbeat_wheel = TimingWheel(
+            tick_seconds=min(1.0, self.heartbeat_timeout / 2),
+            name="websocket_heartbeat"
+        )
+        
+        # Метрики жизненного цикла
+        self.lifecycle_stats: Dict[str, Any] = {
+            "connected_total": 0,
+            "disconnected_total": 0,
+            "rejected_total": 0,
+            "rejected_by_role": {},
+            "reaped_total": 0,
+            "pings_sent": 0,
+            "send_failures": 0
+        }
+        
+        # Межпроцессная шина для multi-worker развертывания
+        self.backplane: Optional[WebSocketBackplane] = None
+    
+    async def start_backplane(self, backplane: WebSocketBackplane):
+        """Подключение backplane для доставки событий между воркерами"""
+        self.backplane = backplane
+        await backplane.start(self._handle_backplane_message)
+    
+    async def stop_backplane(self):
+        """Отключение backplane"""
+        if self.backplane:
+            await self.backplane.stop()
+            self.backplane = None
+    
+    async def shutdown(self):
+        """Остановка фоновых задач менеджера"""
+        await self.heartbeat_wheel.stop()
+        await self.stop_backplane()
+    
+    async def _publish(self, topic: str, message: Dict[str, Any]):
+        """Публикация локально возникшего события для других воркеров"""
+        if self.backplane:
+            try:
+                await self.backplane.publish(topic, message)
+            except Exception as e:
+                logger.error(f"Error publishing to backplane topic {topic}: {e}")
+    
+    async def _handle_backplane_message(self, topic: str, message: Dict[str, Any]):
+        """Доставка события от другого воркера только своим подключениям"""
+        if topic == "all":
+            await self._deliver_to_all(message)
+        elif topic.startswith("role:"):
+            await self._deliver_to_role(topic[len("role:"):], message)
+        elif topic.startswith("user:"):
+            await self._deliver_to_user(topic[len("user:"):], message)
+        
+    def _check_admission(self, user_role: str) -> Optional[str]:
+        """Проверка лимитов подключений (с учетом зарезервированных слотов), возвращает причину отказа"""
+        reserved_total = sum(self.admission_reservations.values())
+        if self.max_connections and len(self.connection_meta) + reserved_total >= self.max_connections:
+            return "Connection limit reached"
+        
+        role_limit = self.role_limits.get(user_role)
+        role_count = len(self.active_connections.get(user_role, ())) + self.admission_reservations.get(user_role, 0)
+        if role_limit is not None and role_count >= role_limit:
+            return f"Connection limit for role {user_role} reached"
+        
+        return None
+    
+    def _reserve_slot(self, user_role: str):
+        self.admission_reservations[user_role] = self.admission_reservations.get(user_role, 0) + 1
+    
+    def _release_slot(self, user_role: str):
+        remaining = self.admission_reservations.get(user_role, 0) - 1
+        if remaining > 0:
+            self.admission_reservations[user_role] = remaining
+        else:
+            self.admission_reservations.pop(user_role, None)
+    
+    async def connect(self, websocket: WebSocket, user_id: str, user_role: str, encoding: str = None) -> bool:
+        """Подключение WebSocket клиента, False если превышен лимит"""
+        reject_reason = self._check_admission(user_role)
+        
+        # Слот занимается до первого await, чтобы параллельные рукопожатия
+        # не прошли проверку лимита одновременно
+        if reject_reason is None:
+            self._reserve_slot(user_role)
+        try:
+            await websocket.accept()
+        except Exception:
+            if reject_reason is None:
+                self._release_slot(user_role)
+            raise
+        
+        if reject_reason:
+            self.lifecycle_stats["rejected_total"] += 1
+            by_role = self.lifecycle_stats["rejected_by_role"]
+            by_role[user_role] = by_role.get(user_role, 0) + 1
+            logger.warning(f"WebSocket rejected: user_id={user_id}, role={user_role}: {reject_reason}")
+            await websocket.close(code=WS_CLOSE_TRY_AGAIN_LATER, reason=reject_reason)
+            return False
+        
+        # Резерв переходит в зарегистрированное подключение без await между ними
+        self._release_slot(user_role)
+        codec = get_codec(encoding)
+        self.connection_codecs[websocket] = codec
+        
+        now = time.monotonic()
+        self.connection_meta[websocket] = {
+            "user_id": user_id,
+            "role": user_role,
+            "connected_at": now,
+            "last_seen": now,
+            "timer": None
+        }
+        self.lifecycle_stats["connected_total"] += 1
+        
+        self.heartbeat_wheel.start()
+        self._schedule_heartbeat(websocket, self.heartbeat_interval)
         
         # Добавляем в соответствующую группу по роли
         if user_role in self.active_connections:
@@ -33,64 +187,176 @@ class WebSocketManager:
         # Сохраняем связь user_id -> websocket
         self.user_connections[user_id] = websocket
         
-        logger.info(f"WebSocket connected: user_id={user_id}, role={user_role}")
+        logger.info(f"WebSocket connected: user_id={user_id}, role={user_role}, encoding={codec.name}")
         
         # Отправляем приветственное сообщение
-        await self.send_personal_message({
+        welcome = {
             "type": "connection_established",
             "message": "WebSocket подключение установлено",
             "timestamp": datetime.utcnow().isoformat(),
-            "user_id": user_id
-        }, websocket)
+            "user_id": user_id,
+            "encoding": codec.name
+        }
+        if codec.binary:
+            # Таблица short -> full для декодирования на клиенте
+            welcome["key_map"] = REVERSE_KEY_MAP
+        await self.send_personal_message(welcome, websocket)
+        return True
     
     def disconnect(self, websocket: WebSocket, user_id: str, user_role: str):
-        """Отключение WebSocket клиента"""
+        """Отключение WebSocket клиента (повторный вызов безопасен)"""
         # Удаляем из группы по роли
         if user_role in self.active_connections:
             self.active_connections[user_role].discard(websocket)
         
         # Удаляем из личных подключений
-        if user_id in self.user_connections:
+        if self.user_connections.get(user_id) is websocket:
             del self.user_connections[user_id]
         
-        logger.info(f"WebSocket disconnected: user_id={user_id}, role={user_role}")
+        self.connection_codecs.pop(websocket, None)
+        
+        meta = self.connection_meta.pop(websocket, None)
+        if meta:
+            self.heartbeat_wheel.cancel(meta["timer"])
+            self.lifecycle_stats["disconnected_total"] += 1
+            logger.info(f"WebSocket disconnected: user_id={user_id}, role={user_role}")
+    
+    def _drop_connection(self, websocket: WebSocket):
+        """Удаление неработающего подключения из всех структур"""
+        self.lifecycle_stats["send_failures"] += 1
+        meta = self.connection_meta.get(websocket)
+        if meta:
+            self.disconnect(websocket, meta["user_id"], meta["role"])
+        else:
+            for connections in self.active_connections.values():
+                connections.discard(websocket)
+    
+    # === HEARTBEAT ===
+    
+    def touch(self, websocket: WebSocket):
+        """Отметка активности клиента (любое входящее сообщение, в т.ч. pong)"""
+        meta = self.connection_meta.get(websocket)
+        if meta:
+            meta["last_seen"] = time.monotonic()
+    
+    def _schedule_heartbeat(self, websocket: WebSocket, delay: float):
+        meta = self.connection_meta.get(websocket)
+        if meta:
+            meta["timer"] = self.heartbeat_wheel.schedule(delay, self._heartbeat_check, websocket)
+    
+    async def _heartbeat_check(self, websocket: WebSocket):
+        """Проверка подключения: ping после тишины, разрыв без ответа"""
+        meta = self.connection_meta.get(websocket)
+        if not meta:
+            return
+        
+        idle = time.monotonic() - meta["last_seen"]
+        
+        if idle >= self.heartbeat_interval + self.heartbeat_timeout:
+            await self._reap(websocket, meta)
+        elif idle >= self.heartbeat_interval:
+            self._schedule_heartbeat(websocket, self.heartbeat_timeout)
+            self.lifecycle_stats["pings_sent"] += 1
+            try:
+                await asyncio.wait_for(
+                    self._send_encoded(websocket, {
+                        "type": "ping",
+                        "timestamp": datetime.utcnow().isoformat()
+                    }, {}),
+                    timeout=self.heartbeat_timeout
+                )
+            except Exception as e:
+                logger.debug(f"Heartbeat ping failed for user_id={meta['user_id']}: {e}")
+        else:
+            self._schedule_heartbeat(websocket, self.heartbeat_interval - idle)
+    
+    async def _reap(self, websocket: WebSocket, meta: Dict[str, Any]):
+        """Разрыв полуоткрытого подключения"""
+        self.lifecycle_stats["reaped_total"] += 1
+        logger.info(f"WebSocket heartbeat timeout: user_id={meta['user_id']}, role={meta['role']}")
+        
+        self.disconnect(websocket, meta["user_id"], meta["role"])
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=WS_CLOSE_HEARTBEAT_TIMEOUT, reason="Heartbeat timeout"),
+                timeout=self.heartbeat_timeout
+            )
+        except Exception:
+            pass
+    
+    def decode_client_message(self, websocket: WebSocket, data) -> Dict[str, Any]:
+        """Декодирование сообщения клиента согласно его кодеку"""
+        codec = self.connection_codecs.get(websocket, JSON_CODEC)
+        return codec.decode(data)
+    
+    async def _send_frame(self, websocket: WebSocket, codec, frame):
+        """Отправка уже закодированного фрейма"""
+        if codec.binary:
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+    
+    async def _send_encoded(self, websocket: WebSocket, message: Dict[str, Any], frames: Dict[str, Any]):
+        """Отправка с кодированием один раз на кодек в рамках рассылки"""
+        codec = self.connection_codecs.get(websocket, JSON_CODEC)
+        frame = frames.get(codec.name)
+        if frame is None:
+            frame = codec.encode(message)
+            frames[codec.name] = frame
+        await self._send_frame(websocket, codec, frame)
     
     async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket):
         """Отправка личного сообщения"""
         try:
-            await websocket.send_text(json.dumps(message, default=str))
+            await self._send_encoded(websocket, message, {})
         except Exception as e:
             logger.error(f"Error sending personal message: {e}")
     
     async def send_to_user(self, user_id: str, message: Dict[str, Any]):
         """Отправка сообщения конкретному пользователю"""
-        if user_id in self.user_connections:
-            await self.send_personal_message(message, self.user_connections[user_id])
+        await self._deliver_to_user(user_id, message)
+        await self._publish(f"user:{user_id}", message)
     
     async def broadcast_to_role(self, role: str, message: Dict[str, Any]):
         """Отправка сообщения всем пользователям определенной роли"""
+        await self._deliver_to_role(role, message)
+        await self._publish(f"role:{role}", message)
+    
+    async def broadcast_to_all(self, message: Dict[str, Any]):
+        """Отправка сообщения всем подключенным клиентам"""
+        await self._deliver_to_all(message)
+        await self._publish("all", message)
+    
+    async def _deliver_to_user(self, user_id: str, message: Dict[str, Any]):
+        """Доставка сообщения пользователю, подключенному к этому воркеру"""
+        if user_id in self.user_connections:
+            await self.send_personal_message(message, self.user_connections[user_id])
+    
+    async def _deliver_to_role(self, role: str, message: Dict[str, Any]):
+        """Доставка сообщения локальным подключениям роли"""
         if role in self.active_connections:
             connections = self.active_connections[role].copy()
+            frames: Dict[str, Any] = {}
             for connection in connections:
                 try:
-                    await connection.send_text(json.dumps(message, default=str))
+                    await self._send_encoded(connection, message, frames)
                 except Exception as e:
                     logger.error(f"Error broadcasting to role {role}: {e}")
                     # Удаляем неработающее подключение
-                    self.active_connections[role].discard(connection)
+                    self._drop_connection(connection)
     
-    async def broadcast_to_all(self, message: Dict[str, Any]):
-        """Отправка сообщения всем подключенным клиентам"""
+    async def _deliver_to_all(self, message: Dict[str, Any]):
+        """Доставка сообщения всем локальным подключениям"""
+        frames: Dict[str, Any] = {}
         for role_connections in self.active_connections.values():
             connections = role_connections.copy()
             for connection in connections:
                 try:
-                    await connection.send_text(json.dumps(message, default=str))
+                    await self._send_encoded(connection, message, frames)
                 except Exception as e:
                     logger.error(f"Error broadcasting to all: {e}")
                     # Удаляем неработающее подключение
-                    for role in self.active_connections:
-                        self.active_connections[role].discard(connection)
+                    self._drop_connection(connection)
     
     async def notify_call_event(self, event_type: str, call_data: Dict[str, Any], operator_id: str = None):
         """Уведомление о событии звонка"""
@@ -169,7 +435,22 @@ class WebSocketManager:
                 role: len(connections) 
                 for role, connections in self.active_connections.items()
             },
-            "user_connections": len(self.user_connections)
+            "user_connections": len(self.user_connections),
+            "limits": {
+                "max_connections": self.max_connections,
+                "per_role": self.role_limits
+            },
+            "lifecycle": {
+                **self.lifecycle_stats,
+                "tracked_connections": len(self.connection_meta),
+                "reserved_slots": sum(self.admission_reservations.values())
+            },
+            "heartbeat": {
+                "interval": self.heartbeat_interval,
+                "timeout": self.heartbeat_timeout,
+                **self.heartbeat_wheel.get_stats()
+            },
+            "backplane": self.backplane.get_stats() if self.backplane else None
         }
 
 # Глобальный экземпляр менеджера
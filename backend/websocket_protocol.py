@@ -0,0 +1,157 @@
+"""
+Smart Call Center - WebSocket Protocol Encodings
+================================================
+
+Кодеки WebSocket сообщений, выбираемые при подключении (?encoding=...):
+- json - текстовые JSON фреймы (по умолчанию, совместимо со старыми клиентами)
+- msgpack - бинарные фреймы MessagePack с короткими ключами и
+  временными метками в виде целых миллисекунд epoch
+
+Сжатие permessage-deflate для JSON клиентов согласуется на уровне
+транспорта (uvicorn --ws-per-message-deflate) и не требует кодека.
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Union
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Короткие ключи для компактного протокола (клиент получает обратную
+# таблицу REVERSE_KEY_MAP в сообщении connection_established)
+KEY_MAP: Dict[str, str] = {
+    "type": "t",
+    "event": "e",
+    "data": "d",
+    "timestamp": "ts",
+    "message": "m",
+    "user_id": "u",
+    "operator_id": "o",
+    "call_id": "c",
+    "caller_number": "cn",
+    "called_number": "dn",
+    "queue_name": "q",
+    "channel_id": "ch",
+    "status": "s",
+    "start_time": "st",
+    "answer_time": "at",
+    "end_time": "et",
+    "join_time": "jt",
+    "talk_time": "tt",
+    "wait_time": "wt",
+    "position": "p",
+    "for_operator": "fo",
+    "call_type": "ct",
+    "routing_decision": "rd",
+    "old_status": "os",
+    "new_status": "ns",
+}
+
+REVERSE_KEY_MAP: Dict[str, str] = {short: full for full, short in KEY_MAP.items()}
+
+# Ключи, значения которых передаются как epoch миллисекунды
+TIMESTAMP_KEYS = {
+    "timestamp", "start_time", "answer_time", "end_time",
+    "join_time", "last_activity", "created_at", "updated_at"
+}
+
+# Ключи, значения которых передаются без сжатия (таблица ключей)
+RAW_KEYS = {"key_map"}
+
+_EPOCH = datetime(1970, 1, 1)
+
+def to_epoch_ms(value: Union[datetime, str]) -> Optional[int]:
+    """Преобразование datetime или ISO строки в epoch миллисекунды (naive = UTC)"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((value - _EPOCH).total_seconds() * 1000)
+
+def compact_message(value: Any, key: Optional[str] = None) -> Any:
+    """Сжатие ключей и временных меток сообщения"""
+    if isinstance(value, dict):
+        return {
+            KEY_MAP.get(k, k): v if k in RAW_KEYS else compact_message(v, k)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [compact_message(item) for item in value]
+    if key in TIMESTAMP_KEYS and isinstance(value, (datetime, str)):
+        epoch_ms = to_epoch_ms(value)
+        return epoch_ms if epoch_ms is not None else value
+    return value
+
+def expand_message(value: Any) -> Any:
+    """Восстановление полных ключей сообщения клиента"""
+    if isinstance(value, dict):
+        return {
+            REVERSE_KEY_MAP.get(k, k): expand_message(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [expand_message(item) for item in value]
+    return value
+
+def _msgpack_default(obj: Any) -> Any:
+    """Сериализация типов, неизвестных MessagePack"""
+    if isinstance(obj, datetime):
+        return to_epoch_ms(obj)
+    return str(obj)
+
+class JsonCodec:
+    """Текстовый JSON протокол (по умолчанию)"""
+    name = "json"
+    binary = False
+
+    def encode(self, message: Dict[str, Any]) -> str:
+        return json.dumps(message, default=str)
+
+    def decode(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        return json.loads(data)
+
+class MsgPackCodec:
+    """Бинарный MessagePack протокол с короткими ключами"""
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        return msgpack.packb(compact_message(message), default=_msgpack_default)
+
+    def decode(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        if isinstance(data, str):
+            return json.loads(data)
+        return expand_message(msgpack.unpackb(data, raw=False))
+
+JSON_CODEC = JsonCodec()
+
+_codecs: Dict[str, Any] = {"json": JSON_CODEC}
+if MSGPACK_AVAILABLE:
+    _codecs["msgpack"] = MsgPackCodec()
+
+def get_codec(encoding: Optional[str]):
+    """Получение кодека по имени (с fallback на JSON)"""
+    if not encoding:
+        return JSON_CODEC
+
+    codec = _codecs.get(encoding.lower())
+    if codec is None:
+        logger.warning(f"Unsupported WebSocket encoding '{encoding}', falling back to json")
+        return JSON_CODEC
+    return codec
+
+def get_supported_encodings() -> list:
+    """Список доступных кодеков"""
+    return list(_codecs.keys())
@@ -0,0 +1,123 @@
+"""
+Smart Call Center - Worker Lease
+================================
+
+Аренда роли единственного исполнителя фоновой задачи (синхронизация
+CDR, выгрузка в колоночное хранилище) среди воркеров uvicorn и
+экземпляров приложения - через коллекцию worker_leases.
+
+Захват и продление - один findOneAndUpdate по времени сервера MongoDB:
+документ аренды либо просрочен, либо уже принадлежит этому воркеру,
+иначе upsert упирается в занятый _id (DuplicateKeyError). Владелец
+продлевает аренду каждые WORKER_LEASE_TTL / 3 секунд; если процесс упал,
+аренда истекает и ее забирает другой воркер.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config import config
+from websocket_backplane import generate_worker_id
+
+logger = logging.getLogger(__name__)
+
+class WorkerLease:
+    """Аренда фоновой задачи с истечением и продлением"""
+
+    def __init__(self, name: str, ttl: float = None, owner: str = None):
+        self.name = name
+        self.ttl = ttl or config.WORKER_LEASE_TTL
+        self.owner = owner or generate_worker_id()
+        self.held = False
+        self.expires_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.acquired_count = 0
+        self.lost_count = 0
+        self.errors = 0
+
+    async def acquire(self, db) -> bool:
+        """Захват или продление аренды; False - ее держит другой воркер"""
+        try:
+            lease = await db.worker_leases.find_one_and_update(
+                {"_id": self.name, "$or": [
+                    {"owner": self.owner},
+                    {"$expr": {"$lt": ["$expires_at", "$$NOW"]}}
+                ]},
+                [{"$set": {
+                    "owner": self.owner,
+                    "renewed_at": "$$NOW",
+                    "expires_at": {"$add": ["$$NOW", int(self.ttl * 1000)]}
+                }}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            lease = None
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error renewing lease {self.name}: {e}")
+            lease = None
+
+        held = lease is not None
+        if held and not self.held:
+            self.acquired_count += 1
+            logger.info(f"🔑 Lease {self.name} acquired by {self.owner}")
+        elif self.held and not held:
+            self.lost_count += 1
+            logger.warning(f"Lease {self.name} lost by {self.owner}")
+
+        self.held = held
+        self.expires_at = lease["expires_at"] if held else None
+        return held
+
+    async def release(self, db):
+        """Досрочное освобождение аренды (при остановке)"""
+        if not self.held:
+            return
+        self.held = False
+        self.expires_at = None
+        try:
+            await db.worker_leases.delete_one({"_id": self.name, "owner": self.owner})
+        except Exception as e:
+            logger.error(f"Error releasing lease {self.name}: {e}")
+
+    # === ПРОДЛЕНИЕ В ФОНЕ ===
+
+    def start(self, db):
+        """Продление аренды независимо от длительности работы владельца"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self, db):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.release(db)
+
+    async def _run(self, db):
+        while True:
+            await self.acquire(db)
+            await asyncio.sleep(self.ttl / 3)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "owner": self.owner,
+            "held": self.held,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+            "ttl": self.ttl,
+            "acquired_count": self.acquired_count,
+            "lost_count": self.lost_count,
+            "errors": self.errors
+        }
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Тест задержки event loop во время "шторма логинов" (пересменка)
+
+Запускает параллельные проверки bcrypt паролей и одновременно измеряет,
+насколько опаздывает периодическая задача в event loop:
+- синхронный verify_password прямо в корутинах (как было раньше)
+- verify_login_password: пул потоков + лимит одновременных логинов
+Также проверяется пакетное хеширование в пуле процессов.
+
+Запуск не требует сервера и MongoDB, только backend/requirements.txt.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from auth import hash_passwords_bulk, verify_login_password, verify_password, get_password_hash
+
+STORM_SIZE = int(os.environ.get("LOGIN_STORM_SIZE", "32"))
+PROBE_INTERVAL = 0.01
+MAX_ALLOWED_LAG_MS = float(os.environ.get("LOGIN_STORM_MAX_LAG_MS", "100"))
+
+async def measure_loop_lag(storm) -> dict:
+    """Запуск шторма с параллельным замером опоздания event loop"""
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL)
+            lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+    probe_task = asyncio.create_task(probe())
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+
+    started = time.perf_counter()
+    results = await storm()
+    elapsed = time.perf_counter() - started
+
+    done.set()
+    await probe_task
+
+    return {
+        "results": results,
+        "elapsed": elapsed,
+        "max_lag_ms": max(lags) * 1000 if lags else 0,
+        "probes": len(lags)
+    }
+
+async def test_blocking_login_storm(password_hash: str) -> dict:
+    """Базовый вариант: bcrypt прямо в event loop"""
+    print(f"\n=== Blocking verify_password, {STORM_SIZE} логинов ===")
+
+    async def login():
+        return verify_password("admin", password_hash)
+
+    async def storm():
+        return await asyncio.gather(*(login() for _ in range(STORM_SIZE)))
+
+    result = await measure_loop_lag(storm)
+    print(f"Время: {result['elapsed']:.2f}s, max lag: {result['max_lag_ms']:.1f} ms")
+    return result
+
+async def test_offloaded_login_storm(password_hash: str) -> bool:
+    """verify_login_password не должен блокировать event loop"""
+    print(f"\n=== Offloaded verify_login_password, {STORM_SIZE} логинов ===")
+
+    async def storm():
+        return await asyncio.gather(*(
+            verify_login_password("admin", password_hash) for _ in range(STORM_SIZE)
+        ))
+
+    result = await measure_loop_lag(storm)
+    print(f"Время: {result['elapsed']:.2f}s, max lag: {result['max_lag_ms']:.1f} ms, probes: {result['probes']}")
+
+    if not all(result["results"]):
+        print("❌ Не все пароли прошли проверку")
+        return False
+    if result["max_lag_ms"] > MAX_ALLOWED_LAG_MS:
+        print(f"❌ Задержка event loop выше {MAX_ALLOWED_LAG_MS} ms")
+        return False
+
+    print("✅ Event loop остается отзывчивым")
+    return True
+
+async def test_bulk_hashing() -> bool:
+    """Пакетное хеширование в пуле процессов"""
+    print("\n=== hash_passwords_bulk ===")
+    passwords = [f"password{i}" for i in range(8)]
+
+    started = time.perf_counter()
+    hashes = await hash_passwords_bulk(passwords)
+    print(f"Хешировано {len(hashes)} паролей за {time.perf_counter() - started:.2f}s")
+
+    if len(hashes) != len(passwords):
+        print("❌ Неверное количество хешей")
+        return False
+    if not all(verify_password(password, hashed) for password, hashed in zip(passwords, hashes)):
+        print("❌ Хеши не проходят проверку")
+        return False
+
+    print("✅ Хеши корректны")
+    return True
+
+async def run_login_storm_tests() -> bool:
+    password_hash = get_password_hash("admin")
+
+    blocking = await test_blocking_login_storm(password_hash)
+    offloaded_success = await test_offloaded_login_storm(password_hash)
+    bulk_success = await test_bulk_hashing()
+
+    print("\n=== Test Summary ===")
+    print(f"Blocking baseline max lag: {blocking['max_lag_ms']:.1f} ms")
+    print(f"Offloaded Login Storm: {'✅ PASSED' if offloaded_success else '❌ FAILED'}")
+    print(f"Bulk Hashing: {'✅ PASSED' if bulk_success else '❌ FAILED'}")
+
+    all_passed = offloaded_success and bulk_success
+    if all_passed:
+        print("\n🎉 All login storm tests passed successfully!")
+    else:
+        print("\n⚠️ Some login storm tests failed. See details above.")
+    return all_passed
+
+if __name__ == "__main__":
+    success = asyncio.run(run_login_storm_tests())
+    sys.exit(0 if success else 1)
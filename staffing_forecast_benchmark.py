@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк векторизованного прогноза штата Smart Call Center
+
+Строит синтетический план (очереди x дни x интервалы) и измеряет время
+расчета compute_staffing:
+- только Erlang C по нескольким целям SLA
+- Erlang C + Erlang A (ограничение доли брошенных звонков)
+Для выборки ячеек результат сверяется со скалярным Erlang C.
+
+Сервер и MongoDB не требуются, только numpy.
+
+Пример:
+    python staffing_forecast_benchmark.py --queues 20 --days 28 --interval 30
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from queue_estimator import erlang_c
+from staffing_forecast import NUMPY_AVAILABLE, compute_staffing, parse_sla_targets
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Staffing forecast benchmark")
+    parser.add_argument("--queues", type=int, default=20)
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--interval", type=int, default=30, help="Длина интервала в минутах")
+    parser.add_argument("--sla", default="80/20,90/30")
+    parser.add_argument("--patience", type=float, default=90.0, help="Среднее терпение звонящего, сек")
+    parser.add_argument("--max-abandon", type=float, default=0.05)
+    parser.add_argument("--checks", type=int, default=200, help="Ячеек для сверки со скалярным расчетом")
+    return parser.parse_args()
+
+def scalar_staffing(calls: float, handle_time: float, interval_minutes: int, level: float, seconds: int) -> int:
+    """Эталонный расчет одной ячейки перебором числа операторов"""
+    traffic = calls / (interval_minutes * 60) * handle_time
+    if traffic <= 0:
+        return 0
+    agents = max(int(math.floor(traffic)) + 1, 1)
+    while True:
+        prob_wait = erlang_c(traffic, agents)
+        service_level = 1 - prob_wait * math.exp(-(agents - traffic) * seconds / handle_time)
+        if service_level >= level:
+            return agents
+        agents += 1
+
+def main() -> bool:
+    args = parse_args()
+    if not NUMPY_AVAILABLE:
+        print("❌ numpy не установлен")
+        return False
+
+    import numpy as np
+
+    rng = np.random.default_rng(42)
+    intervals = 24 * 60 // args.interval
+    shape = (args.queues, args.days, intervals)
+
+    # Суточный профиль с пиком днем и случайным масштабом очереди
+    hours = np.arange(intervals) * args.interval / 60
+    daily = np.clip(np.sin((hours - 6) / 14 * np.pi), 0.05, None)
+    scale = rng.uniform(20, 400, size=(args.queues, 1, 1))
+    volume = np.round(scale * daily * rng.uniform(0.8, 1.2, size=shape))
+    handle_time = rng.uniform(120, 420, size=shape)
+    sla_targets = parse_sla_targets(args.sla)
+
+    print(f"📐 План: {args.queues} очередей x {args.days} дней x {intervals} интервалов = {volume.size} ячеек")
+
+    started = time.perf_counter()
+    result_c = compute_staffing(volume, handle_time, args.interval, sla_targets)
+    erlang_c_ms = (time.perf_counter() - started) * 1000
+    print(f"⏱️ Erlang C ({len(sla_targets)} целей SLA): {erlang_c_ms:.1f} ms")
+
+    started = time.perf_counter()
+    result_a = compute_staffing(volume, handle_time, args.interval, sla_targets,
+                                patience_seconds=args.patience, max_abandon=args.max_abandon)
+    erlang_a_ms = (time.perf_counter() - started) * 1000
+    print(f"⏱️ Erlang C + Erlang A: {erlang_a_ms:.1f} ms")
+    print(f"👥 Пик операторов: {int(result_c['erlang_c'].max())}, "
+          f"Erlang A: {int(result_a['erlang_a'].max())}")
+
+    # Сверка выборки ячеек со скалярным Erlang C
+    mismatches = 0
+    for flat_index in rng.choice(volume.size, size=min(args.checks, volume.size), replace=False):
+        cell = np.unravel_index(flat_index, shape)
+        for target_index, (level, seconds) in enumerate(sla_targets):
+            expected = scalar_staffing(volume[cell], handle_time[cell], args.interval, level, seconds)
+            if int(result_c["erlang_c"][(target_index,) + cell]) != expected:
+                mismatches += 1
+
+    if mismatches:
+        print(f"❌ Расхождений со скалярным Erlang C: {mismatches}")
+        return False
+
+    print("✅ Векторизованный расчет совпадает со скалярным Erlang C")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
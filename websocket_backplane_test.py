@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Тест доставки WebSocket событий между воркерами через backplane
+
+Два WebSocketManager ("воркера") подключаются к общей InProcessHub,
+клиенты эмулируются объектами с интерфейсом WebSocket. Проверяется:
+- личное сообщение доходит до пользователя, подключенного к другому воркеру
+- рассылка по роли доставляется каждому клиенту ровно один раз
+- события своего воркера не возвращаются из шины повторно
+- по умолчанию create_backplane выбирает backplane в памяти
+
+Запуск не требует сервера и MongoDB, только backend/requirements.txt.
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from websocket_backplane import InProcessBackplane, InProcessHub, create_backplane
+from websocket_manager import WebSocketManager
+
+class FakeWebSocket:
+    """Клиент WebSocket, сохраняющий полученные сообщения"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        self.messages.append(json.loads(data))
+
+    async def send_bytes(self, data: bytes):
+        raise AssertionError("Binary frame for JSON client")
+
+    async def close(self, code: int = 1000, reason: str = None):
+        pass
+
+    def received(self, message_type: str) -> list:
+        return [message for message in self.messages if message.get("type") == message_type]
+
+async def settle():
+    """Ожидание доставки очередей backplane"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+async def start_workers():
+    hub = InProcessHub()
+    workers = [WebSocketManager(max_connections=0, role_limits={}) for _ in range(2)]
+    for index, worker in enumerate(workers):
+        await worker.start_backplane(InProcessBackplane(hub=hub, worker_id=f"worker-{index}"))
+    return workers
+
+async def test_cross_worker_delivery() -> bool:
+    """Личные сообщения и рассылки по роли между двумя воркерами"""
+    print("\n=== Cross-worker delivery ===")
+    worker_a, worker_b = await start_workers()
+    try:
+        operator = FakeWebSocket()
+        admin_a, admin_b = FakeWebSocket(), FakeWebSocket()
+        await worker_b.connect(operator, "operator-1", "operator")
+        await worker_a.connect(admin_a, "admin-1", "admin")
+        await worker_b.connect(admin_b, "admin-2", "admin")
+
+        await worker_a.send_to_user("operator-1", {"type": "personal", "value": 1})
+        await worker_a.broadcast_to_role("admin", {"type": "role_event", "value": 2})
+        await worker_b.broadcast_to_all({"type": "global_event", "value": 3})
+        await settle()
+
+        checks = {
+            "personal message reaches other worker": len(operator.received("personal")) == 1,
+            "role event delivered once per admin": len(admin_a.received("role_event")) == 1
+                                                   and len(admin_b.received("role_event")) == 1,
+            "role event not sent to operator": not operator.received("role_event"),
+            "global event delivered once per client": all(
+                len(client.received("global_event")) == 1 for client in (operator, admin_a, admin_b)
+            ),
+            "own events not received back": worker_a.backplane.received_count == 1
+                                            and worker_b.backplane.received_count == 2
+        }
+    finally:
+        for worker in (worker_a, worker_b):
+            await worker.shutdown()
+
+    for name, passed in checks.items():
+        print(f"{'✅' if passed else '❌'} {name}")
+    return all(checks.values())
+
+async def test_default_backplane() -> bool:
+    """Без явной настройки MongoDB не используется даже с db_manager"""
+    print("\n=== Default backplane ===")
+    backplane = create_backplane(db_manager=object())
+    passed = isinstance(backplane, InProcessBackplane)
+    print(f"{'✅' if passed else '❌'} default backplane: {backplane.__class__.__name__}")
+    return passed
+
+async def run_backplane_tests() -> bool:
+    delivery_success = await test_cross_worker_delivery()
+    default_success = await test_default_backplane()
+
+    print("\n=== Test Summary ===")
+    print(f"Cross-worker Delivery: {'✅ PASSED' if delivery_success else '❌ FAILED'}")
+    print(f"Default Backplane: {'✅ PASSED' if default_success else '❌ FAILED'}")
+
+    all_passed = delivery_success and default_success
+    if all_passed:
+        print("\n🎉 All backplane tests passed successfully!")
+    else:
+        print("\n⚠️ Some backplane tests failed. See details above.")
+    return all_passed
+
+if __name__ == "__main__":
+    success = asyncio.run(run_backplane_tests())
+    sys.exit(0 if success else 1)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк WebSocket fan-out Smart Call Center
+
+Поднимает backend (server:app) в текущем процессе, открывает тысячи
+авторизованных сессий /ws/connect из отдельных клиентских процессов
+(роли распределяются по кругу) и подает события звонков через
+WebSocketManager.notify_call_event с заданной частотой.
+
+Для каждой ступени нагрузки измеряются:
+- перцентили задержки доставки (p50/p95/p99/max)
+- доля доставленных сообщений
+- CPU процесса сервера и память на одно подключение
+и определяется точка насыщения.
+
+Требуется доступный MongoDB (MONGO_URL) и зависимости backend/requirements.txt.
+
+Пример:
+    python websocket_load_benchmark.py --stages 1000,2000,4000,8000 --rate 20 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import uuid
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+ROLES = ["admin", "manager", "supervisor", "operator"]
+# Роли, получающие notify_call_event широковещательно
+BROADCAST_ROLES = {"admin", "manager", "supervisor"}
+
+BENCH_PASSWORD = "bench-password"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="WebSocket fan-out load benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stages", default="500,1000,2000,4000,8000",
+                        help="Количество подключений на каждой ступени")
+    parser.add_argument("--rate", type=float, default=10.0, help="Событий звонков в секунду")
+    parser.add_argument("--duration", type=float, default=20.0, help="Длительность подачи событий на ступени, сек")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Клиентских процессов")
+    parser.add_argument("--latency-slo", type=float, default=1.0, help="Порог p99 задержки, сек")
+    parser.add_argument("--min-delivery", type=float, default=0.99, help="Минимальная доля доставки")
+    parser.add_argument("--encoding", default="json", help="Кодек подключения (json/msgpack)")
+    return parser.parse_args()
+
+def percentile(values, pct: float) -> float:
+    """Перцентиль по отсортированному списку"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+def read_rss_bytes() -> int:
+    """Текущий RSS процесса"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def raise_fd_limit():
+    """Увеличение лимита файловых дескрипторов для тысяч сокетов"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+# ===== КЛИЕНТСКИЙ ПРОЦЕСС =====
+
+async def _client_session(url: str, role: str, stats: dict, decode):
+    """Одна WebSocket сессия: отвечает на ping, измеряет задержку call_event"""
+    import websockets
+
+    try:
+        async with websockets.connect(url, max_size=None, ping_interval=None) as ws:
+            stats["connected"] += 1
+            async for raw in ws:
+                received_at = time.time()
+                message = decode(raw)
+                message_type = message.get("type")
+
+                if message_type == "ping":
+                    await ws.send(json.dumps({"type": "pong"}))
+                elif message_type == "call_event":
+                    sent_at = message.get("data", {}).get("bench_sent_at")
+                    if sent_at:
+                        stats["received"][role] += 1
+                        stats["latencies"].append(received_at - sent_at)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        stats["failed"] += 1
+
+async def _client_worker(base_url: str, assignments: list, encoding: str, control, results, worker_index: int):
+    sys.path.insert(0, BACKEND_DIR)
+    from websocket_protocol import get_codec
+    codec = get_codec(encoding)
+
+    raise_fd_limit()
+    stats = {
+        "connected": 0,
+        "failed": 0,
+        "received": {role: 0 for role in ROLES},
+        "latencies": []
+    }
+
+    # Открываем подключения пачками, чтобы не упереться в backlog сервера
+    tasks = []
+    for i, (role, token) in enumerate(assignments):
+        url = f"{base_url}?token={token}&encoding={encoding}"
+        tasks.append(asyncio.create_task(_client_session(url, role, stats, codec.decode)))
+        if i % 200 == 199:
+            await asyncio.sleep(0.05)
+
+    deadline = time.monotonic() + 60
+    while stats["connected"] + stats["failed"] < len(assignments) and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+    results.put(("ready", worker_index, stats["connected"], stats["failed"]))
+
+    # Ждем команду остановки от основного процесса
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, control.get)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    results.put(("done", worker_index, stats["received"], stats["latencies"], stats["failed"]))
+
+def client_worker_main(base_url, assignments, encoding, control, results, worker_index):
+    """Точка входа клиентского процесса"""
+    asyncio.run(_client_worker(base_url, assignments, encoding, control, results, worker_index))
+
+# ===== СЕРВЕРНАЯ СТОРОНА =====
+
+async def prepare_tokens() -> dict:
+    """Создание бенчмарк-пользователей по ролям и выпуск JWT"""
+    from auth import create_access_token, get_password_hash
+    from db import get_db
+    from models import User
+
+    db = get_db()
+    tokens = {}
+    for role in ROLES:
+        username = f"bench_{role}"
+        if not await db.get_user_by_username(username):
+            user = User(
+                username=username,
+                email=f"{username}@bench.example.com",
+                name=f"Benchmark {role}",
+                password_hash=get_password_hash(BENCH_PASSWORD),
+                role=role
+            )
+            await db.users.insert_one(user.dict())
+        tokens[role] = create_access_token(data={"sub": username})
+    return tokens
+
+async def run_stage(args, ctx, tokens: dict, connections: int) -> dict:
+    """Одна ступень нагрузки"""
+    from websocket_manager import get_websocket_manager
+    manager = get_websocket_manager()
+    loop = asyncio.get_running_loop()
+
+    base_url = f"ws://{args.host}:{args.port}/ws/connect"
+    assignments = [(ROLES[i % len(ROLES)], tokens[ROLES[i % len(ROLES)]]) for i in range(connections)]
+    workers = min(args.workers, connections)
+    chunks = [assignments[i::workers] for i in range(workers)]
+
+    rss_before = read_rss_bytes()
+
+    control = ctx.Queue()
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=client_worker_main, args=(base_url, chunk, args.encoding, control, results, i))
+        for i, chunk in enumerate(chunks)
+    ]
+    for process in processes:
+        process.start()
+
+    connected = failed = 0
+    for _ in processes:
+        _, _, worker_connected, worker_failed = await loop.run_in_executor(None, results.get)
+        connected += worker_connected
+        failed += worker_failed
+
+    rss_connected = read_rss_bytes()
+    broadcast_connections = sum(
+        len(manager.active_connections.get(role, ())) for role in BROADCAST_ROLES
+    )
+
+    # Подача событий с заданной частотой
+    interval = 1.0 / args.rate
+    events_sent = 0
+    cpu_before = time.process_time()
+    started = loop.time()
+    next_send = started
+    while loop.time() - started < args.duration:
+        await manager.notify_call_event("bench_call", {
+            "call_id": str(uuid.uuid4()),
+            "caller_number": f"+7700{events_sent:07d}",
+            "queue_name": "support",
+            "status": "ringing",
+            "seq": events_sent,
+            "bench_sent_at": time.time()
+        })
+        events_sent += 1
+        next_send += interval
+        await asyncio.sleep(max(0.0, next_send - loop.time()))
+    wall = loop.time() - started
+    cpu_used = time.process_time() - cpu_before
+
+    # Даем время на доставку хвоста
+    await asyncio.sleep(2.0)
+
+    for _ in processes:
+        control.put("stop")
+
+    received_by_role = {role: 0 for role in ROLES}
+    latencies = []
+    for _ in processes:
+        _, _, worker_received, worker_latencies, _ = await loop.run_in_executor(None, results.get)
+        for role, count in worker_received.items():
+            received_by_role[role] += count
+        latencies.extend(worker_latencies)
+
+    for process in processes:
+        process.join(timeout=10)
+
+    latencies.sort()
+    expected = events_sent * broadcast_connections
+    delivered = sum(received_by_role.values())
+
+    return {
+        "connections": connections,
+        "connected": connected,
+        "failed": failed,
+        "events_sent": events_sent,
+        "achieved_rate": events_sent / wall if wall else 0,
+        "delivery_ratio": delivered / expected if expected else 0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1] if latencies else 0,
+        "cpu_percent": cpu_used / wall * 100 if wall else 0,
+        "memory_per_connection": (rss_connected - rss_before) / connected if connected else 0,
+        "received_by_role": received_by_role
+    }
+
+def is_saturated(args, result: dict) -> bool:
+    """Ступень считается насыщенной при нарушении любого порога"""
+    return (
+        result["connected"] < result["connections"] * 0.99
+        or result["delivery_ratio"] < args.min_delivery
+        or result["p99"] > args.latency_slo
+        or result["achieved_rate"] < args.rate * 0.95
+        or result["cpu_percent"] > 95
+    )
+
+async def run_benchmark(args):
+    # Без лимитов допуска и с backplane в памяти - измеряем один процесс
+    os.environ["WEBSOCKET_MAX_CONNECTIONS"] = "0"
+    os.environ["WEBSOCKET_BACKPLANE"] = "memory"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+
+    import uvicorn
+    from server import app
+
+    raise_fd_limit()
+
+    server = uvicorn.Server(uvicorn.Config(
+        app, host=args.host, port=args.port, log_level="warning",
+        ws_ping_interval=None, backlog=4096
+    ))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.1)
+
+    tokens = await prepare_tokens()
+    ctx = multiprocessing.get_context("spawn")
+
+    print(f"🚀 WebSocket fan-out benchmark: rate={args.rate}/s, duration={args.duration}s, "
+          f"workers={args.workers}, encoding={args.encoding}")
+    print(f"{'Conns':>7}{'OK':>7}{'Deliv%':>8}{'p50ms':>8}{'p95ms':>8}{'p99ms':>8}"
+          f"{'maxms':>8}{'Rate':>7}{'CPU%':>7}{'KB/conn':>9}")
+
+    healthy = None
+    saturation = None
+    for connections in [int(x) for x in args.stages.split(",") if x.strip()]:
+        result = await run_stage(args, ctx, tokens, connections)
+        print(f"{result['connections']:>7}{result['connected']:>7}"
+              f"{result['delivery_ratio'] * 100:>8.1f}"
+              f"{result['p50'] * 1000:>8.1f}{result['p95'] * 1000:>8.1f}"
+              f"{result['p99'] * 1000:>8.1f}{result['max'] * 1000:>8.1f}"
+              f"{result['achieved_rate']:>7.1f}{result['cpu_percent']:>7.1f}"
+              f"{result['memory_per_connection'] / 1024:>9.1f}")
+
+        if is_saturated(args, result):
+            saturation = result
+            break
+        healthy = result
+
+    print()
+    if saturation:
+        print(f"📉 Точка насыщения: {saturation['connections']} подключений "
+              f"(последняя устойчивая ступень: {healthy['connections'] if healthy else 'нет'})")
+    else:
+        print(f"✅ Насыщение не достигнуто, максимум: {healthy['connections'] if healthy else 0} подключений")
+
+    server.should_exit = True
+    await serve_task
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark(parse_args()))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк протоколов WebSocket Smart Call Center
+Сравнивает размер фрейма и CPU на кодирование payload'ов notify_call_event
+для JSON, JSON + permessage-deflate, MessagePack и MessagePack + deflate
+"""
+
+import os
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from websocket_protocol import JSON_CODEC, MSGPACK_AVAILABLE, get_codec
+
+ITERATIONS = int(os.environ.get("BENCH_ITERATIONS", "20000"))
+
+def build_call_event(event_type: str, index: int) -> dict:
+    """Сообщение в формате WebSocketManager.notify_call_event"""
+    start_time = datetime.utcnow() - timedelta(seconds=120)
+    call_data = {
+        "call_id": str(uuid.uuid4()),
+        "caller_number": f"+7701{index:07d}",
+        "queue_name": "support",
+        "channel_id": f"1712345678.{index}",
+        "call_type": "queue",
+        "status": "answered",
+        "start_time": start_time,
+        "answer_time": start_time + timedelta(seconds=25),
+        "operator_id": str(uuid.uuid4()),
+    }
+    if event_type == "call_ended":
+        call_data["end_time"] = datetime.utcnow()
+        call_data["talk_time"] = 95
+
+    return {
+        "type": "call_event",
+        "event": event_type,
+        "data": call_data,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+def deflate(frame) -> bytes:
+    """Сжатие фрейма как в permessage-deflate (raw deflate, без context takeover)"""
+    if isinstance(frame, str):
+        frame = frame.encode("utf-8")
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)[:-4]
+
+def run_case(name: str, codec, messages: list, compress: bool) -> dict:
+    """Замер одного варианта кодирования"""
+    total_bytes = 0
+    started = time.process_time()
+    for i in range(ITERATIONS):
+        frame = codec.encode(messages[i % len(messages)])
+        if compress:
+            frame = deflate(frame)
+        total_bytes += len(frame) if isinstance(frame, bytes) else len(frame.encode("utf-8"))
+    elapsed = time.process_time() - started
+
+    return {
+        "name": name,
+        "avg_bytes": total_bytes / ITERATIONS,
+        "encode_us": elapsed / ITERATIONS * 1_000_000
+    }
+
+def main():
+    messages = [
+        build_call_event(event_type, i)
+        for i in range(100)
+        for event_type in ("new_call", "call_answered", "call_ended")
+    ]
+
+    cases = [
+        ("json", JSON_CODEC, False),
+        ("json + permessage-deflate", JSON_CODEC, True),
+    ]
+    if MSGPACK_AVAILABLE:
+        msgpack_codec = get_codec("msgpack")
+        cases.append(("msgpack", msgpack_codec, False))
+        cases.append(("msgpack + deflate", msgpack_codec, True))
+    else:
+        print("⚠️ msgpack не установлен - MessagePack варианты пропущены")
+
+    print(f"📊 notify_call_event payloads, {ITERATIONS} итераций")
+    print(f"{'Протокол':<28}{'Байт/фрейм':>12}{'мкс/фрейм':>12}{'% от JSON':>12}")
+
+    baseline = None
+    for name, codec, compress in cases:
+        result = run_case(name, codec, messages, compress)
+        baseline = baseline or result["avg_bytes"]
+        print(f"{result['name']:<28}{result['avg_bytes']:>12.1f}{result['encode_us']:>12.2f}"
+              f"{result['avg_bytes'] / baseline * 100:>11.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Тест round-trip компактного протокола MessagePack
+
+Клиент подключается с encoding=msgpack и получает таблицу ключей в
+приветственном сообщении connection_established. Последующие фреймы
+декодируются только по этой таблице (без импорта websocket_protocol),
+как это делает внешний клиент, и сравниваются с исходными сообщениями.
+
+Запуск не требует сервера и MongoDB, только backend/requirements.txt.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import msgpack
+
+from websocket_manager import WebSocketManager
+from websocket_protocol import TIMESTAMP_KEYS, to_epoch_ms
+
+class BinaryWebSocket:
+    """Клиент WebSocket, сохраняющий бинарные фреймы"""
+
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        raise AssertionError("Text frame for msgpack client")
+
+    async def send_bytes(self, data: bytes):
+        self.frames.append(data)
+
+    async def close(self, code: int = 1000, reason: str = None):
+        pass
+
+def expand_with(key_map: dict, value):
+    """Восстановление ключей по таблице из приветственного сообщения"""
+    if isinstance(value, dict):
+        return {key_map.get(k, k): expand_with(key_map, v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [expand_with(key_map, item) for item in value]
+    return value
+
+def expected_wire_values(value, key=None):
+    """Исходное сообщение с временными метками в epoch миллисекундах"""
+    if isinstance(value, dict):
+        return {k: expected_wire_values(v, k) for k, v in value.items()}
+    if key in TIMESTAMP_KEYS:
+        return to_epoch_ms(value)
+    return value
+
+async def test_welcome_key_map_round_trip() -> bool:
+    print("\n=== MessagePack welcome key_map round-trip ===")
+    manager = WebSocketManager(max_connections=0, role_limits={})
+    client = BinaryWebSocket()
+    try:
+        await manager.connect(client, "admin-1", "admin", encoding="msgpack")
+
+        message = {
+            "type": "call_event",
+            "event": "call_answered",
+            "data": {
+                "call_id": str(uuid.uuid4()),
+                "caller_number": "+77010000001",
+                "queue_name": "support",
+                "status": "answered",
+                "start_time": datetime(2026, 10, 19, 12, 0, 0),
+                "operator_id": str(uuid.uuid4())
+            },
+            "timestamp": datetime(2026, 10, 19, 12, 0, 25).isoformat()
+        }
+        await manager.broadcast_to_role("admin", message)
+    finally:
+        await manager.shutdown()
+
+    welcome = msgpack.unpackb(client.frames[0], raw=False)
+    key_map = welcome.get("key_map") or {}
+    welcome = expand_with(key_map, welcome)
+    decoded = expand_with(key_map, msgpack.unpackb(client.frames[1], raw=False))
+
+    checks = {
+        "welcome frame carries key_map": bool(key_map),
+        "key_map is short -> full": key_map.get("t") == "type" and key_map.get("d") == "data",
+        "welcome frame decodes": welcome.get("type") == "connection_established",
+        "event frame round-trips": decoded == expected_wire_values(message)
+    }
+    for name, passed in checks.items():
+        print(f"{'✅' if passed else '❌'} {name}")
+    return all(checks.values())
+
+async def run_protocol_tests() -> bool:
+    round_trip_success = await test_welcome_key_map_round_trip()
+
+    print("\n=== Test Summary ===")
+    print(f"Key Map Round-trip: {'✅ PASSED' if round_trip_success else '❌ FAILED'}")
+
+    if round_trip_success:
+        print("\n🎉 All protocol tests passed successfully!")
+    else:
+        print("\n⚠️ Some protocol tests failed. See details above.")
+    return round_trip_success
+
+if __name__ == "__main__":
+    success = asyncio.run(run_protocol_tests())
+    sys.exit(0 if success else 1)